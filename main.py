@@ -1,26 +1,110 @@
 import socket
+import selectors
 import threading
 import json
-from datetime import datetime
+import fnmatch
+import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.captura import ENTRADA, FECHAMENTO, SAIDA, Captura
+from src.logs import DEBUG, ERRO, INFO, RegistroLogs
+from src.metricas import Metricas
+from src.persistencia import Diario
+from src.prontidao import notificar_pronto
+from src.protocolo import ENQUADRAMENTO_LINHA, LeitorQuadros, enquadrar
+from src.reconexao import espera_reconexao
+from src.registro import LIMITE_LISTAR, RegistroDispositivos
+from src.sessoes import SessoesDispositivos
 
 # --- Configurações Globais ---
 HOST = '127.0.0.1'  # Endereço do servidor (localhost)
 PORT = 5000         # Porta do servidor
+MODO_SERVIDOR = 'threads'  # 'threads' (uma thread por conexão), 'selectors' ou 'pool'
+BACKLOG = 128       # Tamanho da fila de conexões pendentes do listen()
+TAMANHO_POOL = 16   # Threads do modo 'pool'
+TAMANHO_RECV = 1024 # Tamanho inicial do buffer de leitura de cada conexão (cresce para quadros maiores)
+ENQUADRAMENTO = ENQUADRAMENTO_LINHA  # 'linha' (JSON + "\n") ou 'prefixo' (tamanho em 4 bytes + JSON)
+ARQUIVO_ESTADOS = None  # Diário do estado das lâmpadas (None = só em memória)
+ARQUIVO_CAPTURA = None  # Captura de todo o tráfego para src/reproducao.py (None = sem captura)
+LAMPADAS_SIMULTANEAS = 100  # Registros em andamento ao mesmo tempo na subida das lâmpadas simuladas
+TIMEOUT_SUBIDA = 30         # Segundos esperando o servidor e as lâmpadas ficarem prontos
+LOG_CONSOLE = True          # Escreve os logs no console (False = só o buffer em memória)
 
 # --- Dados do Sistema ---
 DISPOSITIVOS = {}    # Dicionário global para armazenar dispositivos conectados
-LOGS = []            # Lista para armazenar logs do sistema
+REGISTRO = RegistroDispositivos()  # Tipo, tags e grupos dos dispositivos (protegido por `lock`)
+SESSOES = SessoesDispositivos()  # Sessões retomáveis entregues no REGISTRO (protegido por `lock`)
+SUSPENSAS = {}       # {nome: Lampada} fora do ar com a sessão suspensa, guardando o estado (protegido por `lock`)
+LOGS = None          # RegistroLogs criado no primeiro log(): importar o módulo não sobe a thread do sink
+lock_logs = threading.Lock()
 lock = threading.Lock()  # Lock para acesso thread-safe aos dados globais
+METRICAS = Metricas()    # Contadores de comandos, bytes e erros
+lock_metricas = threading.Lock()
+CONEXOES_ATIVAS = 0
+DIARIO = None            # Diario aberto por iniciar_servidor se ARQUIVO_ESTADOS estiver definido
+CAPTURA = None           # Captura aberta por iniciar_servidor se ARQUIVO_CAPTURA estiver definido
+PRONTO = threading.Event()  # sinalizado quando o servidor já aceita conexões
 
 # --- Funções Utilitárias ---
-def log(mensagem):
+def log(mensagem, nivel=INFO, categoria=None):
     """
-    Adiciona uma mensagem ao log com timestamp e imprime no console.
+    Registra uma mensagem no log; o console/arquivo é escrito em lote
+    por uma thread separada.
     """
-    hora = datetime.now().strftime("%H:%M:%S")
-    LOGS.append(f"[{hora}] {mensagem}")
-    print(f"[{hora}] {mensagem}")
+    registro_logs().log(mensagem, nivel, categoria)
+
+def registro_logs():
+    """
+    Buffer circular de logs com escrita em lote, criado na primeira vez
+    que é pedido (com LOG_CONSOLE da configuração daquele momento).
+    """
+    global LOGS
+    if LOGS is None:
+        with lock_logs:
+            if LOGS is None:
+                LOGS = RegistroLogs(console=LOG_CONSOLE)
+    return LOGS
+
+def contar(nome, rotulo=None, valor=1):
+    """
+    Incrementa um contador de métricas (várias threads atualizam ao mesmo tempo).
+    """
+    with lock_metricas:
+        METRICAS.incrementar(nome, rotulo, valor)
+
+def estatisticas():
+    """
+    Monta a resposta de STATS com as métricas e os medidores atuais.
+    """
+    with lock:
+        dispositivos = len(DISPOSITIVOS)
+        suspensas = SESSOES.suspensas
+    medidores = {
+        "dispositivos_ativos": dispositivos,
+        "sessoes_suspensas": suspensas,
+        "paineis_ativos": CONEXOES_ATIVAS - dispositivos,
+        "threads_ativas": threading.active_count(),
+    }
+    with lock_metricas:
+        return METRICAS.instantaneo(medidores)
+
+def codificar(mensagem):
+    """
+    Serializa uma mensagem já enquadrada para o envio.
+    """
+    return enquadrar(json.dumps(mensagem).encode('utf-8'), ENQUADRAMENTO)
+
+def serializar(resposta, sessao=None):
+    """
+    Serializa uma resposta, contabilizando os bytes enviados.
+    """
+    corpo = json.dumps(resposta).encode('utf-8')
+    if CAPTURA and sessao:
+        CAPTURA.registrar(sessao.id_captura, SAIDA, corpo)
+    dados = enquadrar(corpo, ENQUADRAMENTO)
+    contar("bytes_saida", valor=len(dados))
+    return dados
 
 def obter_lampada_por_nome(nome):
     """
@@ -30,66 +114,249 @@ def obter_lampada_por_nome(nome):
         return DISPOSITIVOS.get(nome)
 
 # --- Tratamento de Clientes ---
-def tratar_cliente(conn, addr):
+class Sessao:
     """
-    Função executada por thread para tratar comunicação com cada cliente.
+    Estado de uma conexão de cliente, o mesmo nos três modos do servidor.
     """
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.nome_dispositivo = None
+        self.sessao_dispositivo = None  # sessão retomável entregue no REGISTRO
+        self.primeira = True       # a primeira mensagem é a única que pode ser REGISTRO
+        self.leitor = LeitorQuadros(ENQUADRAMENTO, TAMANHO_RECV)  # remonta as mensagens entre leituras
+        self.saida = bytearray()   # modo selectors: bytes ainda não enviados
+        self.eventos = 0           # modo selectors: eventos registrados no seletor
+        self.id_captura = CAPTURA.abrir() if CAPTURA else 0
+
+def abrir_sessao(conn, addr):
+    global CONEXOES_ATIVAS
     log(f"Conexão estabelecida com {addr}")
-    nome_dispositivo = None
+    with lock_metricas:
+        CONEXOES_ATIVAS += 1
+    log(f"🔵 Conexões ativas: {CONEXOES_ATIVAS}", DEBUG, "conexao")
+    return Sessao(conn, addr)
+
+def encerrar_sessao(sessao):
+    global CONEXOES_ATIVAS
+    with lock_metricas:
+        CONEXOES_ATIVAS -= 1
+    # Tira o dispositivo do ar ao desconectar; o registro e a lâmpada (com o
+    # estado) ficam guardados até a sessão ser retomada ou expirar.
+    # Se outra conexão já retomou a sessão, não há nada a fazer aqui.
+    nome_dispositivo = sessao.nome_dispositivo
+    if sessao.sessao_dispositivo is not None:
+        with lock:
+            if SESSOES.suspender(sessao.sessao_dispositivo, sessao):
+                lampada = DISPOSITIVOS.pop(nome_dispositivo, None)
+                if lampada is not None:
+                    SUSPENSAS[nome_dispositivo] = lampada
+            expirar_sessoes()
+    sessao.conn.close()
+    if CAPTURA:
+        CAPTURA.registrar(sessao.id_captura, FECHAMENTO)
+    log(f"⚠️ {nome_dispositivo} desconectado.")
+
+def expirar_sessoes():
+    """
+    Descadastra os dispositivos cujas sessões suspensas venceram sem ser
+    retomadas. Chamada com `lock` nos REGISTROs, desconexões e LISTARs.
+    """
+    for suspensa in SESSOES.expiradas():
+        for nome in suspensa.nomes:
+            if nome not in DISPOSITIVOS:
+                SUSPENSAS.pop(nome, None)
+                REGISTRO.remover(nome)
 
-    try:
-        data = conn.recv(1024).decode('utf-8').strip()
-        if not data:
-            return
-            
-        mensagem = json.loads(data)
-        
-        if mensagem.get("tipo") == "REGISTRO":
-            # Registro de novo dispositivo
-            nome_dispositivo = mensagem.get("dispositivo")
-            # Cria e registra a lâmpada no dicionário global
-            with lock:
-                if nome_dispositivo not in DISPOSITIVOS:
-                    DISPOSITIVOS[nome_dispositivo] = Lampada(nome_dispositivo)
-            # Confirma registro ao cliente
-            resposta = {"tipo": "RESPOSTA", "status": "OK"}
-            conn.sendall(json.dumps(resposta).encode('utf-8'))
-        elif mensagem.get("tipo") == "COMANDO":
-            # Recebe comando para dispositivo
-            dispositivo_destino = mensagem.get("dispositivo")
-            lampada = obter_lampada_por_nome(dispositivo_destino)
-            resposta = processar_comando(lampada, mensagem)
-            conn.sendall(json.dumps(resposta).encode('utf-8'))
+def tratar_mensagem(sessao, data):
+    """
+    Trata uma mensagem recebida de um cliente e retorna a resposta a enviar
+    (ou None se não houver resposta). Não faz E/S no socket, para servir
+    tanto às threads quanto ao laço de eventos.
+    """
+    contar("bytes_entrada", valor=len(data))
+    if CAPTURA:
+        CAPTURA.registrar(sessao.id_captura, ENTRADA, data)
+    primeira, sessao.primeira = sessao.primeira, False
 
-        while True:
-            data = conn.recv(1024)
-            if not data:
-                break
+    try:
+        mensagem = json.loads(data.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # Mensagem JSON inválida recebida
+        contar("json_invalido")
+        return {"tipo": "ERRO", "mensagem": "JSON inválido"}
 
-            try:
-                mensagem = json.loads(data.decode('utf-8').strip())
-                log(f"📩 {nome_dispositivo} -> {mensagem}")
+    if not primeira and registro_logs().habilitado(DEBUG):
+        log(f"📩 {sessao.nome_dispositivo} -> {mensagem}", DEBUG, "mensagem")
 
-                if mensagem.get("tipo") == "COMANDO":
-                    dispositivo_destino = mensagem.get("dispositivo")
-                    lampada = obter_lampada_por_nome(dispositivo_destino)
-                    resposta = processar_comando(lampada, mensagem)
-                    conn.sendall(json.dumps(resposta).encode('utf-8'))
+    resposta = responder_mensagem(sessao, mensagem, primeira)
+    if resposta is not None and "id" in mensagem:
+        resposta["id"] = mensagem["id"]
+    return resposta
 
-            except json.JSONDecodeError:
-                # Mensagem JSON inválida recebida
-                erro = {"tipo": "ERRO", "mensagem": "JSON inválido"}
-                conn.sendall(json.dumps(erro).encode('utf-8'))
+def responder_mensagem(sessao, mensagem, primeira):
+    """
+    Resposta para uma mensagem já decodificada, conforme o seu tipo.
+    """
+    tipo = mensagem.get("tipo")
+    if tipo == "REGISTRO" and primeira:
+        # Registro de novo dispositivo
+        nome_dispositivo = sessao.nome_dispositivo = mensagem.get("dispositivo")
+        with lock:
+            expirar_sessoes()
+            retomada = "sessao" in mensagem and SESSOES.retomar(mensagem["sessao"], nome_dispositivo, sessao)
+            if retomada:
+                # Registro e grupos continuam indexados; a lâmpada volta com o estado que tinha
+                if nome_dispositivo in SUSPENSAS:
+                    DISPOSITIVOS[nome_dispositivo] = SUSPENSAS.pop(nome_dispositivo)
+                sessao.sessao_dispositivo = retomada
+            else:
+                # Cria e registra a lâmpada no dicionário global
+                REGISTRO.adicionar(nome_dispositivo, mensagem.get("dados"))
+                if nome_dispositivo in SUSPENSAS:
+                    DISPOSITIVOS[nome_dispositivo] = SUSPENSAS.pop(nome_dispositivo)
+                elif nome_dispositivo not in DISPOSITIVOS:
+                    lampada = DISPOSITIVOS[nome_dispositivo] = Lampada(nome_dispositivo)
+                    # Retoma o último estado salvo antes do reinício do servidor
+                    salvo = DIARIO.obter(nome_dispositivo) if DIARIO else None
+                    if salvo:
+                        lampada.estado = salvo[0] == "LIGADA"
+                sessao.sessao_dispositivo = SESSOES.criar(nome_dispositivo, [nome_dispositivo], False, sessao)
+        if retomada:
+            contar("sessoes_retomadas")
+            log(f"🔁 {nome_dispositivo} retomou a sessão.", categoria="sessao")
+        # Confirma registro ao cliente, com o token para retomar a sessão
+        resposta = {"tipo": "RESPOSTA", "status": "OK", "sessao": sessao.sessao_dispositivo.token}
+        if retomada:
+            resposta["retomada"] = True
+        return resposta
+    elif tipo == "COMANDO":
+        # Recebe comando para um ou vários dispositivos
+        return tratar_comando(mensagem)
+    elif tipo == "LISTAR":
+        return listar(mensagem)
+    elif tipo == "STATS":
+        return {"tipo": "RESPOSTA", "dados": estatisticas()}
+    return None
+
+def tratar_quadros(sessao, quadros):
+    """
+    Trata todas as mensagens completas de uma leitura, em ordem, e retorna
+    as respostas já serializadas para um único envio.
+    """
+    saida = bytearray()
+    for quadro in quadros:
+        resposta = tratar_mensagem(sessao, quadro)
+        if resposta is not None:
+            saida += serializar(resposta, sessao)
+    return saida
 
+def tratar_cliente(conn, addr):
+    """
+    Função executada por thread para tratar comunicação com cada cliente
+    (modo "threads").
+    """
+    sessao = abrir_sessao(conn, addr)
+    try:
+        while True:
+            quadros = sessao.leitor.receber(conn)
+            if quadros is None:
+                break
+            saida = tratar_quadros(sessao, quadros)
+            if saida:
+                conn.sendall(saida)
     except Exception as e:
-        log(f"❌ Erro em {addr}: {str(e)}")
+        log(f"❌ Erro em {addr}: {str(e)}", ERRO)
     finally:
-        # Remove dispositivo do dicionário ao desconectar
-        if nome_dispositivo and nome_dispositivo in DISPOSITIVOS:
-            with lock:
-                del DISPOSITIVOS[nome_dispositivo]
-        conn.close()
-        log(f"⚠️ {nome_dispositivo} desconectado.")
+        encerrar_sessao(sessao)
+
+def resolver_alvos(alvo):
+    """
+    Converte o campo "dispositivo" de um COMANDO na lista de nomes alvo.
+    Aceita um nome, uma lista de nomes, "all", um padrão (ex: "LAMPADA_*")
+    ou um seletor de atributos (ex: "tipo=LAMPADA AND grupo=sala"). Como
+    "all" e os padrões, o seletor deixa de fora os dispositivos fora do ar.
+    """
+    if isinstance(alvo, list):
+        return list(dict.fromkeys(alvo))
+    if REGISTRO.eh_seletor(alvo):
+        with lock:
+            return [nome for nome in REGISTRO.selecionar(alvo) if nome in DISPOSITIVOS]
+    with lock:
+        nomes = list(DISPOSITIVOS.keys())
+    if alvo == "all":
+        return nomes
+    return fnmatch.filter(nomes, alvo)
+
+def ausencia(nome):
+    """
+    Por que um alvo não tem lâmpada: desconectado (sessão suspensa) ou não encontrado.
+    """
+    with lock:
+        suspensa = nome in SUSPENSAS
+    if suspensa:
+        contar("dispositivo_desconectado")
+        return "desconectado"
+    contar("dispositivo_desconhecido")
+    return "não encontrado"
+
+def tratar_comando(mensagem):
+    """
+    Executa um COMANDO para um dispositivo ou, se o alvo for múltiplo,
+    para todos os alvos, agregando os resultados em uma única resposta.
+    """
+    alvo = mensagem.get("dispositivo")
+    acao = mensagem.get("dados")
+    contar("comandos", acao if acao in ("LIGAR", "DESLIGAR", "STATUS") else "OUTRO")
+    multiplo = isinstance(alvo, list) or (
+        isinstance(alvo, str) and (alvo == "all" or any(c in alvo for c in "*?[=")))
+
+    if not multiplo:
+        lampada = obter_lampada_por_nome(alvo)
+        if lampada is None:
+            return {"tipo": "ERRO", "mensagem": f"Dispositivo '{alvo}' {ausencia(alvo)}"}
+        return processar_comando(lampada, mensagem)
+
+    try:
+        alvos = resolver_alvos(alvo)
+    except ValueError as e:
+        return {"tipo": "ERRO", "mensagem": str(e)}
+
+    resultados = {}
+    for nome in alvos:
+        lampada = obter_lampada_por_nome(nome)
+        if lampada is None:
+            resultados[nome] = {"status": "erro", "dados": f"Dispositivo {ausencia(nome)}"}
+            continue
+        resposta = processar_comando(lampada, mensagem)
+        if resposta["tipo"] == "RESPOSTA":
+            resultados[nome] = {"status": "sucesso", "dados": resposta["dados"]}
+        else:
+            resultados[nome] = {"status": "erro", "dados": resposta["mensagem"]}
+
+    return {
+        "tipo": "RESPOSTA",
+        "dispositivo": alvo,
+        "dados": resultados,
+        "total": len(resultados),
+        "falhas": sum(1 for r in resultados.values() if r["status"] == "erro"),
+        "status": "sucesso"
+    }
+
+def listar(mensagem):
+    """
+    Lista os dispositivos (e seus atributos) que casam com "seletor" e
+    "padrao", uma página por vez ("cursor", "limite"), ou só as entradas e
+    saídas de dispositivos depois da versão "desde" do registro.
+    """
+    try:
+        with lock:
+            expirar_sessoes()
+            pagina = REGISTRO.listar(mensagem.get("seletor"), mensagem.get("padrao"), mensagem.get("cursor"),
+                                     mensagem.get("limite", LIMITE_LISTAR), mensagem.get("desde"))
+    except ValueError as e:
+        return {"tipo": "ERRO", "mensagem": str(e)}
+    return {"tipo": "RESPOSTA", **pagina}
 
 def processar_comando(lampada, comando):
     """
@@ -97,6 +364,9 @@ def processar_comando(lampada, comando):
     """
     acao = comando.get("dados")
 
+    if acao in ("LIGAR", "DESLIGAR") and DIARIO and lampada.estado != (acao == "LIGAR"):
+        DIARIO.registrar(lampada.nome, "LIGADA" if acao == "LIGAR" else "DESLIGADA")
+
     if acao == "LIGAR":
         lampada.estado = True
         return {
@@ -132,61 +402,244 @@ def processar_comando(lampada, comando):
         }
 
 # --- Servidor Principal ---
-def iniciar_servidor():
+def servir_threads(s):
+    """
+    Modo "threads": uma thread por conexão, com recv bloqueante.
+    """
+    while True:
+        conn, addr = s.accept()
+        thread = threading.Thread(target=tratar_cliente, args=(conn, addr))
+        thread.daemon = True
+        thread.start()
+
+def aceitar_conexoes(s, seletor, bloqueante):
     """
-    Inicializa o servidor TCP e aceita conexões de clientes.
+    Aceita todas as conexões pendentes na fila e as registra no seletor.
     """
+    while True:
+        try:
+            conn, addr = s.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(bloqueante)
+        sessao = abrir_sessao(conn, addr)
+        sessao.eventos = selectors.EVENT_READ
+        seletor.register(conn, sessao.eventos, sessao)
+
+def ajustar_eventos(seletor, sessao):
+    """
+    Com bytes pendentes a sessão espera só por escrita: um cliente que não
+    lê as respostas deixa de ter mensagens lidas até a fila esvaziar.
+    """
+    eventos = selectors.EVENT_WRITE if sessao.saida else selectors.EVENT_READ
+    if eventos != sessao.eventos:
+        sessao.eventos = eventos
+        seletor.modify(sessao.conn, eventos, sessao)
+
+def servir_selectors(s):
+    """
+    Modo "selectors": uma única thread atende todas as conexões com sockets
+    não bloqueantes e o seletor do sistema (epoll no Linux).
+    """
+    seletor = selectors.DefaultSelector()
+    s.setblocking(False)
+    seletor.register(s, selectors.EVENT_READ)
+
+    while True:
+        for chave, eventos in seletor.select():
+            if chave.fileobj is s:
+                aceitar_conexoes(s, seletor, bloqueante=False)
+                continue
+
+            sessao = chave.data
+            try:
+                if eventos & selectors.EVENT_WRITE:
+                    enviados = sessao.conn.send(sessao.saida)
+                    del sessao.saida[:enviados]
+                elif eventos & selectors.EVENT_READ:
+                    quadros = sessao.leitor.receber(sessao.conn)
+                    if quadros is None:
+                        raise ConnectionResetError
+                    sessao.saida += tratar_quadros(sessao, quadros)
+                    if sessao.saida:
+                        enviados = sessao.conn.send(sessao.saida)
+                        del sessao.saida[:enviados]
+                ajustar_eventos(seletor, sessao)
+            except (BlockingIOError, InterruptedError):
+                ajustar_eventos(seletor, sessao)
+            except Exception as e:
+                if not isinstance(e, ConnectionError):
+                    log(f"❌ Erro em {sessao.addr}: {str(e)}", ERRO)
+                seletor.unregister(sessao.conn)
+                encerrar_sessao(sessao)
+
+def servir_pool(s):
+    """
+    Modo "pool": o laço de prontidão só detecta conexões com dados; a
+    leitura e o tratamento da mensagem rodam em um pool fixo de threads.
+    Enquanto um worker atende a conexão ela sai do seletor, e volta por
+    uma fila quando o worker termina (o seletor só é tocado pelo laço).
+    """
+    seletor = selectors.DefaultSelector()
+    s.setblocking(False)
+    seletor.register(s, selectors.EVENT_READ)
+
+    # Par de sockets para acordar o select() quando há sessões a rearmar
+    despertador, sinal = socket.socketpair()
+    despertador.setblocking(False)
+    seletor.register(despertador, selectors.EVENT_READ)
+    rearmar = queue.SimpleQueue()
+
+    def atender(sessao):
+        try:
+            quadros = sessao.leitor.receber(sessao.conn)
+            if quadros is not None:
+                saida = tratar_quadros(sessao, quadros)
+                if saida:
+                    sessao.conn.sendall(saida)
+                rearmar.put(sessao)
+                sinal.send(b"\0")
+                return
+        except Exception as e:
+            if not isinstance(e, ConnectionError):
+                log(f"❌ Erro em {sessao.addr}: {str(e)}", ERRO)
+        encerrar_sessao(sessao)
+
+    with ThreadPoolExecutor(TAMANHO_POOL, thread_name_prefix="pool") as pool:
+        while True:
+            for chave, _ in seletor.select():
+                if chave.fileobj is s:
+                    aceitar_conexoes(s, seletor, bloqueante=True)
+                elif chave.fileobj is despertador:
+                    try:
+                        despertador.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    while not rearmar.empty():
+                        sessao = rearmar.get()
+                        seletor.register(sessao.conn, selectors.EVENT_READ, sessao)
+                else:
+                    seletor.unregister(chave.fileobj)
+                    pool.submit(atender, chave.data)
+
+MODOS = {
+    "threads": servir_threads,
+    "selectors": servir_selectors,
+    "pool": servir_pool,
+}
+
+def iniciar_servidor(modo=None, backlog=None):
+    """
+    Inicializa o servidor TCP e aceita conexões de clientes no modo
+    configurado (MODO_SERVIDOR, se `modo` não for informado).
+    """
+    global DIARIO, CAPTURA
+    modo = modo or MODO_SERVIDOR
+    backlog = backlog or BACKLOG
+    registro_logs()
+    if ARQUIVO_ESTADOS and DIARIO is None:
+        DIARIO = Diario(ARQUIVO_ESTADOS)
+        log(f"💾 {len(DIARIO.tabela)} estados carregados de {ARQUIVO_ESTADOS} em {DIARIO.tempo_carga * 1000:.1f} ms")
+    if ARQUIVO_CAPTURA and CAPTURA is None:
+        CAPTURA = Captura(ARQUIVO_CAPTURA)
+        log(f"🎥 Capturando o tráfego em {ARQUIVO_CAPTURA}")
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind((HOST, PORT))
-            s.listen(5)
-            log(f"🖥️ Servidor iniciado em {HOST}:{PORT}. Aguardando conexões...")
-
-            while True:
-                conn, addr = s.accept()
-                thread = threading.Thread(target=tratar_cliente, args=(conn, addr))
-                thread.daemon = True
-                thread.start()
-                log(f"🔵 Conexões ativas: {threading.active_count()}")
+            s.listen(backlog)
+            log(f"🖥️ Servidor iniciado em {HOST}:{PORT} (modo {modo}). Aguardando conexões...")
+            PRONTO.set()
+            notificar_pronto()
+            MODOS[modo](s)
 
     except Exception as e:
-        log(f"❌ Erro no servidor: {str(e)}")
+        log(f"❌ Erro no servidor: {str(e)}", ERRO)
 
 # --- Cliente (Lâmpada) ---
 class Lampada:
     """
     Classe que representa uma lâmpada/dispositivo.
     """
-    def __init__(self, nome):
+    def __init__(self, nome, reconectar=True):
         self.nome = nome
         self.estado = False  # Estado inicial: desligada
+        self.sock = None     # lado do dispositivo: conexão aberta por registrar()
+        self.leitor = None
+        self.reconectar = reconectar  # volta a se registrar quando a conexão cai
+        self.sessao = None   # token da sessão, reenviado no REGISTRO para retomá-la
 
     def conectar(self):
         """
         Conecta a lâmpada ao servidor e processa comandos recebidos.
         """
+        if self.registrar() or self.reconectar:
+            self.manter()
+
+    def manter(self):
+        """
+        Atende a conexão registrada. Se ela cai (ou nem abriu) e reconectar
+        está ligado, registra de novo, retomando a sessão, depois de uma
+        espera com backoff exponencial e jitter: sem o sorteio, todas as
+        lâmpadas voltariam no mesmo instante quando o servidor reinicia.
+        """
+        tentativa = 0
+        while True:
+            if self.sock is not None:
+                self.atender()
+                tentativa = 0
+            if not self.reconectar:
+                return
+            espera = espera_reconexao(tentativa)
+            tentativa += 1
+            print(f"🔄 [{self.nome}] Reconectando em {espera:.1f} s...")
+            time.sleep(espera)
+            self.registrar()
+
+    def registrar(self):
+        """
+        Abre a conexão e envia o REGISTRO. Retorna True quando o servidor
+        confirma; a partir daí atender() processa os comandos.
+        """
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((HOST, PORT))
-                
-                # Envia mensagem de registro ao servidor
-                registro = {"tipo": "REGISTRO", "dispositivo": self.nome}
-                s.sendall(json.dumps(registro).encode('utf-8'))
-                
-                data = s.recv(1024)
-                if data:
-                    resposta = json.loads(data.decode('utf-8'))
-                    if resposta.get("status") == "OK":
-                        print(f"💡 [{self.nome}] Registrada e pronta para comandos")
+            self.sock = socket.create_connection((HOST, PORT))
+
+            # Envia mensagem de registro ao servidor
+            registro = {"tipo": "REGISTRO", "dispositivo": self.nome, "dados": {"tipo": "LAMPADA"}}
+            if self.sessao:
+                registro["sessao"] = self.sessao
+            self.sock.sendall(codificar(registro))
+
+            self.leitor = LeitorQuadros(ENQUADRAMENTO, TAMANHO_RECV)
+            data = self.leitor.proximo(self.sock)
+            confirmacao = json.loads(data.decode('utf-8')) if data else {}
+            if confirmacao.get("status") == "OK":
+                self.sessao = confirmacao.get("sessao")
+                retomada = " (sessão retomada)" if confirmacao.get("retomada") else ""
+                print(f"💡 [{self.nome}] Registrada{retomada} e pronta para comandos")
+                return True
+            print(f"❌ [{self.nome}] Registro não confirmado")
+        except Exception as e:
+            print(f"❌ [{self.nome}] Erro: {str(e)}")
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        return False
 
+    def atender(self):
+        """
+        Processa os comandos recebidos até o servidor encerrar a conexão.
+        """
+        try:
+            with self.sock as s:
+                leitor = self.leitor
                 while True:
-                    data = s.recv(1024)
+                    data = leitor.proximo(s)
                     if not data:
                         break
 
                     try:
-                        msg = json.loads(data.decode('utf-8').strip())
+                        msg = json.loads(data.decode('utf-8'))
                         print(f"📥 [{self.nome}] Recebeu: {msg}")
 
                         # Processa o comando e atualiza estado
@@ -221,19 +674,74 @@ class Lampada:
                                 "dados": "COMANDO_DESCONHECIDO"
                             }
 
-                        s.sendall(json.dumps(resposta).encode('utf-8'))
+                        if "id" in msg:
+                            resposta["id"] = msg["id"]
+                        s.sendall(codificar(resposta))
                         print(f"📤 [{self.nome}] Enviou: {resposta}")
 
                     except json.JSONDecodeError:
                         # Mensagem inválida recebida
                         erro = {"tipo": "ERRO", "dispositivo": self.nome, "dados": "MENSAGEM_INVALIDA"}
-                        s.sendall(json.dumps(erro).encode('utf-8'))
+                        s.sendall(codificar(erro))
                         print(f"❌ [{self.nome}] Mensagem inválida recebida")
 
         except Exception as e:
             print(f"❌ [{self.nome}] Erro: {str(e)}")
+        self.sock = None
+
+def subir_lampadas(nomes, simultaneas=LAMPADAS_SIMULTANEAS, timeout=TIMEOUT_SUBIDA):
+    """
+    Conecta as lâmpadas simuladas em paralelo, com no máximo `simultaneas`
+    registros em andamento, e só retorna quando todos os REGISTROs foram
+    confirmados (ou falharam). As que falharam são listadas e seguem
+    tentando com backoff (reconectar). Retorna as lâmpadas registradas.
+    """
+    limite = threading.Semaphore(simultaneas)
+    registradas = []
+    prazo = time.monotonic() + timeout
+
+    def subir(lampada):
+        registrada = False
+        try:
+            registrada = lampada.registrar()
+            if registrada:
+                registradas.append(lampada)
+        finally:
+            limite.release()
+        if registrada or lampada.reconectar:
+            lampada.manter()
+
+    for nome in nomes:
+        if not limite.acquire(timeout=max(0.0, prazo - time.monotonic())):
+            break
+        threading.Thread(target=subir, args=(Lampada(nome),), daemon=True).start()
+    # Barreira: todas as vagas de volta = nenhum registro em andamento
+    for _ in range(simultaneas):
+        limite.acquire(timeout=max(0.0, prazo - time.monotonic()))
+    subiram = {lampada.nome for lampada in registradas}
+    falharam = [nome for nome in nomes if nome not in subiram]
+    if falharam:
+        print(f"⚠️ {len(falharam)} lâmpadas não se registraram: {', '.join(falharam[:10])}"
+              + ("..." if len(falharam) > 10 else ""))
+    return registradas
 
 # --- Painel de Controle Interativo ---
+def listar_dispositivos(s, leitor):
+    """
+    Busca os nomes dos dispositivos no servidor, uma página de LISTAR por vez.
+    """
+    nomes, cursor = [], None
+    while True:
+        s.sendall(codificar({"tipo": "LISTAR", "cursor": cursor}))
+        data = leitor.proximo(s)
+        if not data:
+            raise ConnectionError("Servidor encerrou a conexão")
+        resposta = json.loads(data.decode('utf-8'))
+        nomes.extend(resposta.get("dados", {}))
+        cursor = resposta.get("cursor")
+        if cursor is None:
+            return nomes
+
 def painel_interativo():
     """
     Painel de controle para enviar comandos aos dispositivos conectados.
@@ -242,15 +750,15 @@ def painel_interativo():
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect((HOST, PORT))
             s.settimeout(5.0)
+            leitor = LeitorQuadros(ENQUADRAMENTO, TAMANHO_RECV)
 
             while True:
                 print("\n" + "="*50)
                 print("PAINEL DE CONTROLE - DISPOSITIVOS CONECTADOS")
                 print("="*50)
                 
-                # Lista dispositivos disponíveis
-                with lock:
-                    dispositivos_disponiveis = list(DISPOSITIVOS.keys())
+                # Lista dispositivos disponíveis (perguntando ao servidor)
+                dispositivos_disponiveis = listar_dispositivos(s, leitor)
                 
                 if not dispositivos_disponiveis:
                     print("Nenhum dispositivo conectado. Aguardando...")
@@ -296,30 +804,30 @@ def painel_interativo():
                     print("Comando inválido!")
                     continue
                 
-                # Envia comandos para todos selecionados
-                for dispositivo in dispositivos_selecionados:
-                    msg = {
-                        "tipo": "COMANDO",
-                        "dispositivo": dispositivo,
-                        "dados": comando,
-                        "timestamp": str(time.time())
-                    }
-                    
-                    try:
-                        s.sendall(json.dumps(msg).encode('utf-8'))
-                        print(f"\n➡️ Enviado {comando} para {dispositivo}")
-                        
-                        # Recebe resposta
-                        data = s.recv(1024)
-                        if data:
-                            resposta = json.loads(data.decode('utf-8').strip())
-                            print(f"📥 Resposta de {dispositivo}: {resposta}")
-                        else:
-                            print(f"⚠️ Sem resposta de {dispositivo}")
-                            
-                    except Exception as e:
-                        print(f"❌ Erro ao comunicar com {dispositivo}: {str(e)}")
-                
+                # Envia um único comando para todos os selecionados
+                msg = {
+                    "tipo": "COMANDO",
+                    "dispositivo": "all" if selecao == "all" else dispositivos_selecionados,
+                    "dados": comando,
+                    "timestamp": str(time.time())
+                }
+
+                try:
+                    s.sendall(codificar(msg))
+                    print(f"\n➡️ Enviado {comando} para {', '.join(dispositivos_selecionados)}")
+
+                    # Recebe a resposta agregada (pode chegar em várias leituras)
+                    data = leitor.proximo(s)
+                    if data:
+                        resposta = json.loads(data.decode('utf-8'))
+                        for dispositivo, resultado in resposta.get("dados", {}).items():
+                            print(f"📥 Resposta de {dispositivo}: {resultado}")
+                    else:
+                        print("⚠️ Sem resposta do servidor")
+
+                except Exception as e:
+                    print(f"❌ Erro ao comunicar com o servidor: {str(e)}")
+
                 input("\nPressione Enter para continuar...")
 
     except Exception as e:
@@ -327,24 +835,20 @@ def painel_interativo():
 
 # --- Main ---
 if __name__ == "__main__":
-    # Inicia servidor em thread separada
+    # Inicia servidor em thread separada e espera ele aceitar conexões
     servidor_thread = threading.Thread(target=iniciar_servidor)
     servidor_thread.daemon = True
     servidor_thread.start()
-    time.sleep(1)
-
-    # Inicia lâmpadas (simulação de 4 dispositivos)
-    lampadas = [Lampada(f"LAMPADA_{i+1}") for i in range(4)]
-    for lampada in lampadas:
-        threading.Thread(target=lampada.conectar, daemon=True).start()
-        time.sleep(0.5)
+    if not PRONTO.wait(TIMEOUT_SUBIDA):
+        raise SystemExit("❌ Servidor não ficou pronto.")
 
-    # Aguarda conexões
-    time.sleep(2)
+    # Inicia lâmpadas (simulação de 4 dispositivos) e aguarda os registros
+    lampadas = subir_lampadas([f"LAMPADA_{i+1}" for i in range(4)])
+    print(f"✅ {len(lampadas)} lâmpadas registradas")
 
     # Inicia painel interativo
     painel_interativo()
 
     # Mantém o programa rodando enquanto houver threads ativas
     while threading.active_count() > 1:
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(1)
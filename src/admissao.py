@@ -0,0 +1,44 @@
+import time
+
+LIMITE_POR_DISPOSITIVO = 32    # comandos aguardando RESPOSTA de um mesmo dispositivo
+LIMITE_EM_ANDAMENTO = 20000    # comandos aguardando RESPOSTA no servidor inteiro
+TAXA_PAINEL = 2000             # COMANDOs por segundo aceitos de cada conexão de painel
+RAJADA_PAINEL = 2000           # COMANDOs que um painel pode enviar de uma vez
+TENTAR_EM = 0.1                # segundos sugeridos para tentar de novo quando a fila está cheia
+
+# Códigos dos erros de admissão
+OCUPADO = "OCUPADO"                # fila do dispositivo cheia
+SOBRECARREGADO = "SOBRECARREGADO"  # limite global ou taxa do painel excedidos
+
+class BaldeTokens:
+    """
+    Limite de taxa por balde de fichas: `taxa` fichas por segundo,
+    acumulando até `capacidade`.
+    """
+    __slots__ = ("taxa", "capacidade", "fichas", "atualizado")
+
+    def __init__(self, taxa=TAXA_PAINEL, capacidade=RAJADA_PAINEL):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = capacidade
+        self.atualizado = time.monotonic()
+
+    def consumir(self, quantidade=1):
+        """
+        Retorna 0 se as fichas foram consumidas, ou quantos segundos faltam
+        para haver fichas suficientes.
+        """
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+        if self.fichas >= quantidade:
+            self.fichas -= quantidade
+            return 0.0
+        return (quantidade - self.fichas) / self.taxa
+
+def recusa(codigo, mensagem, tentar_em=TENTAR_EM):
+    """
+    ERRO de admissão: o comando não foi enfileirado e pode ser reenviado
+    depois de `tentar_em` segundos.
+    """
+    return {"tipo": "ERRO", "codigo": codigo, "dados": mensagem, "tentar_em": round(tentar_em, 3)}
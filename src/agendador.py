@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import datetime
+import heapq
+import itertools
+import math
+import time
+
+from logs import ERRO
+
+INTERVALO_MINIMO = 1.0  # segundos; agendamentos recorrentes mais curtos são recusados
+ANOS_CRON = 5           # horizonte de busca da próxima ocorrência de uma expressão cron
+CONCLUIDOS = 100        # agendamentos encerrados mantidos para consulta em AGENDAMENTOS
+
+def numero(valor, campo):
+    """
+    Valida um campo numérico de AGENDAR (bool não conta como número).
+    """
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor):
+        raise ValueError(f"\"{campo}\" deve ser um número.")
+    return valor
+
+class Cron:
+    """
+    Expressão cron de 5 campos (minuto hora dia mês dia-da-semana), com
+    "*", listas (1,15), intervalos (1-5) e passos (*/10). Domingo é 0 ou 7.
+    Como no cron, se dia e dia-da-semana forem restritos, basta um casar.
+    """
+    LIMITES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expressao):
+        if not isinstance(expressao, str):
+            raise ValueError("\"cron\" deve ser um texto com 5 campos.")
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expressão cron inválida: '{expressao}'")
+        self.expressao = expressao
+        (self.minutos, self.horas, self.dias, self.meses, semana) = (
+            self.ler_campo(campo, *limites) for campo, limites in zip(campos, self.LIMITES))
+        self.semana = {d % 7 for d in semana}
+        self.dia_livre = campos[2] == "*"
+        self.semana_livre = campos[4] == "*"
+
+    @staticmethod
+    def ler_campo(campo, minimo, maximo):
+        valores = set()
+        try:
+            for parte in campo.split(","):
+                faixa, _, passo = parte.partition("/")
+                if faixa == "*":
+                    inicio, fim = minimo, maximo
+                elif "-" in faixa:
+                    inicio, fim = (int(v) for v in faixa.split("-"))
+                else:
+                    inicio = fim = int(faixa)
+                passo = int(passo) if passo else 1
+                if inicio < minimo or fim > maximo or inicio > fim or passo <= 0:
+                    raise ValueError
+                valores.update(range(inicio, fim + 1, passo))
+        except ValueError:
+            raise ValueError(f"Campo cron inválido: '{campo}'") from None
+        return valores
+
+    def dia_casa(self, data):
+        dia = data.day in self.dias
+        semana = (data.weekday() + 1) % 7 in self.semana  # weekday(): segunda = 0
+        if self.dia_livre or self.semana_livre:
+            return dia and semana
+        return dia or semana
+
+    def proxima(self, depois):
+        """
+        Próximo instante (timestamp) estritamente depois de `depois`, no fuso local.
+        Avança por mês, dia, hora e minuto, pulando o que não casa.
+        """
+        t = datetime.datetime.fromtimestamp(depois).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limite = t.year + ANOS_CRON
+        while t.year <= limite:
+            if t.month not in self.meses:
+                t = (t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.dia_casa(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif t.hour not in self.horas:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            elif t.minute not in self.minutos:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError(f"Expressão cron sem ocorrência: '{self.expressao}'")
+
+class Agendamento:
+    __slots__ = ("id", "alvo", "dados", "proxima", "intervalo", "cron", "execucoes", "ultimo_resultado")
+
+    def __init__(self, id_agendamento, alvo, dados, proxima, intervalo=None, cron=None):
+        self.id = id_agendamento
+        self.alvo = alvo
+        self.dados = dados
+        self.proxima = proxima      # timestamp da próxima execução
+        self.intervalo = intervalo  # segundos (recorrente) ou None
+        self.cron = cron            # Cron (recorrente) ou None
+        self.execucoes = 0
+        self.ultimo_resultado = None
+
+    def avancar(self, agora):
+        """
+        Calcula a próxima execução de um agendamento recorrente, sem
+        acumular execuções perdidas (os períodos perdidos são pulados de
+        uma vez). Retorna False se ele não se repete.
+        """
+        if self.intervalo:
+            if self.proxima <= agora:
+                self.proxima += math.ceil((agora - self.proxima) / self.intervalo) * self.intervalo
+                if self.proxima <= agora:
+                    self.proxima += self.intervalo
+            return True
+        if self.cron:
+            self.proxima = self.cron.proxima(agora)
+            return True
+        return False
+
+    def descrever(self):
+        return {
+            "dispositivo": self.alvo,
+            "dados": self.dados,
+            "proxima": self.proxima,
+            "intervalo": self.intervalo,
+            "cron": self.cron.expressao if self.cron else None,
+            "execucoes": self.execucoes,
+            "ultimo_resultado": self.ultimo_resultado,
+        }
+
+class Agendador:
+    """
+    Comandos adiados e recorrentes. Os agendamentos ficam em um heap
+    ordenado pela próxima execução; cancelar só tira do dicionário e a
+    entrada velha do heap é descartada quando chega ao topo. A cada
+    disparo, todos os vencidos saem juntos, e os que têm o mesmo comando
+    para um único dispositivo viram um só comando múltiplo. Os que não se
+    repetem mais vão para `concluidos`, com o resultado da última execução.
+    """
+    def __init__(self, executar, eh_multiplo, log=None):
+        self.executar = executar  # corrotina (alvo, dados) -> RESPOSTA do servidor
+        self.eh_multiplo = eh_multiplo  # alvo que o servidor expande em vários dispositivos
+        self.log = log            # log(mensagem, nivel) do servidor, para falhas no disparo (None = print)
+        self.agendamentos = {}    # {id: Agendamento}
+        self.concluidos = collections.deque(maxlen=CONCLUIDOS)  # últimos encerrados, para consulta
+        self.heap = []            # [(proxima, id)]
+        self.ids = itertools.count(1)
+        self.mudou = None         # asyncio.Event criado por rodar(), já dentro do laço de eventos
+        self.tarefas = set()
+
+    def agendar(self, alvo, dados, em=None, intervalo=None, cron=None):
+        """
+        Cria um agendamento: uma vez em `em` (timestamp), a cada `intervalo`
+        segundos (começando em `em`, se informado) ou conforme `cron`.
+        Levanta ValueError se os parâmetros forem inválidos.
+        """
+        agora = time.time()
+        if not isinstance(dados, str):
+            raise ValueError("\"dados\" deve ser um comando em texto (ex: \"LIGAR\").")
+        if not isinstance(alvo, str) and not (isinstance(alvo, list) and all(isinstance(n, str) for n in alvo)):
+            raise ValueError("\"dispositivo\" deve ser um nome, uma lista de nomes, um padrão ou um seletor.")
+        if em is not None:
+            numero(em, "em")
+        if intervalo is not None:
+            numero(intervalo, "intervalo")
+        if cron is not None:
+            cron = Cron(cron)
+            if em is None:
+                proxima = cron.proxima(agora)
+            else:
+                # proxima() arredonda para o minuto: a ocorrência não pode vir antes de `em`
+                proxima = cron.proxima(em - 1)
+                if proxima < em:
+                    proxima = cron.proxima(proxima)
+        elif intervalo is not None:
+            if intervalo < INTERVALO_MINIMO:
+                raise ValueError(f"Intervalo mínimo é de {INTERVALO_MINIMO} s.")
+            proxima = agora + intervalo if em is None else em
+        elif em is not None:
+            proxima = em
+        else:
+            raise ValueError("Informe \"em\", \"intervalo\" ou \"cron\".")
+
+        agendamento = Agendamento(next(self.ids), alvo, dados, proxima, intervalo, cron)
+        self.empilhar(agendamento)
+        self.agendamentos[agendamento.id] = agendamento
+        return agendamento
+
+    def cancelar(self, id_agendamento):
+        if self.agendamentos.pop(id_agendamento, None) is None:
+            return False
+        # Entradas canceladas só saem do heap no topo; se forem a maioria, reconstrói
+        if len(self.heap) > 2 * len(self.agendamentos) + 1024:
+            self.heap = [(a.proxima, a.id) for a in self.agendamentos.values()]
+            heapq.heapify(self.heap)
+        return True
+
+    def empilhar(self, agendamento):
+        # Só acorda o laço se a nova execução vier antes da mais próxima
+        if self.mudou is not None and (not self.heap or agendamento.proxima < self.heap[0][0]):
+            self.mudou.set()
+        heapq.heappush(self.heap, (agendamento.proxima, agendamento.id))
+
+    async def rodar(self):
+        self.mudou = asyncio.Event()
+        while True:
+            self.mudou.clear()
+            espera = max(0.0, self.heap[0][0] - time.time()) if self.heap else None
+            try:
+                await asyncio.wait_for(self.mudou.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                self.disparar(time.time())
+            except Exception as e:
+                # Um disparo com problema não pode parar todos os agendamentos
+                self.avisar(f"❌ Erro ao disparar agendamentos: {e}")
+
+    def avisar(self, mensagem):
+        if self.log:
+            self.log(mensagem, ERRO)
+        else:
+            print(mensagem)
+
+    def disparar(self, agora):
+        vencidos = []
+        while self.heap and self.heap[0][0] <= agora:
+            proxima, id_agendamento = heapq.heappop(self.heap)
+            agendamento = self.agendamentos.get(id_agendamento)
+            if agendamento is None or agendamento.proxima != proxima:
+                continue  # cancelado ou já reagendado
+            vencidos.append(agendamento)
+            agendamento.execucoes += 1
+            try:
+                recorrente = agendamento.avancar(agora)
+            except ValueError:
+                recorrente = False  # cron sem próxima ocorrência
+            if recorrente:
+                self.empilhar(agendamento)
+            else:
+                del self.agendamentos[id_agendamento]
+                self.concluidos.append(agendamento)
+        if not vencidos:
+            return
+
+        # Alvos simples com o mesmo comando vão juntos em um comando múltiplo
+        # (um agendamento com problema fica com o erro e não derruba os outros)
+        lotes = {}
+        for agendamento in vencidos:
+            try:
+                if not self.eh_multiplo(agendamento.alvo):
+                    lotes.setdefault(agendamento.dados, []).append(agendamento)
+                else:
+                    self.criar_tarefa(self.executar_lote([agendamento], agendamento.alvo, agendamento.dados))
+            except Exception as e:
+                agendamento.ultimo_resultado = {"status": "erro", "dados": str(e)}
+                self.avisar(f"❌ Erro ao disparar o agendamento {agendamento.id}: {e}")
+        for dados, agendamentos in lotes.items():
+            alvos = list(dict.fromkeys(a.alvo for a in agendamentos))
+            self.criar_tarefa(self.executar_lote(agendamentos, alvos, dados))
+
+    def criar_tarefa(self, corrotina):
+        tarefa = asyncio.create_task(corrotina)
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    async def executar_lote(self, agendamentos, alvo, dados):
+        try:
+            resposta = await self.executar(alvo, dados)
+        except Exception as e:
+            resposta = {"tipo": "ERRO", "dados": str(e)}
+        for agendamento in agendamentos:
+            if isinstance(alvo, list):
+                # Resultado do dispositivo deste agendamento dentro da resposta agregada
+                resultado = resposta.get("dados", {}).get(agendamento.alvo) if resposta.get("tipo") == "RESPOSTA" \
+                    else {"status": "erro", "dados": resposta.get("dados")}
+            elif "falhas" in resposta:
+                # Comando múltiplo: só o resumo, não o resultado de cada dispositivo
+                resultado = {"status": "erro" if resposta["falhas"] else "sucesso",
+                             "total": resposta["total"], "falhas": resposta["falhas"]}
+            elif resposta.get("tipo") == "RESPOSTA":
+                resultado = {"status": "sucesso", "dados": resposta.get("dados")}
+            else:
+                resultado = {"status": "erro", "dados": resposta.get("dados")}
+            agendamento.ultimo_resultado = resultado
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from admissao import OCUPADO, SOBRECARREGADO
+from captura import INTERVALO_GRAVACAO
+from gateway import Gateway
+
+try:
+    import resource  # só em sistemas Unix
+except ImportError:
+    resource = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(RAIZ, "src")
+
+# Código que cada servidor roda no processo filho (host, porta e arquivo de captura via argv)
+SERVIDOR_SINCRONO = (
+    "import sys; sys.path.insert(0, {raiz!r}); import main; "
+    "main.LOG_CONSOLE = False; main.HOST, main.PORT = sys.argv[1], int(sys.argv[2]); "
+    "main.ARQUIVO_CAPTURA = sys.argv[3] or None; "
+    "main.iniciar_servidor(%r)"
+)
+# Os servidores síncronos não têm controle de admissão: o assíncrono roda com
+# limites fora de alcance para que a comparação meça o mesmo trabalho
+ADMISSAO_LIVRE = {"limite_dispositivo": 10 ** 9, "limite_em_andamento": 10 ** 9,
+                  "taxa_painel": 10 ** 9, "rajada_painel": 10 ** 9}
+SERVIDORES = {
+    "threaded": SERVIDOR_SINCRONO % "threads",
+    "selectors": SERVIDOR_SINCRONO % "selectors",
+    "pool": SERVIDOR_SINCRONO % "pool",
+    "async": (
+        "import sys, asyncio; sys.path.insert(0, {src!r}); "
+        "from servidor_async import ServidorAsync; from logs import RegistroLogs; "
+        "asyncio.run(ServidorAsync(sys.argv[1], int(sys.argv[2]), "
+        "logs=RegistroLogs(console=False), arquivo_captura=sys.argv[3] or None, "
+        "**{admissao!r}).iniciar())"
+    ),
+}
+RECUSAS = (OCUPADO, SOBRECARREGADO)  # ERROs de admissão, contados à parte dos erros reais
+
+CONEXOES_SIMULTANEAS = 200  # conexões de dispositivos abertas ao mesmo tempo na subida
+TENTATIVAS_CONEXAO = 10
+DESCRITORES = 65536         # limite de arquivos abertos pedido quando o máximo do sistema é ilimitado
+
+# --- Medições do processo do servidor (Linux, via /proc) ---
+
+def rss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+def tempo_cpu(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        return (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+def liberar_descritores():
+    """
+    Sobe o limite de arquivos abertos do processo até o máximo permitido
+    (milhares de sockets no mesmo processo). Sem `resource` (ex: Windows),
+    ou se o sistema recusar, fica o limite atual.
+    """
+    if resource is None:
+        return
+    atual, maximo = resource.getrlimit(resource.RLIMIT_NOFILE)
+    alvo = DESCRITORES if maximo == resource.RLIM_INFINITY else maximo
+    if atual != resource.RLIM_INFINITY and atual < alvo:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (alvo, maximo))
+        except (ValueError, OSError):
+            pass
+
+def contar_erro(resposta, resultado):
+    if resposta.get("codigo") in RECUSAS:
+        resultado["recusas"] += 1
+    else:
+        resultado["erros"] += 1
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+# --- Dispositivos simulados ---
+
+async def dispositivo_simulado(nome, host, port, prontos, limite, estatisticas):
+    """
+    Lâmpada mínima: registra, confirma e responde comandos sem imprimir nada,
+    para que milhares caibam em um único processo.
+    """
+    registro = (json.dumps({"tipo": "REGISTRO", "dispositivo": nome,
+                            "dados": {"tipo": "LAMPADA"}}) + "\n").encode('utf-8')
+    async with limite:
+        for tentativa in range(TENTATIVAS_CONEXAO):
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(registro)
+                confirmacao = await reader.readline()
+                if confirmacao:
+                    break
+            except ConnectionError:
+                pass
+            # Fila de conexões do servidor cheia: tenta de novo um pouco depois
+            estatisticas["reconexoes"] += 1
+            await asyncio.sleep(0.05 * (tentativa + 1))
+        else:
+            raise ConnectionError(f"{nome} não conseguiu se registrar")
+    prontos.append(nome)
+
+    estado = False
+    while True:
+        data = await reader.readline()
+        if not data:
+            break
+        comando = json.loads(data)
+        if comando["dados"] == "LIGAR":
+            estado = True
+        elif comando["dados"] == "DESLIGAR":
+            estado = False
+        resposta = {"tipo": "RESPOSTA", "dispositivo": nome,
+                    "dados": "LIGADA" if estado else "DESLIGADA", "id": comando.get("id")}
+        writer.write((json.dumps(resposta) + "\n").encode('utf-8'))
+
+async def gateway_simulado(nome, dispositivos, host, port, prontos):
+    """
+    Um gateway com vários dispositivos em uma única conexão (só no servidor async).
+    """
+    gateway = Gateway(nome, dispositivos, host, port)
+    await gateway.registrar()
+    prontos.extend(dispositivos)
+    await gateway.atender()
+
+# --- Painéis ---
+
+async def painel_simulado(host, port, dispositivos, comandos, pesos, janela, fim, resultado):
+    """
+    Painel em malha fechada: mantém até `janela` comandos em andamento e
+    envia um novo assim que cada resposta chega, até o prazo `fim`.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 24)
+    latencias = resultado["latencias"]
+
+    pendentes = {}
+    ids = itertools.count(1)
+
+    async def ler():
+        while True:
+            data = await reader.readline()
+            if not data:
+                break
+            resposta = json.loads(data)
+            futuro = pendentes.pop(resposta.get("id"), None)
+            if futuro and not futuro.done():
+                futuro.set_result(resposta)
+
+    async def trabalhador():
+        while time.perf_counter() < fim:
+            id_comando = next(ids)
+            futuro = asyncio.get_running_loop().create_future()
+            pendentes[id_comando] = futuro
+            msg = {"tipo": "COMANDO", "dispositivo": random.choice(dispositivos),
+                   "dados": random.choices(comandos, pesos)[0], "id": id_comando}
+            inicio = time.perf_counter()
+            writer.write((json.dumps(msg) + "\n").encode('utf-8'))
+            resposta = await futuro
+            latencias.append(time.perf_counter() - inicio)
+            if resposta.get("tipo") == "ERRO":
+                contar_erro(resposta, resultado)
+
+    leitor = asyncio.create_task(ler())
+    await asyncio.gather(*(trabalhador() for _ in range(janela)))
+    leitor.cancel()
+
+    writer.close()
+
+# --- Execução ---
+
+def iniciar_servidor(servidor, host, port, captura=None):
+    codigo = SERVIDORES[servidor].format(raiz=RAIZ, src=SRC, admissao=ADMISSAO_LIVRE)
+    processo = subprocess.Popen([sys.executable, "-c", codigo, host, str(port), captura or ""],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Aguarda a porta aceitar conexões
+    for _ in range(100):
+        try:
+            socket.create_connection((host, port), timeout=0.1).close()
+            return processo
+        except OSError:
+            time.sleep(0.05)
+    processo.kill()
+    raise RuntimeError(f"Servidor '{servidor}' não subiu em {host}:{port}")
+
+async def executar(args, processo):
+    pid = processo.pid
+    rss_inicial = rss_kib(pid)
+
+    # Subida dos dispositivos
+    prontos = []
+    estatisticas = {"reconexoes": 0}
+    limite = asyncio.Semaphore(CONEXOES_SIMULTANEAS)
+    nomes = [f"LAMPADA_{i + 1}" for i in range(args.dispositivos)]
+    inicio = time.perf_counter()
+    if args.gateway:
+        tarefas = [asyncio.create_task(gateway_simulado(f"GATEWAY_{i + 1}", nomes[i:i + args.gateway],
+                                                        args.host, args.port, prontos))
+                  for i in range(0, len(nomes), args.gateway)]
+    else:
+        tarefas = [asyncio.create_task(dispositivo_simulado(nome, args.host, args.port,
+                                                            prontos, limite, estatisticas))
+                  for nome in nomes]
+    while len(prontos) < len(nomes):
+        await asyncio.sleep(0.01)
+        falhas = [t for t in tarefas if t.done() and t.exception()]
+        if falhas:
+            raise falhas[0].exception()
+    tempo_subida = time.perf_counter() - inicio
+    await asyncio.sleep(0.2)
+    rss_conectado = rss_kib(pid)
+
+    # Carga
+    comandos = list(args.mix)
+    pesos = [args.mix[c] for c in comandos]
+    resultado = {"latencias": [], "erros": 0, "recusas": 0}
+    cpu_inicial = tempo_cpu(pid)
+    inicio = time.perf_counter()
+    fim = inicio + args.duracao
+    await asyncio.gather(*(
+        painel_simulado(args.host, args.port, nomes, comandos, pesos,
+                        args.janela, fim, resultado)
+        for _ in range(args.paineis)
+    ))
+    duracao = time.perf_counter() - inicio
+    cpu_final = tempo_cpu(pid)
+
+    for tarefa in tarefas:
+        tarefa.cancel()
+
+    latencias = sorted(resultado["latencias"])
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    memoria = None
+    if rss_inicial is not None and rss_conectado is not None:
+        memoria = round((rss_conectado - rss_inicial) * 1024 / args.dispositivos)
+    cpu = None
+    if cpu_inicial is not None and cpu_final is not None:
+        cpu = round((cpu_final - cpu_inicial) / duracao * 100, 1)
+
+    return {
+        "servidor": args.servidor,
+        "dispositivos": args.dispositivos,
+        "paineis": args.paineis,
+        "janela": args.janela,
+        "mix": args.mix,
+        "duracao_s": round(duracao, 3),
+        "comandos": len(latencias),
+        "erros": resultado["erros"],
+        "recusas": resultado["recusas"],
+        "vazao_cmd_s": round(len(latencias) / duracao, 1),
+        "latencia_ms": {
+            "p50": ms(percentil(latencias, 50)),
+            "p95": ms(percentil(latencias, 95)),
+            "p99": ms(percentil(latencias, 99)),
+            "max": ms(latencias[-1] if latencias else None),
+        },
+        "gateway": args.gateway,
+        "conexoes_s": round(args.dispositivos / tempo_subida, 1),
+        "reconexoes": estatisticas["reconexoes"],
+        "memoria_por_conexao_bytes": memoria,
+        "cpu_servidor_pct": cpu,
+    }
+
+def ler_mix(texto):
+    """
+    Converte "LIGAR=1,DESLIGAR=1,STATUS=8" em {"LIGAR": 1.0, ...}.
+    """
+    mix = {}
+    for parte in texto.split(","):
+        comando, _, peso = parte.partition("=")
+        mix[comando.strip().upper()] = float(peso or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera carga contra um servidor local e mede desempenho.")
+    parser.add_argument("--servidor", choices=sorted(SERVIDORES), default="async")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--dispositivos", type=int, default=1000)
+    parser.add_argument("--paineis", type=int, default=10)
+    parser.add_argument("--janela", type=int, default=1,
+                        help="comandos em andamento por painel")
+    parser.add_argument("--gateway", type=int, default=0,
+                        help="dispositivos por gateway (0 = uma conexão por dispositivo; só no servidor async)")
+    parser.add_argument("--duracao", type=float, default=10.0, help="segundos de carga")
+    parser.add_argument("--mix", type=ler_mix, default=ler_mix("LIGAR=1,DESLIGAR=1,STATUS=8"))
+    parser.add_argument("--saida", help="arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument("--captura", help="grava o tráfego do servidor neste arquivo (ver reproducao.py)")
+    args = parser.parse_args()
+
+    liberar_descritores()
+    processo = iniciar_servidor(args.servidor, args.host, args.port, args.captura)
+    try:
+        resultado = asyncio.run(executar(args, processo))
+        if args.captura:
+            time.sleep(3 * INTERVALO_GRAVACAO)  # a thread de captura do servidor grava o que faltou
+    finally:
+        processo.kill()
+        processo.wait()
+
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            f.write(texto + "\n")
+    print(texto)
+
+if __name__ == "__main__":
+    main()
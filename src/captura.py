@@ -0,0 +1,107 @@
+import atexit
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+
+INTERVALO_GRAVACAO = 0.2  # segundos em que os quadros se acumulam antes de uma escrita
+
+MAGICO = b"CAPT\x01"  # início do arquivo: formato e versão
+
+# Registro da captura:
+# instante (8, segundos desde o início) | conexão (4) | evento (1) | tamanho (4) | quadro
+REGISTRO_CAPTURA = struct.Struct('!dIBI')
+
+# Eventos
+ABERTURA, ENTRADA, SAIDA, FECHAMENTO = range(4)
+EVENTOS = ("abertura", "entrada", "saida", "fechamento")
+
+class Captura:
+    """
+    Captura opcional do tráfego de um servidor: cada quadro recebido ou
+    enviado vira um registro binário com o instante, a conexão e o
+    sentido, sem o enquadramento (o "\\n" ou o prefixo de tamanho). Os
+    registros vão para um buffer e uma thread grava em lotes, como o
+    diário de persistência; quem captura não espera o disco.
+    """
+    def __init__(self, caminho, intervalo=INTERVALO_GRAVACAO):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.lock = threading.Lock()          # protege o buffer
+        self.lock_arquivo = threading.Lock()  # uma gravação por vez (thread ou fechar)
+        self.buffer = bytearray(MAGICO)
+        self.tem_dados = threading.Event()
+        self.ids = itertools.count(1)
+        self.inicio = time.perf_counter()
+        self.fechado = False
+        self.arquivo = open(caminho, 'wb')
+        self.thread = threading.Thread(target=self.gravar, name="captura", daemon=True)
+        self.thread.start()
+        atexit.register(self.fechar)
+
+    def abrir(self):
+        """
+        Nova conexão: retorna o id usado nos registros dela.
+        """
+        id_conexao = next(self.ids)
+        self.registrar(id_conexao, ABERTURA)
+        return id_conexao
+
+    def registrar(self, id_conexao, evento, quadro=b""):
+        if self.fechado:
+            return
+        instante = time.perf_counter() - self.inicio
+        with self.lock:
+            self.buffer += REGISTRO_CAPTURA.pack(instante, id_conexao, evento, len(quadro))
+            self.buffer += quadro
+        self.tem_dados.set()
+
+    def gravar(self):
+        while not self.fechado:
+            self.tem_dados.wait()
+            time.sleep(self.intervalo)
+            self.descarregar()
+
+    def descarregar(self):
+        with self.lock_arquivo:
+            with self.lock:
+                self.tem_dados.clear()
+                dados, self.buffer = self.buffer, bytearray()
+            if dados and not self.arquivo.closed:
+                self.arquivo.write(dados)
+                self.arquivo.flush()
+
+    def fechar(self):
+        if self.fechado:
+            return
+        self.fechado = True
+        self.tem_dados.set()
+        self.thread.join(timeout=1)
+        self.descarregar()
+        self.arquivo.close()
+
+def ler_captura(caminho):
+    """
+    Percorre os registros de um arquivo de captura, lido via mmap:
+    gera (instante, conexão, evento, quadro). Um registro incompleto no
+    fim (servidor derrubado no meio de uma escrita) é ignorado.
+    """
+    with open(caminho, 'rb') as arquivo:
+        tamanho = os.fstat(arquivo.fileno()).st_size
+        if tamanho < len(MAGICO):
+            return
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGICO)] != MAGICO:
+                raise ValueError(f"'{caminho}' não é um arquivo de captura.")
+            ler = REGISTRO_CAPTURA.unpack_from
+            cabecalho = REGISTRO_CAPTURA.size
+            pos = len(MAGICO)
+            while pos + cabecalho <= tamanho:
+                instante, id_conexao, evento, n = ler(mm, pos)
+                fim = pos + cabecalho + n
+                if fim > tamanho:
+                    break
+                yield instante, id_conexao, evento, mm[pos + cabecalho:fim]
+                pos = fim
@@ -0,0 +1,91 @@
+import asyncio
+
+ATRASO_MAXIMO = 0              # segundos que um quadro pode esperar por outros (0 = uma volta do loop)
+LIMITE_ALTO = 256 * 1024       # bytes pendentes a partir dos quais quem envia aguarda
+
+class Conexao:
+    """
+    Lado de escrita de uma conexão. Os quadros enviados vão para uma fila e
+    uma tarefa escritora dedicada junta tudo o que estiver pendente em uma
+    única escrita, em vez de um write + drain por mensagem.
+    """
+    def __init__(self, writer, atraso_maximo=ATRASO_MAXIMO, limite_alto=LIMITE_ALTO):
+        self.writer = writer
+        self.atraso_maximo = atraso_maximo
+        self.limite_alto = limite_alto
+        self.quadros = []
+        self.pendente = 0  # bytes na fila ainda não escritos
+        self.fechada = False
+        self.tem_dados = asyncio.Event()
+        self.tem_espaco = asyncio.Event()
+        self.tem_espaco.set()
+        self.tarefa = asyncio.create_task(self.escrever())
+
+    def get_extra_info(self, nome):
+        return self.writer.get_extra_info(nome)
+
+    async def enviar(self, quadro):
+        """
+        Enfileira um quadro já codificado. Só bloqueia quando a fila passa
+        do limite alto, até a tarefa escritora esvaziá-la.
+        """
+        if self.fechada:
+            raise ConnectionResetError("conexão encerrada")
+        self.quadros.append(quadro)
+        self.pendente += len(quadro)
+        self.tem_dados.set()
+        if self.pendente > self.limite_alto:
+            self.tem_espaco.clear()
+            await self.tem_espaco.wait()
+            if self.fechada:
+                raise ConnectionResetError("conexão encerrada")
+
+    async def escrever(self):
+        try:
+            while True:
+                await self.tem_dados.wait()
+                # Dá uma janela curta (no mínimo uma volta do loop) para outros
+                # quadros chegarem e irem na mesma escrita, a não ser que a
+                # fila já esteja cheia.
+                if self.pendente < self.limite_alto:
+                    await asyncio.sleep(self.atraso_maximo)
+                self.tem_dados.clear()
+
+                quadros, self.quadros = self.quadros, []
+                self.pendente = 0
+                self.writer.write(b"".join(quadros))
+                await self.writer.drain()
+                if self.pendente <= self.limite_alto:
+                    self.tem_espaco.set()
+        except (ConnectionError, OSError):
+            self.fechada = True
+            self.tem_espaco.set()
+
+    def abortar(self):
+        """
+        Derruba a conexão na hora, descartando o que estiver na fila
+        (ex: dispositivo que parou de responder).
+        """
+        self.fechada = True
+        self.quadros = []
+        self.writer.transport.abort()
+
+    async def fechar(self):
+        """
+        Escreve o que ainda estiver na fila e fecha a conexão.
+        """
+        self.fechada = True
+        self.tarefa.cancel()
+        try:
+            await self.tarefa
+        except asyncio.CancelledError:
+            pass
+        self.tem_espaco.set()
+        try:
+            if self.quadros and not self.writer.is_closing():
+                self.writer.write(b"".join(self.quadros))
+            self.quadros = []
+            self.writer.close()
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
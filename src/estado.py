@@ -0,0 +1,77 @@
+import time
+
+FRESCOR_STATUS = 5.0  # segundos em que um estado confirmado responde STATUS sem ir ao dispositivo
+
+ESTADOS = ("LIGADA", "DESLIGADA")
+
+class EstadoDispositivo:
+    __slots__ = ("estado", "versao", "confirmado_em")
+
+    def __init__(self, estado, versao=0, confirmado_em=0.0):
+        self.estado = estado
+        self.versao = versao                # incrementa a cada mudança de estado
+        self.confirmado_em = confirmado_em  # time.time() da última RESPOSTA (0 = não confirmado)
+
+class CacheEstados:
+    """
+    Último estado conhecido de cada dispositivo, alimentado pelas
+    RESPOSTAs que passam pelo servidor.
+    """
+    def __init__(self, frescor=FRESCOR_STATUS):
+        self.frescor = frescor
+        self.estados = {}  # {nome: EstadoDispositivo}
+
+    def atualizar(self, nome, estado):
+        """
+        Registra um estado confirmado pelo dispositivo. Retorna a entrada
+        se o estado mudou, ou None se só foi reconfirmado.
+        """
+        if estado not in ESTADOS:
+            return None
+        entrada = self.estados.get(nome)
+        agora = time.time()
+        if entrada is None:
+            entrada = self.estados[nome] = EstadoDispositivo(estado, 1, agora)
+            return entrada
+        entrada.confirmado_em = agora
+        if entrada.estado == estado:
+            return None
+        entrada.estado = estado
+        entrada.versao += 1
+        return entrada
+
+    def restaurar(self, tabela):
+        """
+        Carrega estados salvos ({nome: (estado, versão, confirmado_em)}),
+        ex: do diário de persistência na subida do servidor.
+        """
+        for nome, (estado, versao, confirmado_em) in tabela.items():
+            self.estados[nome] = EstadoDispositivo(estado, versao, confirmado_em)
+
+    def obter(self, nome, frescor=None):
+        """
+        Retorna a entrada se ela foi confirmada dentro da janela de frescor.
+        """
+        entrada = self.estados.get(nome)
+        if entrada is None:
+            return None
+        frescor = self.frescor if frescor is None else frescor
+        if time.time() - entrada.confirmado_em > frescor:
+            return None
+        return entrada
+
+    def remover(self, nome):
+        """
+        Esquece o dispositivo (ex: saiu do registro): o cache não cresce com
+        dispositivos que não voltam, e um que volta começa sem estado velho.
+        """
+        self.estados.pop(nome, None)
+
+    def invalidar(self, nome):
+        """
+        Marca o estado como não confirmado (ex: LIGAR/DESLIGAR em andamento),
+        forçando o próximo STATUS a consultar o dispositivo.
+        """
+        entrada = self.estados.get(nome)
+        if entrada is not None:
+            entrada.confirmado_em = 0.0
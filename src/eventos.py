@@ -0,0 +1,175 @@
+import asyncio
+import collections
+import fnmatch
+
+JANELA_COALESCENCIA = 0.05  # segundos em que mudanças seguidas do mesmo dispositivo viram um só EVENTO
+HISTORICO_EVENTOS = 10000   # eventos guardados para retomada com "desde"
+
+CURINGAS = "*?["
+
+class Assinatura:
+    __slots__ = ("conexao", "alvo", "pendentes", "agendada", "chaves")
+
+    def __init__(self, conexao, alvo):
+        self.conexao = conexao
+        self.alvo = alvo
+        self.pendentes = {}     # {nome: evento} só o mais recente de cada dispositivo
+        self.agendada = False   # envio dos pendentes já agendado
+        self.chaves = []        # [(índice, chave)] onde ela está, para remover sem varrer os índices
+
+class Publicador:
+    """
+    Distribui mudanças de estado para as conexões que fizeram ASSINAR.
+    As assinaturas ficam indexadas por nome, padrão, seletor e "all", então
+    publicar só visita quem se interessa pelo dispositivo: os padrões são
+    achados pelo prefixo literal (antes do primeiro curinga) e os seletores,
+    já quebrados em termos no ASSINAR, pelo primeiro termo de cada
+    cláusula, que o dispositivo tem de ter para casar. Cada mudança
+    recebe um número de sequência; as últimas ficam em um histórico para
+    que um painel que reconectou peça só o que perdeu.
+    """
+    def __init__(self, enviar, registro=None, janela=JANELA_COALESCENCIA, historico=HISTORICO_EVENTOS):
+        self.enviar = enviar    # corrotina (conexao, mensagem) do servidor
+        self.registro = registro  # RegistroDispositivos, para assinaturas por seletor
+        self.janela = janela
+        self.seq = 0
+        self.historico = collections.deque(maxlen=historico)  # eventos em ordem de seq
+        self.assinaturas = {}   # {conexao: Assinatura}
+        self.todos = set()      # assinaturas de "all"
+        self.por_nome = {}      # {nome: {Assinatura}}
+        self.padroes = {}       # {padrão: {Assinatura}}
+        self.prefixos = {}      # {prefixo literal: {padrão}} ex: "LAMPADA_" para "LAMPADA_*"
+        self.seletores = {}     # {seletor: {Assinatura}} ex: "grupo=sala"
+        self.clausulas = {}     # {seletor: cláusulas de RegistroDispositivos.termos}
+        self.por_termo = {}     # {(campo, valor): {seletor}} primeiro termo de cada cláusula
+        self.tarefas = set()
+
+    def assinar(self, conexao, alvo):
+        """
+        Cria (ou substitui) a assinatura da conexão. `alvo` é um nome,
+        uma lista de nomes, "all", um padrão com curingas ou um seletor
+        de atributos. Levanta ValueError se o alvo ou o seletor for inválido.
+        """
+        if not (isinstance(alvo, str) or isinstance(alvo, list) and all(isinstance(nome, str) for nome in alvo)):
+            raise ValueError("\"dispositivo\" deve ser um nome, uma lista de nomes, \"all\", um padrão ou um seletor.")
+        seletor = self.registro is not None and self.registro.eh_seletor(alvo)
+        clausulas = self.registro.termos(alvo) if seletor else None
+        self.remover(conexao)
+        assinatura = self.assinaturas[conexao] = Assinatura(conexao, alvo)
+        if alvo == "all":
+            self.todos.add(assinatura)
+        elif isinstance(alvo, list):
+            for nome in dict.fromkeys(alvo):
+                self.indexar(assinatura, self.por_nome, nome)
+        elif seletor:
+            if alvo not in self.seletores:
+                self.clausulas[alvo] = clausulas
+                for termos in clausulas:
+                    self.por_termo.setdefault(termos[0], set()).add(alvo)
+            self.indexar(assinatura, self.seletores, alvo)
+        elif any(c in alvo for c in CURINGAS):
+            if alvo not in self.padroes:
+                self.prefixos.setdefault(prefixo(alvo), set()).add(alvo)
+            self.indexar(assinatura, self.padroes, alvo)
+        else:
+            self.indexar(assinatura, self.por_nome, alvo)
+        return assinatura
+
+    @staticmethod
+    def indexar(assinatura, indice, chave):
+        indice.setdefault(chave, set()).add(assinatura)
+        assinatura.chaves.append((indice, chave))
+
+    def remover(self, conexao):
+        assinatura = self.assinaturas.pop(conexao, None)
+        if assinatura is None:
+            return
+        self.todos.discard(assinatura)
+        for indice, chave in assinatura.chaves:
+            conjunto = indice[chave]
+            conjunto.discard(assinatura)
+            if conjunto:
+                continue
+            del indice[chave]
+            # Último assinante de um seletor ou padrão: sai também do índice secundário
+            if indice is self.seletores:
+                for termos in self.clausulas.pop(chave):
+                    descartar(self.por_termo, termos[0], chave)
+            elif indice is self.padroes:
+                descartar(self.prefixos, prefixo(chave), chave)
+
+    def interessados(self, nome):
+        interessados = set(self.todos)
+        interessados.update(self.por_nome.get(nome, ()))
+        if self.prefixos:
+            for fim in range(len(nome) + 1):
+                for padrao in self.prefixos.get(nome[:fim], ()):
+                    if fnmatch.fnmatchcase(nome, padrao):
+                        interessados.update(self.padroes[padrao])
+        if self.por_termo:
+            chaves = self.registro.chaves_de(nome)
+            candidatos = set()
+            for chave in chaves:
+                candidatos.update(self.por_termo.get(chave, ()))
+            for seletor in candidatos:
+                if self.registro.casa_chaves(chaves, self.clausulas[seletor]):
+                    interessados.update(self.seletores[seletor])
+        return interessados
+
+    def publicar(self, nome, entrada):
+        self.seq += 1
+        evento = {"tipo": "EVENTO", "seq": self.seq, "dispositivo": nome,
+                  "dados": entrada.estado, "versao": entrada.versao}
+        self.historico.append(evento)
+        for assinatura in self.interessados(nome):
+            # Só o último estado de cada dispositivo vai na janela
+            assinatura.pendentes[nome] = evento
+            if not assinatura.agendada:
+                assinatura.agendada = True
+                asyncio.get_running_loop().call_later(self.janela, self.descarregar, assinatura)
+
+    def perdidos(self, assinatura, desde):
+        """
+        Eventos com seq > `desde` que casam com a assinatura (o último de
+        cada dispositivo), ou None se o histórico não cobre mais esse ponto.
+        """
+        if desde > self.seq or (self.historico and desde < self.historico[0]["seq"] - 1):
+            return None
+        recentes = {}
+        for evento in reversed(self.historico):
+            if evento["seq"] <= desde:
+                break
+            if evento["dispositivo"] not in recentes and assinatura in self.interessados(evento["dispositivo"]):
+                recentes[evento["dispositivo"]] = evento
+        return sorted(recentes.values(), key=lambda e: e["seq"])
+
+    def descarregar(self, assinatura):
+        assinatura.agendada = False
+        if self.assinaturas.get(assinatura.conexao) is not assinatura or not assinatura.pendentes:
+            return
+        eventos = sorted(assinatura.pendentes.values(), key=lambda e: e["seq"])
+        assinatura.pendentes = {}
+        tarefa = asyncio.create_task(self.entregar(assinatura.conexao, eventos))
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    async def entregar(self, conexao, eventos):
+        try:
+            for evento in eventos:
+                await self.enviar(conexao, evento)
+        except ConnectionError:
+            self.remover(conexao)
+
+def prefixo(padrao):
+    """
+    Parte literal de um padrão antes do primeiro curinga ("L*" -> "L").
+    """
+    fim = min((i for i in map(padrao.find, CURINGAS) if i >= 0), default=len(padrao))
+    return padrao[:fim]
+
+def descartar(indice, chave, valor):
+    conjunto = indice.get(chave)
+    if conjunto is not None:
+        conjunto.discard(valor)
+        if not conjunto:
+            del indice[chave]
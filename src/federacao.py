@@ -0,0 +1,415 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import signal
+import sys
+
+from conexao import Conexao
+from protocolo import CODEC_JSON, LIMITE_LINHA
+from servidor_async import TIMEOUT_RESPOSTA, ServidorAsync
+
+VNOS = 64                 # pontos de cada nó no anel; mais pontos = carga mais uniforme
+CONEXOES_POR_PAR = 2      # conexões persistentes mantidas com cada outro nó
+RECONEXAO_INICIAL = 0.1   # segundos antes de tentar reabrir um canal (dobra a cada falha)
+RECONEXAO_MAXIMA = 5.0
+
+def hash_anel(chave):
+    return int.from_bytes(hashlib.blake2b(chave.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def endereco_do_no(no):
+    host, _, porta = no.rpartition(":")
+    return host, int(porta)
+
+class AnelConsistente:
+    """
+    Hash consistente: cada nó ocupa `vnos` pontos de um anel de 64 bits e
+    uma chave pertence ao primeiro ponto a partir do seu hash. Quando um
+    nó entra ou sai, só as chaves vizinhas aos pontos dele mudam de dono.
+    """
+    def __init__(self, vnos=VNOS):
+        self.vnos = vnos
+        self.pontos = []  # [(hash, nó)] ordenado pelo hash
+        self.nos = set()
+
+    def adicionar(self, no):
+        if no in self.nos:
+            return False
+        self.nos.add(no)
+        for i in range(self.vnos):
+            bisect.insort(self.pontos, (hash_anel(f"{no}#{i}"), no))
+        return True
+
+    def remover(self, no):
+        if no not in self.nos:
+            return False
+        self.nos.discard(no)
+        self.pontos = [ponto for ponto in self.pontos if ponto[1] != no]
+        return True
+
+    def dono(self, chave):
+        if not self.pontos:
+            return None
+        i = bisect.bisect_left(self.pontos, (hash_anel(chave),))
+        return self.pontos[i % len(self.pontos)][1]
+
+class RoteadorFederacao:
+    """
+    Roteamento entre servidores em nós diferentes (ou em portas diferentes
+    do mesmo host). Cada dispositivo pertence ao nó onde se registrou; o
+    hash consistente do nome escolhe qual nó guarda essa localização (o
+    nó diretório do nome). Um COMANDO para um dispositivo de fora vai ao
+    nó diretório, que executa (se o dispositivo é dele) ou repassa uma vez
+    ao nó onde ele está. "all", padrões e seletores vão a todos os nós.
+
+    Os nós se descobrem a partir das sementes (cada OLA traz os membros
+    conhecidos) e mantêm com cada par um pool de conexões persistentes.
+    Quando um nó entra ou sai do anel, as localizações migram para os
+    novos nós diretório; as de um nó que saiu são descartadas.
+    """
+    def __init__(self, endereco, sementes=(), vnos=VNOS, conexoes_por_par=CONEXOES_POR_PAR):
+        self.endereco = endereco  # (host, porta) onde este nó atende os outros
+        self.no = f"{endereco[0]}:{endereco[1]}"
+        self.sementes = list(sementes)  # ["host:porta", ...]
+        self.conexoes_por_par = conexoes_por_par
+        self.anel = AnelConsistente(vnos)
+        self.anel.adicionar(self.no)
+        self.conhecidos = set()   # nós com canais sendo mantidos
+        self.canais = {}          # {nó: [Conexao]} pool de canais de saída por par
+        self.diretorio = {}       # {nome: nó} dispositivos de outros nós cujo diretório é este
+        self.anunciados = {}      # {nome: nó} dispositivos locais -> nó diretório avisado
+        self.pendentes = {}       # {id: (future, canal)} comandos encaminhados aguardando RESPOSTA
+        self.ids = itertools.count(1)
+        self.vez = itertools.count()  # rodízio entre os canais do pool
+        self.tarefas = set()
+        self.servidor = None
+
+    def log(self, mensagem, *args):
+        self.servidor.log(f"[nó {self.no}] {mensagem}", *args)
+
+    # --- Interface usada pelo ServidorAsync ---
+
+    async def iniciar(self, servidor):
+        self.servidor = servidor
+        await asyncio.start_server(self.tratar_par, *self.endereco, limit=LIMITE_LINHA)
+        for no in self.sementes:
+            self.conhecer(no)
+
+    def localizar(self, nome):
+        no = self.diretorio.get(nome)
+        if no is not None:
+            return no
+        # Sem localização aqui: quem sabe é o nó diretório do nome
+        dono = self.anel.dono(nome)
+        return None if dono == self.no else dono
+
+    def nomes(self):
+        # Não há lista global de nomes: "all" e padrões vão a todos os nós (ver particionar)
+        return ()
+
+    def particionar(self, alvo, alvos):
+        """
+        Separa os alvos de um comando múltiplo em locais e {nó: alvo}.
+        Listas vão por nome ao nó diretório de cada um; "all", padrões e
+        seletores vão inteiros a todos os nós, que resolvem os seus.
+        """
+        if not isinstance(alvo, list):
+            return alvos, {no: alvo for no in self.canais}
+        locais, remotos = [], {}
+        for nome in alvos:
+            dono = None if nome in self.servidor.dispositivos else self.localizar(nome)
+            if dono is None:
+                locais.append(nome)
+            else:
+                remotos.setdefault(dono, []).append(nome)
+        return locais, remotos
+
+    async def registrado(self, nome):
+        self.diretorio.pop(nome, None)
+        dono = self.anel.dono(nome)
+        self.anunciados[nome] = dono
+        if dono != self.no:
+            await self.enviar_par(dono, {"tipo": "LOCALIZACOES", "no": self.no, "dispositivos": [nome]})
+
+    async def removido(self, nome):
+        dono = self.anunciados.pop(nome, None)
+        if dono is not None and dono != self.no:
+            await self.enviar_par(dono, {"tipo": "REMOCOES", "no": self.no, "dispositivos": [nome]})
+
+    async def comandar(self, dono, alvo, dados, timeout=TIMEOUT_RESPOSTA, forcar=False, saltos=0):
+        """
+        Executa o comando no nó `dono`. `alvo` pode ser um nome, uma lista
+        ou um alvo múltiplo ("all", padrão, seletor) resolvido lá.
+        """
+        canal = self.canal(dono)
+        if canal is None:
+            return {"tipo": "ERRO", "dados": f"Nó {dono} indisponível."}
+        id_comando = next(self.ids)
+        futuro = asyncio.get_running_loop().create_future()
+        # A RESPOSTA volta pelo mesmo canal: se ele cair, o comando falha na hora
+        self.pendentes[id_comando] = (futuro, canal)
+        try:
+            enviado = await self.enviar_par(dono, {
+                "tipo": "COMANDO", "dispositivo": alvo, "dados": dados,
+                "timeout": timeout, "forcar": forcar, "saltos": saltos, "id": id_comando
+            }, canal)
+            if not enviado:
+                return {"tipo": "ERRO", "dados": f"Nó {dono} indisponível."}
+            # Margem para o nó remoto (e um eventual repasse) responder o próprio timeout
+            return await asyncio.wait_for(futuro, timeout=timeout + 1 + (saltos == 0))
+        except asyncio.TimeoutError:
+            return {"tipo": "ERRO", "dados": f"Sem resposta do nó {dono}."}
+        finally:
+            self.pendentes.pop(id_comando, None)
+
+    # --- Anel e localizações ---
+
+    def criar_tarefa(self, corrotina):
+        tarefa = asyncio.create_task(corrotina)
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    def conhecer(self, no):
+        if no == self.no or no in self.conhecidos:
+            return
+        self.conhecidos.add(no)
+        for _ in range(self.conexoes_por_par):
+            self.criar_tarefa(self.manter_canal(no))
+
+    def entrar(self, no):
+        if self.anel.adicionar(no):
+            self.log(f"➕ Nó {no} entrou no anel ({len(self.anel.nos)} nós).")
+            self.rebalancear()
+
+    def sair(self, no):
+        if self.anel.remover(no):
+            # Os dispositivos do nó que saiu caíram junto com ele
+            for nome in [n for n, dono in self.diretorio.items() if dono == no]:
+                del self.diretorio[nome]
+            self.log(f"➖ Nó {no} saiu do anel ({len(self.anel.nos)} nós).")
+            self.rebalancear()
+
+    def rebalancear(self):
+        """
+        Depois de uma mudança no anel: esquece as localizações que passaram
+        a outro nó diretório e anuncia os dispositivos locais cujo nó
+        diretório mudou, um lote por nó.
+        """
+        for nome in [n for n in self.diretorio if self.anel.dono(n) != self.no]:
+            del self.diretorio[nome]
+        lotes = {}
+        for nome in self.servidor.dispositivos:
+            dono = self.anel.dono(nome)
+            if self.anunciados.get(nome) != dono:
+                self.anunciados[nome] = dono
+                if dono != self.no:
+                    lotes.setdefault(dono, []).append(nome)
+        for dono, nomes in lotes.items():
+            self.criar_tarefa(self.enviar_par(dono, {"tipo": "LOCALIZACOES", "no": self.no, "dispositivos": nomes}))
+
+    def canal(self, no):
+        """
+        Próximo canal do pool com o nó (rodízio), ou None se não há canal aberto.
+        """
+        canais = self.canais.get(no)
+        return canais[next(self.vez) % len(canais)] if canais else None
+
+    async def enviar_par(self, no, mensagem, canal=None):
+        """
+        Envia pelo `canal` ou por um dos canais do pool com o nó. Retorna
+        False se não há canal aberto.
+        """
+        canal = canal or self.canal(no)
+        if canal is None:
+            return False
+        try:
+            await canal.enviar(CODEC_JSON.codificar(mensagem))
+        except ConnectionError:
+            return False
+        return True
+
+    # --- Canais entre nós ---
+
+    async def manter_canal(self, no):
+        """
+        Mantém um canal de saída para o nó, reabrindo se cair. O primeiro
+        canal aberto põe o nó no anel e reenvia a ele as localizações que
+        lhe cabem; sem nenhum canal e sem conseguir reconectar, ele sai.
+        """
+        espera = RECONEXAO_INICIAL
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(*endereco_do_no(no), limit=LIMITE_LINHA)
+            except OSError:
+                if not self.canais.get(no):
+                    self.sair(no)
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, RECONEXAO_MAXIMA)
+                continue
+            espera = RECONEXAO_INICIAL
+
+            canal = Conexao(writer)
+            canais = self.canais.setdefault(no, [])
+            canais.append(canal)
+            await canal.enviar(CODEC_JSON.codificar({"tipo": "OLA", "no": self.no, "membros": sorted(self.anel.nos)}))
+            if len(canais) == 1:
+                self.entrar(no)
+                # O nó pode ter reiniciado sem sair do anel: reenvia tudo o que cabe a ele
+                nomes = [nome for nome, dono in self.anunciados.items() if dono == no]
+                if nomes:
+                    await canal.enviar(CODEC_JSON.codificar({"tipo": "LOCALIZACOES", "no": self.no, "dispositivos": nomes}))
+            try:
+                while True:
+                    resposta = await CODEC_JSON.ler(reader)
+                    if resposta is None:
+                        break
+                    futuro, _ = self.pendentes.pop(resposta.get("id"), (None, None))
+                    if futuro is not None and not futuro.done():
+                        futuro.set_result(resposta)
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                canais.remove(canal)
+                if not canais:
+                    self.canais.pop(no, None)
+                self.falhar_pendentes(canal, no)
+                await canal.fechar()
+            self.log(f"⚠️ Canal com o nó {no} encerrado; reconectando...")
+            await asyncio.sleep(RECONEXAO_INICIAL)
+
+    def falhar_pendentes(self, canal, no):
+        """
+        Responde com ERRO, sem esperar o timeout, os comandos cuja RESPOSTA
+        viria pelo canal que caiu.
+        """
+        for id_comando, (futuro, usado) in list(self.pendentes.items()):
+            if usado is canal:
+                del self.pendentes[id_comando]
+                if not futuro.done():
+                    futuro.set_result({"tipo": "ERRO", "dados": f"Conexão com o nó {no} perdida."})
+
+    async def tratar_par(self, reader, writer):
+        """
+        Trata mensagens recebidas de outro nó: membros do anel, localizações
+        e comandos encaminhados, respondidos pelo mesmo canal.
+        """
+        canal = Conexao(writer)
+        try:
+            while True:
+                mensagem = await CODEC_JSON.ler(reader)
+                if mensagem is None:
+                    break
+                tipo = mensagem.get("tipo")
+                no = mensagem.get("no")
+
+                if tipo == "OLA":
+                    for membro in [no] + mensagem.get("membros", []):
+                        self.conhecer(membro)
+                elif tipo == "LOCALIZACOES":
+                    for nome in mensagem["dispositivos"]:
+                        if nome not in self.servidor.dispositivos:
+                            self.diretorio[nome] = no
+                elif tipo == "REMOCOES":
+                    for nome in mensagem["dispositivos"]:
+                        if self.diretorio.get(nome) == no:
+                            del self.diretorio[nome]
+                elif tipo == "COMANDO":
+                    self.criar_tarefa(self.executar_remoto(mensagem, canal))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            await canal.fechar()
+
+    async def executar_remoto(self, mensagem, canal):
+        alvo = mensagem["dispositivo"]
+        args = (mensagem["dados"], mensagem["timeout"], mensagem["forcar"])
+        # Só o primeiro nó repassa: quem recebe um repasse responde com o que tem
+        repassar = mensagem.get("saltos", 0) == 0
+        if isinstance(alvo, list):
+            resposta = await self.executar_lista(alvo, args, repassar)
+        elif self.servidor.eh_multiplo(alvo):
+            resposta = await self.servidor.comandar_varios(alvo, *args, somente_local=True)
+        elif repassar and alvo not in self.servidor.dispositivos and self.diretorio.get(alvo) in self.canais:
+            resposta = await self.comandar(self.diretorio[alvo], alvo, *args, saltos=1)
+        else:
+            resposta = await self.servidor.comandar_dispositivo(alvo, *args)
+        resposta = dict(resposta, id=mensagem["id"])
+        try:
+            await canal.enviar(CODEC_JSON.codificar(resposta))
+        except ConnectionError:
+            pass
+
+    async def executar_lista(self, alvo, args, repassar):
+        # Nomes deste nó diretório que estão em outros nós vão em um repasse por nó
+        repasses = {}
+        if repassar:
+            for nome in alvo:
+                no = None if nome in self.servidor.dispositivos else self.diretorio.get(nome)
+                if no in self.canais:
+                    repasses.setdefault(no, []).append(nome)
+        if not repasses:
+            return await self.servidor.comandar_varios(alvo, *args, somente_local=True)
+
+        repassados = {nome for nomes in repasses.values() for nome in nomes}
+        locais = [nome for nome in alvo if nome not in repassados]
+        respostas = await asyncio.gather(
+            self.servidor.comandar_varios(locais, *args, somente_local=True),
+            *(self.comandar(no, nomes, *args, saltos=1) for no, nomes in repasses.items())
+        )
+        resultados = dict(respostas[0]["dados"])
+        for nomes, resposta in zip(repasses.values(), respostas[1:]):
+            if resposta.get("tipo") == "RESPOSTA":
+                resultados.update(resposta["dados"])
+            else:
+                for nome in nomes:
+                    resultados[nome] = {"status": "erro", "dados": resposta.get("dados")}
+        return {
+            "tipo": "RESPOSTA",
+            "dispositivo": alvo,
+            "dados": resultados,
+            "total": len(resultados),
+            "falhas": sum(1 for r in resultados.values() if r["status"] == "erro")
+        }
+
+# --- Processos ---
+
+def rodar_no(host, port, endereco_par, sementes):
+    roteador = RoteadorFederacao(endereco_par, sementes)
+    servidor = ServidorAsync(host, port, roteador=roteador)
+    asyncio.run(servidor.iniciar())
+
+def rodar_nos(nos, host='127.0.0.1', port=5000, porta_par=6000):
+    """
+    Sobe `nos` nós federados no mesmo host: clientes nas portas
+    port..port+nos-1 e canais entre nós em porta_par..porta_par+nos-1.
+    Cada nó recebe o primeiro como semente.
+    """
+    semente = f"{host}:{porta_par}"
+    processos = [
+        multiprocessing.Process(target=rodar_no, args=(host, port + i, (host, porta_par + i), [semente]), daemon=True)
+        for i in range(nos)
+    ]
+    for processo in processos:
+        processo.start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for processo in processos:
+            processo.join()
+    except (KeyboardInterrupt, SystemExit):
+        for processo in processos:
+            processo.terminate()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor assíncrono federado (vários nós em um anel).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000, help="porta dos clientes")
+    parser.add_argument("--par", type=int, default=6000, help="porta dos canais entre nós")
+    parser.add_argument("--sementes", nargs="*", default=[], help="outros nós (host:porta_par)")
+    parser.add_argument("--nos", type=int, default=1, help="sobe N nós locais em portas consecutivas")
+    args = parser.parse_args()
+    if args.nos > 1:
+        rodar_nos(args.nos, args.host, args.port, args.par)
+    else:
+        rodar_no(args.host, args.port, (args.host, args.par), args.sementes)
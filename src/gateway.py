@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+
+from conexao import Conexao
+from lampada_async import INTERVALO_PING, pulsar
+from protocolo import CODEC_JSON, CODIFICACAO_BINARIA, CODIFICACAO_JSON, LIMITE_LINHA, CodecBinario
+
+RESPOSTAS = {"LIGAR": "LIGADA", "DESLIGAR": "DESLIGADA"}
+
+class Gateway:
+    """
+    Hub que hospeda muitas lâmpadas em um único processo e as registra no
+    servidor por uma única conexão. Cada lâmpada é só um byte de estado em
+    uma tabela; o servidor roteia os comandos pelo "dispositivo" (JSON) ou
+    pelo handle (binário) de cada uma.
+    """
+    def __init__(self, nome, dispositivos, host='127.0.0.1', port=5000, codificacao=CODIFICACAO_BINARIA,
+                 intervalo_ping=INTERVALO_PING, atributos=None):
+        self.nome = nome
+        self.host = host
+        self.port = port
+        self.codificacao = codificacao
+        self.intervalo_ping = intervalo_ping
+        self.atributos = atributos or {}  # {nome: {"tags": [...], "grupos": [...]}} opcional
+        self.indices = {nome: i for i, nome in enumerate(dict.fromkeys(dispositivos))}  # {nome: posição}
+        self.estados = bytearray(len(self.indices))  # 0 = DESLIGADA, 1 = LIGADA
+        self.reader = None
+        self.conexao = None
+        self.codec = CODEC_JSON
+
+    def estado(self, nome):
+        return "LIGADA" if self.estados[self.indices[nome]] else "DESLIGADA"
+
+    def processar(self, comando):
+        """
+        Mesma máquina de estados da LampadaAsync, sem saída no console.
+        """
+        nome = comando["dispositivo"]
+        indice = self.indices.get(nome)
+        if indice is None:
+            return None
+        acao = comando["dados"]
+        if acao == "LIGAR" or acao == "DESLIGAR":
+            self.estados[indice] = acao == "LIGAR"
+            dados = RESPOSTAS[acao]
+        elif acao == "STATUS":
+            dados = "LIGADA" if self.estados[indice] else "DESLIGADA"
+        else:
+            dados = "COMANDO DESCONHECIDO"
+        resposta = {"tipo": "RESPOSTA", "dispositivo": nome, "dados": dados}
+        if "id" in comando:
+            resposta["id"] = comando["id"]
+        return resposta
+
+    async def registrar(self):
+        """
+        Abre a conexão e registra todas as lâmpadas em um único REGISTRO.
+        """
+        # A confirmação traz um handle por lâmpada: pode passar dos 64 KiB padrão
+        self.reader, writer = await asyncio.open_connection(self.host, self.port, limit=LIMITE_LINHA)
+        self.conexao = Conexao(writer)
+        await self.conexao.enviar(CODEC_JSON.codificar({
+            "tipo": "REGISTRO",
+            "dispositivo": self.nome,
+            # Com atributos por lâmpada vai {nome: dados}; senão, a lista de nomes
+            "dispositivos": ({nome: dict(self.atributos.get(nome, {}), tipo="LAMPADA") for nome in self.indices}
+                             if self.atributos else list(self.indices)),
+            "dados": {"tipo": "LAMPADA"},
+            "codificacao": self.codificacao,
+            "intervalo_ping": self.intervalo_ping
+        }))
+
+        confirmacao = await CODEC_JSON.ler(self.reader)
+        if not confirmacao or confirmacao.get("status") != "OK":
+            await self.conexao.fechar()
+            raise ConnectionError(f"Registro do gateway {self.nome} recusado: {confirmacao}")
+        if confirmacao.get("codificacao") == CODIFICACAO_BINARIA:
+            handles = confirmacao["handles"]
+            self.codec = CodecBinario({h: nome for nome, h in handles.items()}, handles)
+        self.intervalo_ping = confirmacao.get("intervalo_ping", self.intervalo_ping)
+
+    async def atender(self):
+        """
+        Responde os comandos até o servidor encerrar a conexão. Um único
+        PING mantém vivas todas as lâmpadas do gateway.
+        """
+        ping = asyncio.create_task(pulsar(self.conexao, self.codec.codificar({"tipo": "PING", "dispositivo": self.nome}),
+                                          self.intervalo_ping))
+        try:
+            while True:
+                comando = await self.codec.ler(self.reader)
+                if comando is None:
+                    print(f"⚠️ [{self.nome}] Conexão encerrada.")
+                    break
+                resposta = self.processar(comando)
+                if resposta is not None:
+                    await self.conexao.enviar(self.codec.codificar(resposta))
+        except ConnectionError as e:
+            print(f"❌ [{self.nome}] Erro: {e}")
+        finally:
+            ping.cancel()
+            await self.conexao.fechar()
+
+    async def conectar(self):
+        await self.registrar()
+        print(f"🔗 Gateway {self.nome} conectado ({self.codec.codificacao}) com {len(self.indices)} lâmpadas.")
+        await self.atender()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gateway que hospeda muitas lâmpadas em uma conexão.")
+    parser.add_argument("--nome", default="GATEWAY_1")
+    parser.add_argument("--lampadas", type=int, default=1000)
+    parser.add_argument("--prefixo", default="LAMPADA_")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--codificacao", choices=(CODIFICACAO_BINARIA, CODIFICACAO_JSON), default=CODIFICACAO_BINARIA)
+    args = parser.parse_args()
+    nomes = [f"{args.prefixo}{i + 1}" for i in range(args.lampadas)]
+    asyncio.run(Gateway(args.nome, nomes, args.host, args.port, args.codificacao).conectar())
@@ -1,56 +1,170 @@
 import asyncio
-import json
+
+from conexao import Conexao
+from protocolo import CODEC_JSON, CODIFICACAO_BINARIA, CODIFICACAO_JSON, CodecBinario
+from reconexao import espera_reconexao
+
+INTERVALO_PING = 10  # segundos entre PINGs propostos ao servidor no REGISTRO
 
 class LampadaAsync:
-    def __init__(self, nome):
+    def __init__(self, nome, host='127.0.0.1', port=5000, codificacao=CODIFICACAO_JSON,
+                 intervalo_ping=INTERVALO_PING, tags=None, grupos=None, verbosa=True, reconectar=True):
         self.nome = nome
+        self.host = host
+        self.port = port
+        self.codificacao = codificacao
+        self.intervalo_ping = intervalo_ping
+        self.tags = list(tags or [])
+        self.grupos = list(grupos or [])  # ex: ["sala", "andar_1"]
         self.estado = False
+        self.verbosa = verbosa  # False = sem mensagens no console (muitas lâmpadas simuladas)
+        self.reconectar = reconectar  # volta a se registrar quando a conexão cai
+        self.sessao = None  # token da sessão, reenviado no REGISTRO para retomá-la
+        self.reader = None
+        self.conexao = None
+        self.codec = CODEC_JSON
+        self.intervalo_negociado = intervalo_ping
+
+    def mostrar(self, mensagem):
+        if self.verbosa:
+            print(mensagem)
+
+    def processar(self, comando):
+        """
+        Executa o comando recebido e monta a RESPOSTA, repetindo o "id"
+        do comando para que o servidor possa correlacioná-la.
+        """
+        if comando["dados"] == "LIGAR":
+            self.estado = True
+            resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "LIGADA"}
+            self.mostrar(f"💡 [{self.nome}] foi LIGADA")
+        elif comando["dados"] == "DESLIGAR":
+            self.estado = False
+            resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "DESLIGADA"}
+            self.mostrar(f"💡 [{self.nome}] foi DESLIGADA")
+        elif comando["dados"] == "STATUS":
+            estado_str = "LIGADA" if self.estado else "DESLIGADA"
+            resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": estado_str}
+            self.mostrar(f"💡 [{self.nome}] STATUS: {estado_str}")
+        else:
+            resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "COMANDO DESCONHECIDO"}
+            self.mostrar(f"❓ [{self.nome}] Comando desconhecido recebido.")
+
+        if "id" in comando:
+            resposta["id"] = comando["id"]
+        return resposta
 
     async def conectar(self):
-        reader, writer = await asyncio.open_connection('127.0.0.1', 5000)
+        try:
+            await self.registrar()
+        except OSError as e:
+            print(f"❌ [{self.nome}] Falha ao conectar: {e}")
+            if not self.reconectar:
+                return
+        await self.manter()
+
+    async def manter(self):
+        """
+        Atende a conexão registrada. Se ela cai (ou nem abriu) e reconectar
+        está ligado, registra de novo, retomando a sessão, depois de uma
+        espera com backoff exponencial e jitter (ver reconexao).
+        """
+        tentativa = 0
+        while True:
+            if self.conexao is not None:
+                await self.atender()
+                tentativa = 0
+            if not self.reconectar:
+                return
+            espera = espera_reconexao(tentativa)
+            tentativa += 1
+            self.mostrar(f"🔄 [{self.nome}] Reconectando em {espera:.1f} s...")
+            await asyncio.sleep(espera)
+            try:
+                await self.registrar()
+            except OSError as e:
+                self.mostrar(f"❌ [{self.nome}] Falha ao reconectar: {e}")
+
+    async def registrar(self):
+        """
+        Abre a conexão e envia o REGISTRO. Retorna True quando o servidor
+        confirma; a partir daí a lâmpada já recebe comandos (ver atender).
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conexao = Conexao(writer)
 
         registro = {
             "tipo": "REGISTRO",
             "dispositivo": self.nome,
-            "dados": {"tipo": "LAMPADA"}
+            "dados": {"tipo": "LAMPADA", "tags": self.tags, "grupos": self.grupos},
+            "codificacao": self.codificacao,
+            "intervalo_ping": self.intervalo_ping
         }
-        writer.write((json.dumps(registro) + "\n").encode('utf-8'))
-        await writer.drain()
+        if self.sessao:
+            registro["sessao"] = self.sessao
+        await conexao.enviar(CODEC_JSON.codificar(registro))
 
-        print(f"🔗 {self.nome} conectada e aguardando comandos...")
+        # A confirmação do REGISTRO chega em JSON e traz o handle do dispositivo
+        confirmacao = await CODEC_JSON.ler(reader)
+        if not confirmacao or confirmacao.get("status") != "OK":
+            print(f"❌ [{self.nome}] Registro recusado: {confirmacao}")
+            await conexao.fechar()
+            return False
+        codec = CODEC_JSON
+        if confirmacao.get("codificacao") == CODIFICACAO_BINARIA:
+            handle = confirmacao["handle"]
+            codec = CodecBinario({handle: self.nome}, {self.nome: handle})
+
+        self.reader, self.conexao, self.codec = reader, conexao, codec
+        self.intervalo_negociado = confirmacao.get("intervalo_ping", self.intervalo_ping)
+        self.sessao = confirmacao.get("sessao")
+        retomada = " (sessão retomada)" if confirmacao.get("retomada") else ""
+        self.mostrar(f"🔗 {self.nome} conectada ({codec.codificacao}){retomada} e aguardando comandos...")
+        return True
+
+    async def atender(self):
+        """
+        Responde aos comandos até a conexão fechar.
+        """
+        reader, conexao, codec = self.reader, self.conexao, self.codec
+
+        # Os PINGs mantêm a lâmpada viva no servidor; a leitura abaixo não
+        # precisa de timeout: se o servidor cair, a conexão fecha.
+        ping = asyncio.create_task(pulsar(conexao, codec.codificar({"tipo": "PING", "dispositivo": self.nome}),
+                                          self.intervalo_negociado))
 
         while True:
             try:
-                data = await asyncio.wait_for(reader.readline(), timeout=30)  # ⏱️ timeout de 30s
-                if not data:
-                    print("⚠️ Conexão encerrada.")
+                comando = await codec.ler(reader)
+                if comando is None:
+                    self.mostrar(f"⚠️ [{self.nome}] Conexão encerrada.")
                     break
 
-                comando = json.loads(data.decode('utf-8').strip())
-                print(f"📥 {self.nome} recebeu: {comando}")
-
-                if comando["dados"] == "LIGAR":
-                    self.estado = True
-                    resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "LIGADA"}
-                elif comando["dados"] == "DESLIGAR":
-                    self.estado = False
-                    resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "DESLIGADA"}
-                elif comando["dados"] == "STATUS":
-                    resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "LIGADA" if self.estado else "DESLIGADA"}
-                else:
-                    resposta = {"tipo": "RESPOSTA", "dispositivo": self.nome, "dados": "COMANDO DESCONHECIDO"}
+                self.mostrar(f"📥 {self.nome} recebeu: {comando}")
 
-                writer.write((json.dumps(resposta) + "\n").encode('utf-8'))
-                await writer.drain()
-
-            except asyncio.TimeoutError:
-                print("⏳ Nenhum comando recebido. Mantendo a conexão ativa...")
-                continue  # Continua o loop mesmo sem dados
+                resposta = self.processar(comando)
+                await conexao.enviar(codec.codificar(resposta))
 
             except Exception as e:
                 print(f"❌ Erro: {e}")
                 break
 
+        ping.cancel()
+        self.conexao = None
+        await conexao.fechar()
+
+async def pulsar(conexao, ping, intervalo):
+    """
+    Envia o quadro de PING a cada `intervalo` segundos enquanto a conexão
+    estiver aberta.
+    """
+    try:
+        while True:
+            await asyncio.sleep(intervalo)
+            await conexao.enviar(ping)
+    except ConnectionError:
+        pass
+
 async def main():
     nome = input("Nome do dispositivo (ex: LAMPADA_1): ")
     lampada = LampadaAsync(nome)
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import time
+
+from lampada_async import LampadaAsync
+from logs import AVISO, RegistroLogs
+from prontidao import TIMEOUT_PRONTIDAO
+from servidor_async import ServidorAsync
+
+LAMPADAS_SIMULTANEAS = 500  # REGISTROs em andamento ao mesmo tempo ao subir lâmpadas
+
+async def subir_servidor(servidor, timeout=TIMEOUT_PRONTIDAO):
+    """
+    Inicia o servidor em uma tarefa e retorna quando ele já aceita
+    conexões (servidor.pronto). Levanta a exceção do servidor se ele
+    falhar ao subir (ex: porta em uso) e TimeoutError se não ficar pronto.
+    """
+    tarefa = asyncio.create_task(servidor.iniciar())
+    pronto = asyncio.create_task(servidor.pronto.wait())
+    await asyncio.wait((tarefa, pronto), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    if tarefa.done():
+        pronto.cancel()
+        tarefa.result()  # levanta o erro de inicialização
+        raise RuntimeError("Servidor encerrou durante a inicialização.")
+    if not pronto.done():
+        pronto.cancel()
+        tarefa.cancel()
+        raise TimeoutError(f"Servidor não ficou pronto em {timeout} s.")
+    return tarefa
+
+async def subir_lampadas(lampadas, simultaneas=LAMPADAS_SIMULTANEAS, timeout=TIMEOUT_PRONTIDAO):
+    """
+    Registra as lâmpadas em paralelo, com no máximo `simultaneas` REGISTROs
+    em andamento, e só retorna quando todos foram confirmados ou falharam:
+    a barreira é a espera por todas as confirmações. As registradas seguem
+    atendendo comandos (e reconectando, ver LampadaAsync.manter) em tarefas
+    próprias; as que não subiram são listadas e, com reconectar, continuam
+    tentando com backoff nas mesmas tarefas. Retorna (registradas, tarefas).
+    """
+    limite = asyncio.Semaphore(simultaneas)
+    registradas = []
+
+    async def registrar(lampada):
+        async with limite:
+            try:
+                if await lampada.registrar():
+                    registradas.append(lampada)
+            except OSError as e:
+                print(f"❌ [{lampada.nome}] Falha ao conectar: {e}")
+
+    confirmacoes = [asyncio.create_task(registrar(lampada)) for lampada in lampadas]
+    if confirmacoes:
+        _, atrasadas = await asyncio.wait(confirmacoes, timeout=timeout)
+    else:
+        atrasadas = ()
+    for tarefa in atrasadas:
+        tarefa.cancel()
+    subiram = set(map(id, registradas))
+    falharam = [lampada for lampada in lampadas if id(lampada) not in subiram]
+    if falharam:
+        nomes = ", ".join(str(lampada.nome) for lampada in falharam[:10])
+        print(f"⚠️ {len(falharam)} lâmpadas não se registraram: {nomes}" + ("..." if len(falharam) > 10 else ""))
+    tarefas = [asyncio.create_task(lampada.manter()) for lampada in registradas]
+    tarefas += [asyncio.create_task(lampada.manter()) for lampada in falharam if lampada.reconectar]
+    return registradas, tarefas
+
+async def lancar(host, port, quantidade, simultaneas):
+    # Só avisos e erros no console: milhares de REGISTROs seriam milhares de linhas
+    servidor = ServidorAsync(host, port, logs=RegistroLogs(nivel=AVISO))
+    inicio = time.perf_counter()
+    tarefa_servidor = await subir_servidor(servidor)
+    print(f"🖥️ Servidor pronto em {time.perf_counter() - inicio:.2f} s")
+
+    inicio = time.perf_counter()
+    lampadas = [LampadaAsync(f"LAMPADA_{i}", host, port, verbosa=False) for i in range(1, quantidade + 1)]
+    registradas, tarefas = await subir_lampadas(lampadas, simultaneas)
+    print(f"💡 {len(registradas)}/{quantidade} lâmpadas registradas em {time.perf_counter() - inicio:.2f} s")
+
+    try:
+        await tarefa_servidor  # segue servindo até Ctrl+C
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sobe o servidor assíncrono e N lâmpadas simuladas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--lampadas", type=int, default=1000)
+    parser.add_argument("--simultaneas", type=int, default=LAMPADAS_SIMULTANEAS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(lancar(args.host, args.port, args.lampadas, args.simultaneas))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import atexit
+import collections
+import sys
+import threading
+import time
+from datetime import datetime
+
+# --- Níveis de log ---
+DEBUG = 10
+INFO = 20
+AVISO = 30
+ERRO = 40
+
+CAPACIDADE = 10000       # entradas mantidas em memória (as mais antigas são descartadas)
+INTERVALO_FLUSH = 0.2    # segundos entre escritas em lote do sink
+TAMANHO_LOTE = 1000      # entradas pendentes que antecipam a escrita
+
+class RegistroLogs:
+    """
+    Armazena os logs em um buffer circular de capacidade fixa e entrega as
+    entradas a uma thread de sink, que escreve no console e/ou em arquivo em
+    lotes, fora do caminho de quem chama log(). A thread só sobe no primeiro
+    log() que tem onde escrever e para em fechar(); depois disso as
+    entradas são escritas na hora, sem thread.
+
+    Categorias de alto volume podem ser amostradas: com amostragem
+    {"mensagem": 100} só 1 em cada 100 entradas dessa categoria é mantida.
+    """
+    def __init__(self, capacidade=CAPACIDADE, nivel=INFO, arquivo=None, console=True,
+                 amostragem=None, intervalo_flush=INTERVALO_FLUSH, tamanho_lote=TAMANHO_LOTE):
+        self.entradas = collections.deque(maxlen=capacidade)
+        self.nivel = nivel
+        self.amostragem = dict(amostragem or {})  # {categoria: manter 1 a cada N}
+        self.contagem = collections.Counter()     # entradas vistas por categoria
+        self.arquivo = arquivo
+        self.console = console
+        self.intervalo_flush = intervalo_flush
+        self.tamanho_lote = tamanho_lote
+
+        # Fila para o sink; também limitada para não crescer se o disco travar
+        self.fila = collections.deque(maxlen=capacidade)
+        self.acordar = threading.Event()
+        self.parar = threading.Event()
+        self.sink = None
+        self.fechado = False
+        self.trava = threading.Lock()  # início e parada do sink
+
+    def habilitado(self, nivel=INFO):
+        """
+        Indica se uma entrada seria mantida, para evitar formatar mensagens
+        caras que seriam descartadas.
+        """
+        return nivel >= self.nivel
+
+    def log(self, mensagem, nivel=INFO, categoria=None):
+        if nivel < self.nivel:
+            return
+        if categoria in self.amostragem:
+            self.contagem[categoria] += 1
+            if self.contagem[categoria] % self.amostragem[categoria]:
+                return
+
+        entrada = (time.time(), nivel, categoria, mensagem)
+        self.entradas.append(entrada)
+        if self.console or self.arquivo:
+            self.fila.append(entrada)
+            if self.sink is None:
+                self.iniciar_sink()
+            elif len(self.fila) >= self.tamanho_lote:
+                self.acordar.set()
+
+    def iniciar_sink(self):
+        with self.trava:
+            if self.fechado:
+                self.escrever_lote()
+            elif self.sink is None:
+                self.sink = threading.Thread(target=self.drenar, daemon=True)
+                self.sink.start()
+                atexit.register(self.fechar)
+
+    def recentes(self, quantidade=None):
+        """
+        Retorna as últimas entradas do buffer já formatadas.
+        """
+        entradas = list(self.entradas)
+        if quantidade is not None:
+            entradas = entradas[-quantidade:]
+        return [self.formatar(entrada) for entrada in entradas]
+
+    def formatar(self, entrada):
+        instante, _, _, mensagem = entrada
+        hora = datetime.fromtimestamp(instante).strftime("%H:%M:%S")
+        return f"[{hora}] {mensagem}"
+
+    def drenar(self):
+        while not self.parar.is_set():
+            self.acordar.wait(self.intervalo_flush)
+            self.acordar.clear()
+            self.escrever_lote()
+        self.escrever_lote()
+
+    def escrever_lote(self):
+        linhas = []
+        while self.fila:
+            linhas.append(self.formatar(self.fila.popleft()))
+        if not linhas:
+            return
+        texto = "\n".join(linhas) + "\n"
+        if self.console:
+            sys.stdout.write(texto)
+            sys.stdout.flush()
+        if self.arquivo:
+            with open(self.arquivo, "a", encoding="utf-8") as f:
+                f.write(texto)
+
+    def fechar(self):
+        """
+        Para a thread de sink depois de escrever o que estiver pendente.
+        """
+        with self.trava:
+            self.fechado = True
+            sink, self.sink = self.sink, None
+        if sink is None:
+            return
+        atexit.unregister(self.fechar)
+        self.parar.set()
+        self.acordar.set()
+        sink.join()
@@ -0,0 +1,121 @@
+import asyncio
+import bisect
+
+# Limites (em segundos) dos buckets do histograma de latência
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histograma:
+    """
+    Histograma de buckets fixos: observar() é uma busca binária e um incremento.
+    """
+    def __init__(self, limites=LIMITES_LATENCIA):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)  # o último bucket é +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def percentil(self, p):
+        """
+        Estimativa do percentil p: limite superior do bucket que o contém.
+        """
+        if not self.total:
+            return None
+        alvo = p / 100 * self.total
+        acumulado = 0
+        for limite, contagem in zip(self.limites, self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return limite
+        return float("inf")
+
+    def instantaneo(self):
+        return {
+            "total": self.total,
+            "soma": self.soma,
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "p99": self.percentil(99),
+            "buckets": dict(zip([str(l) for l in self.limites] + ["+Inf"], self.contagens)),
+        }
+
+class Metricas:
+    """
+    Contadores e histogramas em memória. Pensado para o servidor asyncio:
+    tudo roda no mesmo loop, então os incrementos não usam locks.
+    """
+    def __init__(self):
+        self.contadores = {}    # {(nome, rotulo): valor}
+        self.histogramas = {}   # {nome: Histograma}
+
+    def incrementar(self, nome, rotulo=None, valor=1):
+        chave = (nome, rotulo)
+        self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor):
+        histograma = self.histogramas.get(nome)
+        if histograma is None:
+            histograma = self.histogramas[nome] = Histograma()
+        histograma.observar(valor)
+
+    def instantaneo(self, medidores=None):
+        """
+        Fotografia das métricas em um dict serializável em JSON. `medidores`
+        são valores calculados na hora (ex: conexões ativas).
+        """
+        contadores = {}
+        for (nome, rotulo), valor in self.contadores.items():
+            if rotulo is None:
+                contadores[nome] = valor
+            else:
+                contadores.setdefault(nome, {})[rotulo] = valor
+        return {
+            "contadores": contadores,
+            "histogramas": {nome: h.instantaneo() for nome, h in self.histogramas.items()},
+            "medidores": dict(medidores or {}),
+        }
+
+    def texto(self, medidores=None, prefixo="controle"):
+        """
+        Exposição em texto no formato do Prometheus.
+        """
+        linhas = []
+        for (nome, rotulo), valor in sorted(self.contadores.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            rotulos = f'{{rotulo="{rotulo}"}}' if rotulo is not None else ""
+            linhas.append(f"{prefixo}_{nome}_total{rotulos} {valor}")
+        for nome, histograma in sorted(self.histogramas.items()):
+            acumulado = 0
+            for limite, contagem in zip(list(histograma.limites) + ["+Inf"], histograma.contagens):
+                acumulado += contagem
+                linhas.append(f'{prefixo}_{nome}_segundos_bucket{{le="{limite}"}} {acumulado}')
+            linhas.append(f"{prefixo}_{nome}_segundos_sum {histograma.soma}")
+            linhas.append(f"{prefixo}_{nome}_segundos_count {histograma.total}")
+        for nome, valor in sorted((medidores or {}).items()):
+            linhas.append(f"{prefixo}_{nome} {valor}")
+        return "\n".join(linhas) + "\n"
+
+async def servir_http(gerar_texto, host='127.0.0.1', port=9100):
+    """
+    Endpoint HTTP mínimo que responde qualquer GET com gerar_texto().
+    """
+    async def tratar(reader, writer):
+        try:
+            # Descarta a requisição até a linha em branco
+            while (await reader.readline()).strip():
+                pass
+            corpo = gerar_texto().encode('utf-8')
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         + f"Content-Length: {len(corpo)}\r\nConnection: close\r\n\r\n".encode('ascii')
+                         + corpo)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(tratar, host, port)
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+
+from conexao import Conexao
+from protocolo import CODEC_JSON, LIMITE_LINHA
+from servidor_async import TIMEOUT_RESPOSTA, ServidorAsync
+
+INTERVALO_RECONEXAO = 0.1  # segundos entre tentativas de abrir o canal com outro worker
+
+class RoteadorWorkers:
+    """
+    Roteamento entre workers de um mesmo host. Cada worker escuta em um
+    socket Unix próprio e mantém um canal persistente com cada um dos outros.
+
+    O registro dispositivo -> worker é replicado: quando um dispositivo se
+    registra ou sai, o worker dono avisa todos os outros. Um COMANDO para
+    um dispositivo de outro worker é encaminhado pelo canal e a RESPOSTA
+    volta pelo mesmo canal, casada pelo "id".
+    """
+    def __init__(self, indice, total, prefixo):
+        self.indice = indice
+        self.total = total
+        self.prefixo = prefixo
+        self.donos = {}       # {nome: índice do worker} dispositivos remotos
+        self.canais = {}      # {índice: Conexao} canais de saída para os outros workers
+        self.pendentes = {}   # {id: future} comandos encaminhados aguardando RESPOSTA
+        self.ids = itertools.count(1)
+        self.tarefas = set()
+        self.servidor = None
+
+    def caminho(self, indice):
+        return f"{self.prefixo}-{indice}.sock"
+
+    def log(self, mensagem, *args):
+        self.servidor.log(f"[worker {self.indice}] {mensagem}", *args)
+
+    # --- Interface usada pelo ServidorAsync ---
+
+    async def iniciar(self, servidor):
+        self.servidor = servidor
+        caminho = self.caminho(self.indice)
+        if os.path.exists(caminho):
+            os.unlink(caminho)
+        await asyncio.start_unix_server(self.tratar_par, path=caminho, limit=LIMITE_LINHA)
+        for indice in range(self.total):
+            if indice != self.indice:
+                self.criar_tarefa(self.manter_canal(indice))
+
+    def localizar(self, nome):
+        return self.donos.get(nome)
+
+    def nomes(self):
+        return self.donos.keys()
+
+    def particionar(self, alvo, alvos):
+        """
+        Separa os alvos de um comando múltiplo em locais e {worker: [nomes]}.
+        """
+        locais, remotos = [], {}
+        for nome in alvos:
+            dono = None if nome in self.servidor.dispositivos else self.localizar(nome)
+            if dono is None:
+                locais.append(nome)
+            else:
+                remotos.setdefault(dono, []).append(nome)
+        return locais, remotos
+
+    async def registrado(self, nome):
+        self.donos.pop(nome, None)
+        await self.difundir({"tipo": "REGISTRO_REMOTO", "worker": self.indice, "dispositivo": nome})
+
+    async def removido(self, nome):
+        await self.difundir({"tipo": "REMOCAO_REMOTA", "worker": self.indice, "dispositivo": nome})
+
+    async def comandar(self, dono, alvo, dados, timeout=TIMEOUT_RESPOSTA, forcar=False):
+        """
+        Executa o comando no worker `dono`. `alvo` pode ser um nome ou uma
+        lista (a resposta então vem agregada, como em comandar_varios).
+        """
+        canal = self.canais.get(dono)
+        if canal is None:
+            return {"tipo": "ERRO", "dados": f"Worker {dono} indisponível."}
+
+        id_comando = next(self.ids)
+        futuro = asyncio.get_running_loop().create_future()
+        self.pendentes[id_comando] = futuro
+        try:
+            await canal.enviar(CODEC_JSON.codificar({
+                "tipo": "COMANDO", "dispositivo": alvo, "dados": dados,
+                "timeout": timeout, "forcar": forcar, "id": id_comando
+            }))
+            # Margem para o worker remoto responder o próprio timeout
+            return await asyncio.wait_for(futuro, timeout=timeout + 1)
+        except (asyncio.TimeoutError, ConnectionError):
+            return {"tipo": "ERRO", "dados": f"Sem resposta do worker {dono}."}
+        finally:
+            self.pendentes.pop(id_comando, None)
+
+    # --- Canais entre workers ---
+
+    def criar_tarefa(self, corrotina):
+        tarefa = asyncio.create_task(corrotina)
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    async def difundir(self, mensagem):
+        quadro = CODEC_JSON.codificar(mensagem)
+        for canal in list(self.canais.values()):
+            try:
+                await canal.enviar(quadro)
+            except ConnectionError:
+                pass
+
+    async def manter_canal(self, indice):
+        """
+        Mantém o canal de saída para o worker `indice`, reabrindo se cair.
+        Ao abrir, anuncia todos os dispositivos locais.
+        """
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.caminho(indice), limit=LIMITE_LINHA)
+            except OSError:
+                await asyncio.sleep(INTERVALO_RECONEXAO)
+                continue
+
+            canal = Conexao(writer)
+            self.canais[indice] = canal
+            await canal.enviar(CODEC_JSON.codificar({
+                "tipo": "ANUNCIO", "worker": self.indice,
+                "dispositivos": list(self.servidor.dispositivos)
+            }))
+            try:
+                while True:
+                    resposta = await CODEC_JSON.ler(reader)
+                    if resposta is None:
+                        break
+                    futuro = self.pendentes.pop(resposta.get("id"), None)
+                    if futuro is not None and not futuro.done():
+                        futuro.set_result(resposta)
+            except ConnectionError:
+                pass
+            finally:
+                self.canais.pop(indice, None)
+                # O worker caiu: os dispositivos dele caíram junto
+                for nome in [n for n, dono in self.donos.items() if dono == indice]:
+                    del self.donos[nome]
+                await canal.fechar()
+            self.log(f"⚠️ Canal com o worker {indice} encerrado; reconectando...")
+            await asyncio.sleep(INTERVALO_RECONEXAO)
+
+    async def tratar_par(self, reader, writer):
+        """
+        Trata mensagens recebidas de outro worker: atualizações do registro
+        e comandos encaminhados, respondidos pelo mesmo canal.
+        """
+        canal = Conexao(writer)
+        try:
+            while True:
+                mensagem = await CODEC_JSON.ler(reader)
+                if mensagem is None:
+                    break
+                tipo = mensagem.get("tipo")
+                worker = mensagem.get("worker")
+
+                if tipo == "ANUNCIO":
+                    for nome in mensagem["dispositivos"]:
+                        if nome not in self.servidor.dispositivos:
+                            self.donos[nome] = worker
+                elif tipo == "REGISTRO_REMOTO":
+                    self.donos[mensagem["dispositivo"]] = worker
+                elif tipo == "REMOCAO_REMOTA":
+                    if self.donos.get(mensagem["dispositivo"]) == worker:
+                        del self.donos[mensagem["dispositivo"]]
+                elif tipo == "COMANDO":
+                    self.criar_tarefa(self.executar_remoto(mensagem, canal))
+        except ConnectionError:
+            pass
+        finally:
+            await canal.fechar()
+
+    async def executar_remoto(self, mensagem, canal):
+        alvo = mensagem["dispositivo"]
+        args = (mensagem["dados"], mensagem["timeout"], mensagem["forcar"])
+        if isinstance(alvo, list):
+            resposta = await self.servidor.comandar_varios(alvo, *args, somente_local=True)
+        else:
+            resposta = await self.servidor.comandar_dispositivo(alvo, *args)
+        resposta = dict(resposta, id=mensagem["id"])
+        try:
+            await canal.enviar(CODEC_JSON.codificar(resposta))
+        except ConnectionError:
+            pass
+
+# --- Processos ---
+
+def rodar_worker(indice, total, host, port, prefixo):
+    roteador = RoteadorWorkers(indice, total, prefixo)
+    servidor = ServidorAsync(host, port, reuse_port=True, roteador=roteador)
+    asyncio.run(servidor.iniciar())
+
+def rodar_workers(workers, host='127.0.0.1', port=5000):
+    """
+    Sobe `workers` processos aceitando na mesma porta (SO_REUSEPORT).
+    O kernel distribui as conexões entre eles.
+    """
+    prefixo = os.path.join(tempfile.gettempdir(), f"controle-{port}")
+    processos = [
+        multiprocessing.Process(target=rodar_worker, args=(i, workers, host, port, prefixo), daemon=True)
+        for i in range(workers)
+    ]
+    for processo in processos:
+        processo.start()
+    # SIGTERM (ex: supervisor de processos) também derruba os workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for processo in processos:
+            processo.join()
+    except (KeyboardInterrupt, SystemExit):
+        for processo in processos:
+            processo.terminate()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor assíncrono com vários processos worker.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    rodar_workers(args.workers, args.host, args.port)
@@ -1,43 +1,297 @@
 import asyncio
-import json
+import itertools
+
+from admissao import OCUPADO, RAJADA_PAINEL, SOBRECARREGADO, TAXA_PAINEL, TENTAR_EM, BaldeTokens
+from conexao import Conexao
+from protocolo import CODEC_JSON, LIMITE_LINHA
+
+TIMEOUT_COMANDO = 20      # segundos aguardando a resposta de um comando (incluindo reenvios)
+CONCORRENCIA = 256        # comandos em andamento por comandar_lote
+TAMANHO_LOTE = 1000       # dispositivos por COMANDO múltiplo em comandar_varios
+RECONEXAO_INICIAL = 0.1   # segundos antes de tentar reconectar (dobra a cada falha)
+RECONEXAO_MAXIMA = 5.0
+
+def erro(mensagem):
+    return {"tipo": "ERRO", "dados": mensagem}
+
+class ClientePainelAsync:
+    """
+    Cliente de painel para scripts: uma única conexão com muitos comandos
+    em andamento ao mesmo tempo, cada um com seu "id" e um future que a
+    tarefa leitora resolve quando a resposta chega. Timeouts e quedas de
+    conexão voltam como ERRO, no mesmo formato das respostas do servidor;
+    a conexão é refeita sozinha, junto com a assinatura de EVENTOs.
+
+    Os COMANDOs saem no máximo a `taxa` por segundo (por padrão, a mesma
+    que o servidor aceita de cada painel; None = sem limite), e os que
+    ainda assim forem recusados são reenviados até o timeout.
+    """
+    def __init__(self, host='127.0.0.1', port=5000, timeout=TIMEOUT_COMANDO, reconectar=True,
+                 taxa=TAXA_PAINEL, rajada=RAJADA_PAINEL):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reconectar = reconectar
+        self.balde = BaldeTokens(taxa, rajada) if taxa else None
+        self.reader = None
+        self.conexao = None
+        self.pendentes = {}     # {id: future} requisições aguardando resposta
+        self.ids = itertools.count(1)
+        self.conectado = asyncio.Event()
+        self.eventos = asyncio.Queue()  # EVENTOs das assinaturas, na ordem de chegada
+        self.assinatura = None  # alvo do último ASSINAR, refeito ao reconectar
+        self.seq = 0            # seq do último EVENTO recebido
+        self.tarefas = set()    # leitora e reconexão
+        self.retomar_em = 0.0   # após uma recusa, nenhum comando sai antes deste instante (loop.time())
+        self.fechado = False
+
+    async def conectar(self):
+        # Respostas agregadas de muitos dispositivos podem passar dos 64 KiB padrão
+        self.reader, writer = await asyncio.open_connection(self.host, self.port, limit=LIMITE_LINHA)
+        self.conexao = Conexao(writer)
+        self.criar_tarefa(self.ler(self.reader, self.conexao))
+        self.conectado.set()
+
+    def criar_tarefa(self, corrotina):
+        tarefa = asyncio.create_task(corrotina)
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    async def ler(self, reader, conexao):
+        try:
+            while True:
+                mensagem = await CODEC_JSON.ler(reader)
+                if mensagem is None:
+                    break
+                if mensagem.get("tipo") == "EVENTO":
+                    self.seq = max(self.seq, mensagem.get("seq", 0))
+                    self.eventos.put_nowait(mensagem)
+                    continue
+                futuro = self.pendentes.pop(mensagem.get("id"), None)
+                if futuro is not None and not futuro.done():
+                    futuro.set_result(mensagem)
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+        # Quem esperava resposta nesta conexão não vai recebê-la
+        self.conectado.clear()
+        for futuro in self.pendentes.values():
+            if not futuro.done():
+                futuro.set_result(erro("Conexão com o servidor perdida."))
+        self.pendentes.clear()
+        await conexao.fechar()
+        if self.reconectar and not self.fechado:
+            self.criar_tarefa(self.religar())
+
+    async def religar(self):
+        espera = RECONEXAO_INICIAL
+        while not self.fechado:
+            try:
+                await self.conectar()
+            except OSError:
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, RECONEXAO_MAXIMA)
+                continue
+            if self.assinatura is not None:
+                # Pede só os EVENTOs perdidos enquanto estava desconectado
+                await self.assinar(self.assinatura, desde=self.seq)
+            return
+
+    async def requisitar(self, mensagem, timeout=None):
+        """
+        Envia uma mensagem com um "id" novo e aguarda a resposta com esse
+        "id". Se não houver conexão, espera a reconexão dentro do timeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self.conectado.wait(), timeout)
+        except asyncio.TimeoutError:
+            return erro("Sem conexão com o servidor.")
+
+        id_mensagem = next(self.ids)
+        futuro = asyncio.get_running_loop().create_future()
+        self.pendentes[id_mensagem] = futuro
+        try:
+            await self.conexao.enviar(CODEC_JSON.codificar(dict(mensagem, id=id_mensagem)))
+            return await asyncio.wait_for(futuro, timeout)
+        except asyncio.TimeoutError:
+            return erro("Tempo de resposta esgotado.")
+        except ConnectionError:
+            return erro("Conexão com o servidor perdida.")
+        finally:
+            self.pendentes.pop(id_mensagem, None)
+
+    async def comandar(self, dispositivo, dados, timeout=None, forcar=False):
+        """
+        Envia um COMANDO (para um nome, lista, "all", padrão ou seletor) e
+        retorna a RESPOSTA ou o ERRO. Recusas de admissão são reenviadas
+        depois do "tentar_em" indicado pelo servidor, enquanto houver prazo.
+        """
+        loop = asyncio.get_running_loop()
+        prazo = loop.time() + (self.timeout if timeout is None else timeout)
+        mensagem = {"tipo": "COMANDO", "dispositivo": dispositivo, "dados": dados}
+        if forcar:
+            mensagem["forcar"] = True
+        while True:
+            while self.balde and (espera := self.balde.consumir()):
+                await asyncio.sleep(espera)
+            # Uma recusa segura todos os comandos do cliente, não só o recusado
+            while (espera := self.retomar_em - loop.time()) > 0:
+                await asyncio.sleep(espera)
+            resposta = await self.requisitar(mensagem, max(0.0, prazo - loop.time()))
+            if resposta.get("codigo") not in (OCUPADO, SOBRECARREGADO):
+                return resposta
+            tentar_em = resposta.get("tentar_em", TENTAR_EM)
+            if loop.time() + tentar_em >= prazo:
+                return resposta
+            self.retomar_em = max(self.retomar_em, loop.time() + tentar_em)
+
+    async def comandar_lote(self, comandos, concorrencia=CONCORRENCIA, timeout=None):
+        """
+        Executa vários comandos [(dispositivo, dados), ...] com até
+        `concorrencia` em andamento e retorna as respostas na mesma ordem.
+        """
+        limite = asyncio.Semaphore(concorrencia)
+
+        async def executar(dispositivo, dados):
+            async with limite:
+                return await self.comandar(dispositivo, dados, timeout)
+
+        return await asyncio.gather(*(executar(dispositivo, dados) for dispositivo, dados in comandos))
+
+    async def comandar_varios(self, dispositivos, dados, tamanho_lote=TAMANHO_LOTE, timeout=None, forcar=False):
+        """
+        Mesmo comando para uma lista de dispositivos, em COMANDOs múltiplos
+        de até `tamanho_lote` nomes enviados em paralelo. Retorna uma única
+        RESPOSTA agregada, como a do servidor.
+        """
+        lotes = [dispositivos[i:i + tamanho_lote] for i in range(0, len(dispositivos), tamanho_lote)]
+        respostas = await asyncio.gather(*(self.comandar(lote, dados, timeout, forcar) for lote in lotes))
+        resultados = {}
+        for lote, resposta in zip(lotes, respostas):
+            if resposta.get("tipo") == "RESPOSTA":
+                resultados.update(resposta["dados"])
+            else:
+                for nome in lote:
+                    resultados[nome] = {"status": "erro", "dados": resposta.get("dados")}
+        return {
+            "tipo": "RESPOSTA",
+            "dispositivo": dispositivos,
+            "dados": resultados,
+            "total": len(resultados),
+            "falhas": sum(1 for r in resultados.values() if r["status"] == "erro")
+        }
+
+    async def assinar(self, alvo="all", desde=None):
+        """
+        Assina as mudanças de estado de `alvo`; os EVENTOs chegam em
+        `self.eventos`.
+        """
+        mensagem = {"tipo": "ASSINAR", "dispositivo": alvo}
+        if desde is not None:
+            mensagem["desde"] = desde
+        resposta = await self.requisitar(mensagem)
+        if resposta.get("tipo") == "RESPOSTA":
+            self.assinatura = alvo
+            if desde is None:
+                self.seq = resposta.get("seq", self.seq)
+        return resposta
+
+    async def desassinar(self):
+        self.assinatura = None
+        return await self.requisitar({"tipo": "DESASSINAR"})
+
+    async def listar(self, seletor=None, padrao=None, cursor=None, limite=None, desde=None):
+        """
+        Uma página de LISTAR (ver RegistroDispositivos.listar).
+        """
+        mensagem = {"tipo": "LISTAR"}
+        for campo, valor in (("seletor", seletor), ("padrao", padrao), ("cursor", cursor),
+                             ("limite", limite), ("desde", desde)):
+            if valor is not None:
+                mensagem[campo] = valor
+        resposta = await self.requisitar(mensagem)
+        if resposta.get("tipo") == "ERRO":
+            raise ConnectionError(f"LISTAR falhou: {resposta.get('dados')}")
+        return resposta
+
+    async def sincronizar(self, visao, versao=None, seletor=None, padrao=None):
+        """
+        Atualiza `visao` ({nome: atributos}) com os dispositivos do servidor
+        e retorna a versão do registro que ela reflete. Com `versao`, busca
+        só as entradas e saídas posteriores; sem ela (ou se o servidor não
+        tem mais esse histórico), lista tudo de novo, página por página.
+        Levanta ConnectionError se algum LISTAR falhar.
+        """
+        if versao is None:
+            versao = await self.carregar(visao, seletor, padrao)
+        while True:
+            resposta = await self.listar(seletor, padrao, desde=versao)
+            if resposta.get("reinicio"):
+                versao = await self.carregar(visao, seletor, padrao)
+                continue
+            for mudanca in resposta["mudancas"]:
+                if mudanca["evento"] == "entrou":
+                    visao[mudanca["dispositivo"]] = mudanca["dados"]
+                else:
+                    visao.pop(mudanca["dispositivo"], None)
+            versao = resposta["versao"]
+            if not resposta["mais"]:
+                return versao
+
+    async def carregar(self, visao, seletor, padrao):
+        # Entradas e saídas durante a paginação vêm depois, pelo "desde"
+        visao.clear()
+        versao = cursor = None
+        while True:
+            resposta = await self.listar(seletor, padrao, cursor)
+            if versao is None:
+                versao = resposta["versao"]
+            visao.update(resposta["dados"])
+            cursor = resposta["cursor"]
+            if cursor is None:
+                return versao
+
+    async def estatisticas(self):
+        return await self.requisitar({"tipo": "STATS"})
+
+    async def fechar(self):
+        self.fechado = True
+        self.conectado.clear()
+        if self.conexao is not None:
+            await self.conexao.fechar()
+        for tarefa in list(self.tarefas):
+            tarefa.cancel()
 
 async def painel():
-    reader, writer = await asyncio.open_connection('127.0.0.1', 5000)
+    cliente = ClientePainelAsync()
+    await cliente.conectar()
 
     print("⚙️ PAINEL DE CONTROLE ASSÍNCRONO")
     print("Comandos: LIGAR, DESLIGAR, STATUS")
     print("Digite 'SAIR' para fechar.")
 
-    dispositivo = input("Dispositivo: ").strip()
+    dispositivos = {}
+    await cliente.sincronizar(dispositivos)
+    print(f"Dispositivos conectados: {', '.join(dispositivos) or 'nenhum'}")
+
+    # input() roda em outra thread para não parar a leitura nem a reconexão
+    dispositivo = (await asyncio.to_thread(input, "Dispositivo: ")).strip()
 
     while True:
-        comando = input("Comando: ").strip().upper()
+        comando = (await asyncio.to_thread(input, "Comando: ")).strip().upper()
 
         if comando == "SAIR":
             print("🔒 Encerrando painel...")
             break
 
-        msg = {
-            "tipo": "COMANDO",
-            "dispositivo": dispositivo,
-            "dados": comando
-        }
-
-        writer.write((json.dumps(msg) + "\n").encode('utf-8'))
-        await writer.drain()
-
-        try:
-            data = await asyncio.wait_for(reader.readline(), timeout=20)
-            if not data:
-                print("⚠️ Sem resposta, talvez o dispositivo tenha desconectado.")
-                break
-            resposta = json.loads(data.decode('utf-8').strip())
+        resposta = await cliente.comandar(dispositivo, comando)
+        if resposta.get("tipo") == "ERRO":
+            print(f"⚠️ {resposta.get('dados')}")
+        else:
             print(f"📥 Resposta: {resposta}")
-        except asyncio.TimeoutError:
-            print("⏳ Tempo de resposta esgotado.")
 
-    writer.close()
-    await writer.wait_closed()
+    await cliente.fechar()
 
 if __name__ == "__main__":
     asyncio.run(painel())
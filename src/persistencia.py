@@ -0,0 +1,170 @@
+import atexit
+import mmap
+import os
+import struct
+import threading
+import time
+
+INTERVALO_FSYNC = 0.1             # segundos em que as transições se acumulam antes de um fsync
+LIMITE_DIARIO = 32 * 1024 * 1024  # bytes de diário a partir dos quais ele é compactado em snapshot
+
+ESTADOS = ("DESLIGADA", "LIGADA")
+
+# Registro do diário e do snapshot:
+# estado (1) | versão (4) | confirmado_em (8) | tamanho do nome (2) | nome (UTF-8)
+REGISTRO_ESTADO = struct.Struct('!BIdH')
+
+def codificar(nome, estado, versao, confirmado_em):
+    return REGISTRO_ESTADO.pack(estado, versao, confirmado_em, len(nome)) + nome
+
+def ler_registros(caminho, tabela):
+    """
+    Aplica em `tabela` ({nome em bytes: (estado, versão, confirmado_em)})
+    os registros do arquivo, lido via mmap; o último de cada nome vence.
+    Retorna quantos bytes do início do arquivo são registros completos.
+    """
+    try:
+        arquivo = open(caminho, 'rb')
+    except FileNotFoundError:
+        return 0
+    with arquivo:
+        tamanho = os.fstat(arquivo.fileno()).st_size
+        if not tamanho:
+            return 0
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ler = REGISTRO_ESTADO.unpack_from
+            cabecalho = REGISTRO_ESTADO.size
+            pos = 0
+            while pos + cabecalho <= tamanho:
+                estado, versao, confirmado_em, n = ler(mm, pos)
+                fim = pos + cabecalho + n
+                if fim > tamanho:
+                    break  # registro incompleto: queda no meio de uma escrita
+                tabela[mm[pos + cabecalho:fim]] = (estado, versao, confirmado_em)
+                pos = fim
+            return pos
+
+class Diario:
+    """
+    Persistência opcional do estado dos dispositivos: cada transição é
+    anexada a um diário, gravado por uma thread em lotes com um único
+    fsync por lote. Quando o diário passa de `limite` bytes, a tabela
+    inteira vira um snapshot (gravado à parte e renomeado) e o diário
+    recomeça vazio. Na abertura, snapshot + diário reconstroem a tabela.
+    """
+    def __init__(self, caminho, intervalo_fsync=INTERVALO_FSYNC, limite=LIMITE_DIARIO):
+        self.caminho = caminho
+        self.caminho_snapshot = caminho + ".snap"
+        self.intervalo_fsync = intervalo_fsync
+        self.limite = limite
+        self.lock = threading.Lock()          # protege buffer e tabela
+        self.lock_arquivo = threading.Lock()  # uma gravação por vez (thread ou fechar)
+        self.buffer = bytearray()
+        self.tem_dados = threading.Event()
+        self.fechado = False
+
+        inicio = time.perf_counter()
+        self.tabela = {}  # {nome em bytes: (estado, versão, confirmado_em)}
+        ler_registros(self.caminho_snapshot, self.tabela)
+        valido = ler_registros(caminho, self.tabela)
+        self.tempo_carga = time.perf_counter() - inicio
+
+        # Descarta um registro incompleto no fim antes de voltar a anexar
+        self.arquivo = open(caminho, 'ab')
+        self.arquivo.truncate(valido)
+        self.tamanho = valido
+
+        self.thread = threading.Thread(target=self.gravar, name="diario", daemon=True)
+        self.thread.start()
+        atexit.register(self.fechar)
+
+    def estados(self):
+        """
+        Tabela carregada: {nome: (estado, versão, confirmado_em)}.
+        """
+        with self.lock:
+            return {nome.decode('utf-8'): (ESTADOS[estado], versao, confirmado_em)
+                    for nome, (estado, versao, confirmado_em) in self.tabela.items()}
+
+    def obter(self, nome):
+        """
+        Último estado salvo de um dispositivo: (estado, versão, confirmado_em) ou None.
+        """
+        with self.lock:
+            salvo = self.tabela.get(nome.encode('utf-8'))
+        if salvo is None:
+            return None
+        estado, versao, confirmado_em = salvo
+        return ESTADOS[estado], versao, confirmado_em
+
+    def registrar(self, nome, estado, versao=None, confirmado_em=None):
+        """
+        Anexa uma transição. Sem `versao`, usa a anterior + 1.
+        """
+        if estado not in ESTADOS or self.fechado:
+            return
+        nome = nome.encode('utf-8')
+        codigo = ESTADOS.index(estado)
+        with self.lock:
+            if versao is None:
+                versao = self.tabela.get(nome, (0, 0, 0.0))[1] + 1
+            confirmado_em = time.time() if confirmado_em is None else confirmado_em
+            self.tabela[nome] = (codigo, versao, confirmado_em)
+            self.buffer += codificar(nome, codigo, versao, confirmado_em)
+        self.tem_dados.set()
+
+    def gravar(self):
+        while True:
+            self.tem_dados.wait()
+            # Junta as transições da janela em uma única escrita + fsync
+            time.sleep(self.intervalo_fsync)
+            if self.fechado:
+                return
+            self.descarregar()
+
+    def descarregar(self):
+        with self.lock_arquivo:
+            if self.arquivo.closed:
+                return
+            with self.lock:
+                lote, self.buffer = self.buffer, bytearray()
+                self.tem_dados.clear()
+                compactar = self.tamanho + len(lote) > self.limite
+                # Cópia consistente com o diário até este lote
+                tabela = dict(self.tabela) if compactar else None
+            if lote:
+                self.arquivo.write(lote)
+                self.arquivo.flush()
+                os.fsync(self.arquivo.fileno())
+                self.tamanho += len(lote)
+            if compactar:
+                self.compactar(tabela)
+
+    def compactar(self, tabela):
+        temporario = self.caminho_snapshot + ".tmp"
+        with open(temporario, 'wb') as f:
+            f.write(b"".join(codificar(nome, *valores) for nome, valores in tabela.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho_snapshot)
+        diretorio = os.open(os.path.dirname(os.path.abspath(self.caminho_snapshot)), os.O_RDONLY)
+        try:
+            os.fsync(diretorio)
+        finally:
+            os.close(diretorio)
+        # Se cair antes daqui, o diário só repete transições que já estão no snapshot
+        self.arquivo.truncate(0)
+        os.fsync(self.arquivo.fileno())
+        self.tamanho = 0
+
+    def fechar(self):
+        """
+        Grava o que estiver pendente e fecha o diário.
+        """
+        if self.fechado:
+            return
+        self.fechado = True
+        self.tem_dados.set()
+        self.descarregar()
+        with self.lock_arquivo:
+            self.arquivo.close()
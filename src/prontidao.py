@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+TIMEOUT_PRONTIDAO = 30  # segundos esperando o servidor (e os dispositivos) ficarem prontos
+
+def notificar_pronto():
+    """
+    Avisa o supervisor de processos que o servidor já aceita conexões,
+    pelo protocolo de notificação do systemd (READY=1 no NOTIFY_SOCKET).
+    Sem a variável de ambiente não faz nada.
+    """
+    endereco = os.environ.get("NOTIFY_SOCKET")
+    if not endereco:
+        return
+    if endereco.startswith("@"):
+        endereco = "\0" + endereco[1:]  # socket no namespace abstrato
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+            s.sendto(b"READY=1", endereco)
+    except OSError:
+        pass
+
+def consultar(host, port, timeout):
+    """
+    Um STATS no servidor (síncrono ou assíncrono: ambos usam JSON + "\\n").
+    Retorna os dados da resposta ou None se o servidor não respondeu.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as s:
+            s.sendall(b'{"tipo": "STATS"}\n')
+            arquivo = s.makefile('rb')
+            linha = arquivo.readline()
+    except OSError:
+        return None
+    try:
+        return json.loads(linha).get("dados")
+    except ValueError:
+        return None
+
+def sondar(host='127.0.0.1', port=5000, dispositivos=0, timeout=TIMEOUT_PRONTIDAO):
+    """
+    Espera o servidor responder e ter ao menos `dispositivos` dispositivos
+    registrados. Retorna True se isso aconteceu dentro do prazo.
+    """
+    prazo = time.monotonic() + timeout
+    espera = 0.05
+    while True:
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            return False
+        dados = consultar(host, port, min(restante, 2.0))
+        if dados is not None and dados.get("medidores", {}).get("dispositivos_ativos", 0) >= dispositivos:
+            return True
+        time.sleep(min(espera, max(0.0, prazo - time.monotonic())))
+        espera = min(espera * 2, 1.0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonda de prontidão: sai com 0 quando o servidor está pronto.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--dispositivos", type=int, default=0, help="dispositivos registrados esperados")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_PRONTIDAO)
+    args = parser.parse_args()
+    sys.exit(0 if sondar(args.host, args.port, args.dispositivos, args.timeout) else 1)
+
+if __name__ == "__main__":
+    main()
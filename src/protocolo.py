@@ -0,0 +1,218 @@
+import asyncio
+import json
+import struct
+
+# Codificações aceitas no campo "codificacao" do REGISTRO
+CODIFICACAO_JSON = "json"
+CODIFICACAO_BINARIA = "binaria"
+
+# Enquadramento das mensagens JSON no servidor síncrono (main.py)
+ENQUADRAMENTO_LINHA = "linha"      # JSON terminado por "\n", como no servidor assíncrono
+ENQUADRAMENTO_PREFIXO = "prefixo"  # tamanho em 4 bytes (big-endian) seguido do JSON
+PREFIXO = struct.Struct('!I')
+LIMITE_QUADRO = 16 * 1024 * 1024   # bytes de um quadro; acima disso a conexão é encerrada
+LIMITE_LINHA = 16 * 1024 * 1024    # limit= dos streams asyncio: respostas agregadas passam dos 64 KiB padrão
+
+# Registro binário de tamanho fixo (12 bytes):
+# tipo (1) | código do comando/estado (1) | reservado (2) | handle (4) | id (4)
+# Em EVENTO o campo id leva o "seq"; em ERRO o código é o de admissão
+# ("codigo") ou "ERRO", já que o texto do erro não cabe no registro.
+REGISTRO = struct.Struct('!BBHII')
+MAXIMO_ID = 0xFFFFFFFF
+
+TIPOS = (None, "COMANDO", "RESPOSTA", "ERRO", "PING", "EVENTO")
+CODIGOS = ("COMANDO DESCONHECIDO", "LIGAR", "DESLIGAR", "STATUS", "LIGADA", "DESLIGADA",
+           "ERRO", "OCUPADO", "SOBRECARREGADO")
+
+TIPO_PARA_BYTE = {tipo: i for i, tipo in enumerate(TIPOS) if tipo}
+CODIGO_PARA_BYTE = {codigo: i for i, codigo in enumerate(CODIGOS)}
+
+class CodecJSON:
+    """
+    Mensagens JSON terminadas por "\\n" (formato padrão).
+    """
+    codificacao = CODIFICACAO_JSON
+
+    def codificar(self, mensagem):
+        return (json.dumps(mensagem) + "\n").encode('utf-8')
+
+    async def ler_quadro(self, reader):
+        return await reader.readline() or None
+
+    def decodificar(self, quadro):
+        return json.loads(quadro.decode('utf-8').strip())
+
+    async def ler(self, reader):
+        quadro = await self.ler_quadro(reader)
+        return None if quadro is None else self.decodificar(quadro)
+
+class CodecBinario:
+    """
+    Registros de tamanho fixo em que o dispositivo é identificado pelo
+    handle inteiro atribuído pelo servidor no REGISTRO. O handle 0 é a
+    própria conexão (ex: PING de um gateway).
+    """
+    codificacao = CODIFICACAO_BINARIA
+
+    def __init__(self, nomes, handles):
+        self.nomes = nomes      # {handle: nome}
+        self.handles = handles  # {nome: handle}
+
+    def codificar(self, mensagem):
+        """
+        Levanta ValueError se a mensagem não tiver representação no
+        registro (tipo, "dados" ou id fora das tabelas), em vez de mandar
+        outro comando no lugar.
+        """
+        tipo = mensagem.get("tipo")
+        if tipo not in TIPO_PARA_BYTE:
+            raise ValueError(f"Tipo sem representação binária: {tipo!r}")
+        dados = mensagem.get("dados")
+        if tipo == "ERRO":
+            # Um ERRO já decodificado traz o código em "dados"
+            codigo = CODIGO_PARA_BYTE.get(mensagem.get("codigo") or (dados if isinstance(dados, str) else None),
+                                          CODIGO_PARA_BYTE["ERRO"])
+        else:
+            codigo = 0 if dados is None else CODIGO_PARA_BYTE.get(dados) if isinstance(dados, str) else None
+            if codigo is None:
+                raise ValueError(f"\"dados\" sem código binário: {dados!r}")
+        id_comando = mensagem.get("seq" if tipo == "EVENTO" else "id") or 0
+        if isinstance(id_comando, bool) or not isinstance(id_comando, int) or not 0 <= id_comando <= MAXIMO_ID:
+            raise ValueError(f"Id sem representação binária (inteiro de 32 bits): {id_comando!r}")
+        return REGISTRO.pack(TIPO_PARA_BYTE[tipo], codigo, 0,
+                             self.handles.get(mensagem.get("dispositivo"), 0), id_comando)
+
+    async def ler_quadro(self, reader):
+        try:
+            return await reader.readexactly(REGISTRO.size)
+        except asyncio.IncompleteReadError:
+            return None
+
+    def decodificar(self, quadro):
+        """
+        Levanta ValueError se o quadro não for um registro válido.
+        """
+        try:
+            tipo, codigo, _, handle, id_comando = REGISTRO.unpack(quadro)
+        except struct.error:
+            raise ValueError(f"Registro binário deve ter {REGISTRO.size} bytes.") from None
+        if not 0 < tipo < len(TIPOS):
+            raise ValueError(f"Tipo desconhecido no registro binário: {tipo}")
+        if codigo >= len(CODIGOS):
+            raise ValueError(f"Código desconhecido no registro binário: {codigo}")
+        return {
+            "tipo": TIPOS[tipo],
+            "dispositivo": self.nomes.get(handle),
+            "dados": CODIGOS[codigo],
+            "seq" if TIPOS[tipo] == "EVENTO" else "id": id_comando
+        }
+
+    async def ler(self, reader):
+        quadro = await self.ler_quadro(reader)
+        return None if quadro is None else self.decodificar(quadro)
+
+CODEC_JSON = CodecJSON()
+
+def enquadrar(dados, enquadramento=ENQUADRAMENTO_LINHA):
+    if enquadramento == ENQUADRAMENTO_PREFIXO:
+        return PREFIXO.pack(len(dados)) + dados
+    return dados + b"\n"
+
+class LeitorQuadros:
+    """
+    Remonta quadros a partir das leituras de um socket (bloqueante ou não):
+    uma leitura pode trazer vários quadros ou só um pedaço de um. Os bytes
+    são recebidos direto em um buffer reaproveitado (recv_into) e os quadros
+    são fatiados por memoryview, sem concatenar bytes a cada leitura.
+    """
+    def __init__(self, enquadramento=ENQUADRAMENTO_LINHA, tamanho=1024, limite=LIMITE_QUADRO):
+        self.enquadramento = enquadramento
+        self.tamanho = tamanho
+        self.limite = limite
+        self.buffer = bytearray(tamanho)
+        self.inicio = 0  # primeiro byte ainda não consumido
+        self.fim = 0     # fim dos bytes recebidos
+        self.busca = 0   # até onde já se sabe que não há "\n" (quadros longos em várias leituras)
+
+    def preparar(self):
+        """
+        Garante espaço livre no fim do buffer: primeiro move o quadro
+        incompleto para o início; se não bastar, dobra o buffer.
+        """
+        if self.inicio == self.fim:
+            self.inicio = self.fim = self.busca = 0
+            if len(self.buffer) > 4 * self.tamanho:
+                self.buffer = bytearray(self.tamanho)  # devolve a memória de um quadro grande
+        minimo = self.tamanho // 4
+        if len(self.buffer) - self.fim >= minimo:
+            return
+        if self.inicio:
+            pendente = self.fim - self.inicio
+            self.buffer[:pendente] = self.buffer[self.inicio:self.fim]
+            self.busca -= self.inicio
+            self.inicio, self.fim = 0, pendente
+        if len(self.buffer) - self.fim < minimo:
+            self.buffer.extend(bytes(len(self.buffer)))
+
+    def ler(self, sock):
+        """
+        Uma leitura do socket para o buffer. Retorna quantos bytes chegaram
+        (0 = conexão fechada); BlockingIOError e timeouts passam adiante.
+        """
+        self.preparar()
+        with memoryview(self.buffer) as buffer, buffer[self.fim:] as livre:
+            n = sock.recv_into(livre)
+        self.fim += n
+        return n
+
+    def extrair(self, maximo=None):
+        """
+        Retira do buffer os quadros completos (até `maximo`), sem o
+        delimitador. Levanta ValueError se um quadro passar do limite.
+        """
+        quadros = []
+        with memoryview(self.buffer) as buffer:
+            while maximo is None or len(quadros) < maximo:
+                if self.enquadramento == ENQUADRAMENTO_PREFIXO:
+                    if self.fim - self.inicio < PREFIXO.size:
+                        break
+                    (tamanho,) = PREFIXO.unpack_from(buffer, self.inicio)
+                    if tamanho > self.limite:
+                        raise ValueError(f"Quadro de {tamanho} bytes acima do limite.")
+                    comeco = self.inicio + PREFIXO.size
+                    if self.fim - comeco < tamanho:
+                        break
+                    quadros.append(buffer[comeco:comeco + tamanho].tobytes())
+                    self.inicio = comeco + tamanho
+                else:
+                    pos = self.buffer.find(b"\n", max(self.inicio, self.busca), self.fim)
+                    if pos < 0:
+                        self.busca = self.fim
+                        if self.fim - self.inicio > self.limite:
+                            raise ValueError("Quadro sem \"\\n\" acima do limite.")
+                        break
+                    if pos > self.inicio:  # ignora linhas vazias
+                        quadros.append(buffer[self.inicio:pos].tobytes())
+                    self.inicio = pos + 1
+        return quadros
+
+    def receber(self, sock):
+        """
+        Faz uma leitura e retorna todos os quadros completos que ela fechou
+        (possivelmente nenhum), ou None se a conexão foi fechada.
+        """
+        if not self.ler(sock):
+            return None
+        return self.extrair()
+
+    def proximo(self, sock):
+        """
+        Próximo quadro, lendo do socket só se ainda não houver um completo.
+        Retorna None se a conexão foi fechada.
+        """
+        while True:
+            quadros = self.extrair(1)
+            if quadros:
+                return quadros[0]
+            if not self.ler(sock):
+                return None
@@ -0,0 +1,13 @@
+import random
+
+RECONEXAO_INICIAL = 1.0   # segundos; teto da primeira espera antes de reconectar
+RECONEXAO_MAXIMA = 30.0   # teto das esperas seguintes (dobra a cada falha até aqui)
+
+def espera_reconexao(tentativa, inicial=RECONEXAO_INICIAL, maxima=RECONEXAO_MAXIMA):
+    """
+    Espera antes da tentativa `tentativa` (0, 1, 2...): backoff exponencial
+    com jitter total, um valor sorteado entre 0 e o teto da tentativa.
+    Quando o servidor reinicia, milhares de dispositivos caem juntos; o
+    sorteio espalha os REGISTROs em vez de todos chegarem no mesmo instante.
+    """
+    return random.uniform(0, min(maxima, inicial * 2 ** min(tentativa, 32)))
@@ -0,0 +1,191 @@
+import bisect
+import fnmatch
+import re
+
+CAMPOS = ("tipo", "tag", "grupo")  # campos indexados, usados nos seletores
+LIMITE_LISTAR = 1000          # dispositivos (ou mudanças) por página de LISTAR
+HISTORICO_REGISTRO = 100000   # entradas e saídas guardadas para LISTAR com "desde"
+
+# Eventos do histórico do registro
+ENTROU = "entrou"
+SAIU = "saiu"
+
+class RegistroDispositivos:
+    """
+    Atributos informados no REGISTRO ("dados": {"tipo", "tags", "grupos"})
+    com um índice secundário por valor de cada campo. Um seletor como
+    "tipo=LAMPADA AND grupo=sala" é resolvido pelo menor dos conjuntos
+    envolvidos, sem percorrer todos os dispositivos.
+
+    Cada entrada ou saída incrementa a versão do registro e vai para um
+    histórico limitado (um buffer circular indexado pela versão), para que
+    um painel busque só o que mudou desde a versão que já conhece. Os nomes ficam também em uma lista ordenada,
+    usada como cursor na paginação.
+    """
+    def __init__(self, historico=HISTORICO_REGISTRO):
+        self.atributos = {}  # {nome: {"tipo": str, "tags": [...], "grupos": [...]}}
+        self.indices = {}    # {(campo, valor): {nomes}}
+        self.ordenados = []  # nomes em ordem, para paginar por cursor
+        self.versao = 0
+        self.capacidade = historico
+        self.historico = []  # (versão, nome, evento, atributos); a versão v fica em (v - 1) % capacidade
+
+    @staticmethod
+    def normalizar(dados):
+        dados = dados if isinstance(dados, dict) else {}
+        return {
+            "tipo": dados.get("tipo"),
+            "tags": list(dict.fromkeys(dados.get("tags") or [])),
+            "grupos": list(dict.fromkeys(dados.get("grupos") or [])),
+        }
+
+    @staticmethod
+    def chaves(atributos):
+        if atributos["tipo"] is not None:
+            yield ("tipo", atributos["tipo"])
+        for tag in atributos["tags"]:
+            yield ("tag", tag)
+        for grupo in atributos["grupos"]:
+            yield ("grupo", grupo)
+
+    def adicionar(self, nome, dados=None):
+        # Registrar de novo só atualiza os atributos: uma única entrada no histórico
+        if self.desindexar(nome) is None:
+            bisect.insort(self.ordenados, nome)
+        atributos = self.atributos[nome] = self.normalizar(dados)
+        for chave in self.chaves(atributos):
+            self.indices.setdefault(chave, set()).add(nome)
+        self.anotar(nome, ENTROU, atributos)
+
+    def remover(self, nome):
+        atributos = self.desindexar(nome)
+        if atributos is None:
+            return
+        del self.ordenados[bisect.bisect_left(self.ordenados, nome)]
+        self.anotar(nome, SAIU, atributos)
+
+    def desindexar(self, nome):
+        atributos = self.atributos.pop(nome, None)
+        if atributos is None:
+            return None
+        for chave in self.chaves(atributos):
+            nomes = self.indices[chave]
+            nomes.discard(nome)
+            if not nomes:
+                del self.indices[chave]
+        return atributos
+
+    def anotar(self, nome, evento, atributos):
+        self.versao += 1
+        entrada = (self.versao, nome, evento, atributos)
+        if len(self.historico) < self.capacidade:
+            self.historico.append(entrada)
+        elif self.capacidade:
+            self.historico[(self.versao - 1) % self.capacidade] = entrada
+
+    @staticmethod
+    def eh_seletor(alvo):
+        return isinstance(alvo, str) and "=" in alvo
+
+    @staticmethod
+    def termos(seletor):
+        """
+        Quebra o seletor em cláusulas OR de termos AND: [[(campo, valor), ...], ...].
+        Levanta ValueError se o seletor for inválido.
+        """
+        clausulas = []
+        for clausula in re.split(r"\s+OR\s+", seletor.strip()):
+            termos = []
+            for termo in re.split(r"\s+AND\s+", clausula):
+                campo, igual, valor = termo.partition("=")
+                campo = campo.strip().lower()
+                if not igual or campo not in CAMPOS or not valor.strip():
+                    raise ValueError(f"Termo inválido no seletor: '{termo.strip()}'")
+                termos.append((campo, valor.strip()))
+            clausulas.append(termos)
+        return clausulas
+
+    def chaves_de(self, nome):
+        """
+        Termos (campo, valor) de um dispositivo, ou um conjunto vazio se ele
+        não está registrado. Calculados uma vez, servem para testar vários
+        seletores com casa_chaves (ex: ao filtrar EVENTOs).
+        """
+        atributos = self.atributos.get(nome)
+        return set(self.chaves(atributos)) if atributos is not None else set()
+
+    @staticmethod
+    def casa_chaves(chaves, clausulas):
+        return any(all(termo in chaves for termo in termos) for termos in clausulas)
+
+    def casa_atributos(self, atributos, clausulas):
+        return self.casa_chaves(set(self.chaves(atributos)), clausulas)
+
+    def selecionar(self, seletor):
+        """
+        Nomes que satisfazem o seletor: termos campo=valor ligados por AND,
+        e grupos de termos ligados por OR (AND tem precedência).
+        Levanta ValueError se o seletor for inválido.
+        """
+        resultado = set()
+        for termos in self.termos(seletor):
+            conjuntos = sorted((self.indices.get(termo, set()) for termo in termos), key=len)
+            menor, outros = conjuntos[0], conjuntos[1:]
+            resultado.update(nome for nome in menor if all(nome in c for c in outros))
+        return sorted(resultado)
+
+    def listar(self, seletor=None, padrao=None, cursor=None, limite=LIMITE_LISTAR, desde=None):
+        """
+        Página de LISTAR. Sem `desde`: até `limite` dispositivos (com seus
+        atributos) depois do nome `cursor`, em ordem de nome; "cursor" na
+        resposta é o ponto da próxima página (None na última). Com `desde`:
+        as entradas e saídas posteriores a essa versão, até `limite`; a
+        próxima página é pedida com "desde" igual à "versao" devolvida.
+        Os filtros são um seletor de atributos e um padrão de nome;
+        "quantidade" é o número de itens da página.
+        Levanta ValueError se o seletor ou o limite forem inválidos.
+        """
+        if isinstance(limite, bool) or not isinstance(limite, int) or limite < 1:
+            raise ValueError("\"limite\" deve ser um inteiro positivo.")
+        if padrao is not None and not isinstance(padrao, str):
+            raise ValueError("\"padrao\" deve ser um texto.")
+        clausulas = self.termos(seletor) if seletor else None
+        if desde is not None:
+            if isinstance(desde, bool) or not isinstance(desde, int):
+                raise ValueError("\"desde\" deve ser uma versão (inteiro).")
+            return self.mudancas(desde, clausulas, padrao, limite)
+
+        nomes = self.selecionar(seletor) if seletor else self.ordenados
+        inicio = bisect.bisect_right(nomes, cursor) if cursor is not None else 0
+        pagina = []
+        proximo = None
+        for indice in range(inicio, len(nomes)):
+            nome = nomes[indice]
+            if padrao is None or fnmatch.fnmatchcase(nome, padrao):
+                if len(pagina) == limite:
+                    proximo = pagina[-1]  # há mais: a próxima página começa depois deste
+                    break
+                pagina.append(nome)
+        return {
+            "dados": {nome: self.atributos[nome] for nome in pagina},
+            "quantidade": len(pagina),
+            "cursor": proximo,
+            "versao": self.versao,
+        }
+
+    def mudancas(self, desde, clausulas, padrao, limite):
+        if desde > self.versao or desde < self.versao - len(self.historico):
+            # O histórico não cobre mais essa versão: é preciso listar tudo de novo
+            return {"reinicio": True, "versao": self.versao}
+        # As versões são consecutivas: cada uma é achada direto pela posição,
+        # sem percorrer o histórico anterior a `desde`
+        mudancas = []
+        versao = desde
+        for posicao in range(desde, self.versao):
+            versao, nome, evento, atributos = self.historico[posicao % self.capacidade]
+            if (padrao is None or fnmatch.fnmatchcase(nome, padrao)) and \
+                    (clausulas is None or self.casa_atributos(atributos, clausulas)):
+                mudancas.append({"versao": versao, "dispositivo": nome, "evento": evento, "dados": atributos})
+                if len(mudancas) == limite:
+                    break
+        return {"mudancas": mudancas, "quantidade": len(mudancas), "versao": versao, "mais": versao < self.versao}
@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmark import RECUSAS, SERVIDORES, iniciar_servidor, liberar_descritores, percentil
+from captura import ABERTURA, ENTRADA, FECHAMENTO, INTERVALO_GRAVACAO, SAIDA, ler_captura
+from conexao import Conexao
+from lampada_async import pulsar
+from protocolo import CODEC_JSON, CODIFICACAO_BINARIA, LIMITE_LINHA, CodecBinario
+
+REGISTROS_SIMULTANEOS = 200  # dispositivos se registrando ao mesmo tempo antes da reprodução
+TIMEOUT_REPRODUCAO = 10      # segundos esperando as últimas respostas de cada painel
+SEM_RESPOSTA = ("PING", "RESPOSTA", "EVENTO")  # mensagens de painel que não geram resposta
+
+class ConexaoCapturada:
+    __slots__ = ("id", "abertura", "entradas", "saidas", "binaria")
+
+    def __init__(self, id_conexao, abertura):
+        self.id = id_conexao
+        self.abertura = abertura
+        self.entradas = []  # [(instante, mensagem)] recebidas pelo servidor
+        self.saidas = []    # [(instante, mensagem)] enviadas pelo servidor
+        self.binaria = False
+
+    @property
+    def registro(self):
+        # Dispositivos (lâmpadas e gateways) começam pelo REGISTRO
+        if self.entradas and self.entradas[0][1].get("tipo") == "REGISTRO":
+            return self.entradas[0][1]
+        return None
+
+def carregar(caminho):
+    """
+    Lê a captura e remonta as conexões com as mensagens decodificadas.
+    Quadros binários (depois de um REGISTRO com "codificacao": "binaria")
+    só interessam aos dispositivos, que a reprodução simula, e são pulados.
+    """
+    conexoes = {}
+    for instante, id_conexao, evento, quadro in ler_captura(caminho):
+        if evento == ABERTURA:
+            conexoes[id_conexao] = ConexaoCapturada(id_conexao, instante)
+            continue
+        conexao = conexoes.get(id_conexao)
+        if conexao is None or evento == FECHAMENTO or conexao.binaria:
+            continue
+        try:
+            mensagem = json.loads(quadro)
+        except ValueError:
+            continue
+        if evento == ENTRADA:
+            conexao.entradas.append((instante, mensagem))
+        elif evento == SAIDA:
+            conexao.saidas.append((instante, mensagem))
+            if mensagem.get("codificacao") == CODIFICACAO_BINARIA:
+                conexao.binaria = True
+    return list(conexoes.values())
+
+def latencias_originais(painel):
+    """
+    Casa cada mensagem do painel com a resposta da captura: pelo "id"
+    quando houver, senão pela ordem. Retorna [(envio, latência)].
+    """
+    por_id, em_ordem = {}, []
+    for instante, mensagem in painel.entradas:
+        if mensagem.get("tipo") in SEM_RESPOSTA:
+            continue
+        if "id" in mensagem:
+            por_id[mensagem["id"]] = instante
+        else:
+            em_ordem.append(instante)
+    resultado = []
+    em_ordem.reverse()
+    for instante, mensagem in painel.saidas:
+        if mensagem.get("tipo") == "EVENTO":
+            continue
+        envio = por_id.pop(mensagem["id"], None) if "id" in mensagem else (em_ordem.pop() if em_ordem else None)
+        if envio is not None:
+            resultado.append((envio, instante - envio))
+    return resultado
+
+def resumo(medicoes, erros, sem_resposta, recusas=0):
+    """
+    Vazão e latência de uma lista de (envio, latência). As recusas de
+    admissão (OCUPADO/SOBRECARREGADO) contam à parte dos erros.
+    """
+    latencias = sorted(latencia for _, latencia in medicoes)
+    duracao = max((envio + latencia for envio, latencia in medicoes), default=0.0) - \
+        min((envio for envio, _ in medicoes), default=0.0)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "requisicoes": len(medicoes),
+        "erros": erros,
+        "recusas": recusas,
+        "sem_resposta": sem_resposta,
+        "duracao_s": round(duracao, 3),
+        "vazao_req_s": round(len(medicoes) / duracao, 1) if duracao else None,
+        "latencia_ms": {
+            "p50": ms(percentil(latencias, 50)),
+            "p95": ms(percentil(latencias, 95)),
+            "p99": ms(percentil(latencias, 99)),
+            "max": ms(latencias[-1] if latencias else None),
+        },
+    }
+
+def variacao(antes, depois):
+    if not antes or depois is None:
+        return None
+    return round((depois - antes) / antes * 100, 1)
+
+# --- Dispositivos simulados ---
+
+async def dispositivo_simulado(registro, host, port, limite, prontos):
+    """
+    Reenvia o REGISTRO capturado (lâmpada ou gateway) e responde aos
+    comandos como uma lâmpada, na codificação que o servidor confirmar.
+    """
+    nomes = registro.get("dispositivos") or [registro["dispositivo"]]
+    estados = dict.fromkeys(nomes, "DESLIGADA")
+    async with limite:
+        reader, writer = await asyncio.open_connection(host, port, limit=LIMITE_LINHA)
+        conexao = Conexao(writer)
+        await conexao.enviar(CODEC_JSON.codificar(registro))
+        confirmacao = await CODEC_JSON.ler(reader)
+    prontos.append(registro)
+    codec = CODEC_JSON
+    if confirmacao and confirmacao.get("codificacao") == CODIFICACAO_BINARIA:
+        handles = confirmacao.get("handles") or {registro["dispositivo"]: confirmacao["handle"]}
+        codec = CodecBinario({h: n for n, h in handles.items()}, handles)
+    ping = None
+    if confirmacao and confirmacao.get("intervalo_ping"):
+        quadro = codec.codificar({"tipo": "PING", "dispositivo": nomes[0] if codec is CODEC_JSON else None})
+        ping = asyncio.create_task(pulsar(conexao, quadro, confirmacao["intervalo_ping"]))
+    try:
+        while (comando := await codec.ler(reader)) is not None:
+            nome = comando.get("dispositivo") or nomes[0]
+            if comando["dados"] == "LIGAR":
+                estados[nome] = "LIGADA"
+            elif comando["dados"] == "DESLIGAR":
+                estados[nome] = "DESLIGADA"
+            dados = estados.get(nome, "DESLIGADA") if comando["dados"] in ("LIGAR", "DESLIGAR", "STATUS") \
+                else "COMANDO DESCONHECIDO"
+            await conexao.enviar(codec.codificar(
+                {"tipo": "RESPOSTA", "dispositivo": nome, "dados": dados, "id": comando.get("id")}))
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        if ping:
+            ping.cancel()
+        await conexao.fechar()
+
+# --- Painéis ---
+
+async def reproduzir_painel(painel, host, port, inicio, zero, velocidade, resultado):
+    """
+    Reenvia as mensagens do painel nos mesmos intervalos da captura
+    (divididos por `velocidade`; 0 = sem esperas). Cada mensagem leva um
+    "id" próprio para casar a resposta e medir a latência.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def esperar(instante):
+        if velocidade:
+            atraso = inicio + (instante - zero) / velocidade - loop.time()
+            if atraso > 0:
+                await asyncio.sleep(atraso)
+
+    await esperar(painel.abertura)
+    reader, writer = await asyncio.open_connection(host, port, limit=LIMITE_LINHA)
+    conexao = Conexao(writer)
+    enviados = {}  # {id: instante do envio}
+    todos_enviados = False
+    concluido = loop.create_future()
+
+    async def ler():
+        while (quadro := await reader.readline()):
+            mensagem = json.loads(quadro)
+            envio = enviados.pop(mensagem.get("id"), None)
+            if envio is None:
+                continue  # EVENTO ou resposta sem "id"
+            agora = loop.time()
+            resultado["medicoes"].append((envio - inicio, agora - envio))
+            if mensagem.get("tipo") == "ERRO":
+                resultado["recusas" if mensagem.get("codigo") in RECUSAS else "erros"] += 1
+            if todos_enviados and not enviados and not concluido.done():
+                concluido.set_result(None)
+
+    leitora = asyncio.create_task(ler())
+    try:
+        for i, (instante, mensagem) in enumerate(painel.entradas):
+            await esperar(instante)
+            if mensagem.get("tipo") not in SEM_RESPOSTA:
+                mensagem = dict(mensagem, id=i + 1)
+                enviados[i + 1] = loop.time()
+            await conexao.enviar(CODEC_JSON.codificar(mensagem))
+        todos_enviados = True
+        if enviados:
+            await asyncio.wait_for(asyncio.shield(concluido), TIMEOUT_REPRODUCAO)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        resultado["sem_resposta"] += len(enviados)
+        leitora.cancel()
+        await conexao.fechar()
+
+# --- Execução ---
+
+async def reproduzir(conexoes, host, port, velocidade):
+    dispositivos = [c.registro for c in conexoes if c.registro]
+    paineis = [c for c in conexoes if not c.registro and c.entradas]
+
+    # Todos os dispositivos primeiro (mesmo os que entraram no meio da captura)
+    limite = asyncio.Semaphore(REGISTROS_SIMULTANEOS)
+    prontos = []
+    tarefas = [asyncio.create_task(dispositivo_simulado(r, host, port, limite, prontos)) for r in dispositivos]
+    while len(prontos) < len(dispositivos):
+        await asyncio.sleep(0.01)
+        falhas = [t for t in tarefas if t.done() and not t.cancelled() and t.exception()]
+        if falhas:
+            raise falhas[0].exception()
+
+    resultado = {"medicoes": [], "erros": 0, "recusas": 0, "sem_resposta": 0}
+    zero = min((p.abertura for p in paineis), default=0.0)
+    inicio = asyncio.get_running_loop().time()
+    await asyncio.gather(*(reproduzir_painel(p, host, port, inicio, zero, velocidade, resultado) for p in paineis))
+    for tarefa in tarefas:
+        tarefa.cancel()
+    return dispositivos, paineis, resultado
+
+def resumo_servidor(conexoes, sem_resposta=0):
+    """
+    Resumo medido dentro do servidor (da entrada à saída de cada quadro),
+    igual para a captura original e para a da reprodução.
+    """
+    medicoes, erros, recusas = [], 0, 0
+    for painel in conexoes:
+        if painel.registro:
+            continue
+        medicoes += latencias_originais(painel)
+        for _, mensagem in painel.saidas:
+            if mensagem.get("tipo") == "ERRO":
+                if mensagem.get("codigo") in RECUSAS:
+                    recusas += 1
+                else:
+                    erros += 1
+    return resumo(medicoes, erros, sem_resposta, recusas)
+
+def comparar(conexoes, servidor, host, port, velocidade):
+    """
+    Reproduz as conexões contra um servidor novo, que também grava uma
+    captura, e compara as duas medidas do mesmo jeito. O servidor sobe sem
+    limites de admissão (benchmark.ADMISSAO_LIVRE): em velocidade máxima,
+    recusas por taxa mediriam o limite, não o servidor. As latências vistas
+    pelos painéis simulados (com a rede e o cliente) vão em "cliente".
+    """
+    descritor, caminho = tempfile.mkstemp(suffix=".capt")
+    os.close(descritor)
+    processo = iniciar_servidor(servidor, host, port, caminho)
+    try:
+        dispositivos, paineis, resultado = asyncio.run(reproduzir(conexoes, host, port, velocidade))
+        time.sleep(3 * INTERVALO_GRAVACAO)  # a thread de captura do servidor grava o que faltou
+    finally:
+        processo.kill()
+        processo.wait()
+    try:
+        reproducao = resumo_servidor(carregar(caminho), resultado["sem_resposta"])
+    finally:
+        os.unlink(caminho)
+    original = resumo_servidor(conexoes)
+    cliente = resumo(resultado["medicoes"], resultado["erros"], resultado["sem_resposta"], resultado["recusas"])
+    return {
+        "servidor": servidor,
+        "dispositivos": len(dispositivos),
+        "paineis": len(paineis),
+        "velocidade": velocidade or "maxima",
+        "original": original,
+        "reproducao": reproducao,
+        "cliente": cliente,
+        "variacao_pct": {
+            "vazao": variacao(original["vazao_req_s"], reproducao["vazao_req_s"]),
+            **{p: variacao(original["latencia_ms"][p], reproducao["latencia_ms"][p]) for p in ("p50", "p95", "p99")},
+        },
+    }
+
+def ler_velocidade(texto):
+    """
+    "1x", "10x" ou "max" (sem esperas entre as mensagens).
+    """
+    texto = texto.lower()
+    if texto in ("max", "maxima"):
+        return 0.0
+    return float(texto.removesuffix("x"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz uma captura de tráfego contra um servidor novo.")
+    parser.add_argument("captura")
+    parser.add_argument("--servidor", choices=sorted(SERVIDORES), default="async")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5200)
+    parser.add_argument("--velocidade", type=ler_velocidade, default=1.0, help="1x, 10x, ... ou max")
+    parser.add_argument("--saida", help="arquivo JSON de resultado (padrão: stdout)")
+    args = parser.parse_args()
+
+    liberar_descritores()  # milhares de sockets no mesmo processo
+
+    inicio = time.perf_counter()
+    conexoes = carregar(args.captura)
+    print(f"📼 {len(conexoes)} conexões carregadas em {time.perf_counter() - inicio:.2f} s")
+
+    resultado = comparar(conexoes, args.servidor, args.host, args.port, args.velocidade)
+
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            f.write(texto + "\n")
+    print(texto)
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,788 @@
 import asyncio
-import json
-from datetime import datetime
+import fnmatch
+import itertools
+import socket
+import time
+
+from admissao import (LIMITE_EM_ANDAMENTO, LIMITE_POR_DISPOSITIVO, OCUPADO, RAJADA_PAINEL, SOBRECARREGADO,
+                      TAXA_PAINEL, BaldeTokens, recusa)
+from agendador import Agendador
+from captura import ENTRADA, FECHAMENTO, SAIDA, Captura
+from conexao import Conexao
+from estado import FRESCOR_STATUS, CacheEstados
+from eventos import Publicador
+from logs import AVISO, DEBUG, ERRO, INFO, RegistroLogs
+from metricas import Metricas, servir_http
+from persistencia import Diario
+from prontidao import notificar_pronto
+from protocolo import CODEC_JSON, CODIFICACAO_BINARIA, LIMITE_LINHA, CodecBinario
+from registro import LIMITE_LISTAR, RegistroDispositivos
+from sessoes import RETENCAO_SESSAO, SessoesDispositivos
+from vivacidade import Vivacidade
+
+TIMEOUT_RESPOSTA = 10  # segundos aguardando a RESPOSTA de um dispositivo
+COMANDOS_CONHECIDOS = ("LIGAR", "DESLIGAR", "STATUS")
+ESTADO_APOS = {"LIGAR": "LIGADA", "DESLIGAR": "DESLIGADA"}  # estado confirmado por cada comando
+LIMITE_AGENDAMENTOS = 1000  # agendamentos devolvidos por AGENDAMENTOS quando "limite" é omitido
+
+class Voo:
+    """
+    Comando enviado a um dispositivo e ainda sem RESPOSTA. O id fica em
+    `pendentes` enquanto alguém espera por ele, não só quem o enviou: se
+    esse desistir antes, os que se juntaram ainda recebem a RESPOSTA.
+    """
+    __slots__ = ("dados", "futuro", "pendentes", "id_comando", "esperando")
+
+    def __init__(self, dados, futuro, pendentes, id_comando):
+        self.dados = dados
+        self.futuro = futuro
+        self.pendentes = pendentes
+        self.id_comando = id_comando
+        self.esperando = 1
 
 class ServidorAsync:
-    def __init__(self):
-        self.dispositivos = {}  # {nome: (reader, writer)}
-        self.logs = []
+    def __init__(self, host='127.0.0.1', port=5000, logs=None, frescor_status=FRESCOR_STATUS,
+                 porta_metricas=None, reuse_port=False, roteador=None,
+                 limite_dispositivo=LIMITE_POR_DISPOSITIVO, limite_em_andamento=LIMITE_EM_ANDAMENTO,
+                 taxa_painel=TAXA_PAINEL, rajada_painel=RAJADA_PAINEL, arquivo_estados=None,
+                 arquivo_captura=None, retencao_sessao=RETENCAO_SESSAO):
+        self.host = host
+        self.port = port
+        self.porta_metricas = porta_metricas  # endpoint HTTP de métricas (None = desligado)
+        self.reuse_port = reuse_port  # vários processos aceitando na mesma porta
+        # Encaminha comandos para dispositivos conectados em outro processo/nó
+        # (ver multicore.RoteadorWorkers e federacao.RoteadorFederacao).
+        # None = só dispositivos locais.
+        self.roteador = roteador
+        self.dispositivos = {}  # {nome: Conexao}
+        self.codecs = {}        # {nome: codec} codificação negociada no REGISTRO
+        self.registro = RegistroDispositivos()  # tipo, tags e grupos, com índices para seletores
+        self.handles = {}       # {nome: handle} inteiro usado na codificação binária
+        self.nomes_por_handle = {}  # {handle: nome}
+        self.proximo_handle = itertools.count(1)
+        self.codec_binario = CodecBinario(self.nomes_por_handle, self.handles)
+        self.pendentes = {}     # {nome: {id: future}} comandos aguardando RESPOSTA
+        # Último comando enviado a cada dispositivo, enquanto não responde: o
+        # mesmo comando chegando nesse meio-tempo espera essa RESPOSTA.
+        self.em_voo = {}        # {nome: Voo}
+        # Controle de admissão: acima destes limites o comando é recusado na
+        # hora (OCUPADO/SOBRECARREGADO) em vez de entrar em uma fila.
+        self.limite_dispositivo = limite_dispositivo
+        self.limite_em_andamento = limite_em_andamento
+        self.taxa_painel = taxa_painel
+        self.rajada_painel = rajada_painel
+        self.em_andamento = 0   # comandos aguardando RESPOSTA em todos os dispositivos
+        self.estados = CacheEstados(frescor_status)  # último estado confirmado de cada dispositivo
+        # Diário das transições de estado (None = estado só em memória)
+        self.diario = Diario(arquivo_estados) if arquivo_estados else None
+        # Todos os quadros recebidos e enviados, para reprodução (None = sem captura)
+        self.captura = Captura(arquivo_captura) if arquivo_captura else None
+        self.capturadas = {}    # {Conexao: id da conexão na captura}
+        if self.diario:
+            self.estados.restaurar(self.diario.estados())
+        self.publicador = Publicador(self.enviar, self.registro)  # EVENTOs de mudança de estado para quem fez ASSINAR
+        self.vivacidade = Vivacidade()  # conexões que negociaram PING e seu último contato
+        # Token de sessão entregue no REGISTRO: um dispositivo que cai e volta
+        # dentro da retenção retoma registro, grupos e handles sem reindexar.
+        self.sessoes = SessoesDispositivos(retencao_sessao)
+        self.agendador = Agendador(self.despachar, self.eh_multiplo, self.log)  # comandos adiados e recorrentes (AGENDAR)
+        self.tarefas = set()    # tarefas de encaminhamento em andamento
+        self.ids = itertools.count()
+        self.logs = logs or RegistroLogs()
+        self.fechar_logs = logs is None  # RegistroLogs próprio: o sink para quando o servidor encerra
+        self.metricas = Metricas()
+        self.conexoes_ativas = 0
+        self.conexoes_dispositivos = 0  # conexões com ao menos um dispositivo (lâmpada ou gateway)
+        self.pronto = asyncio.Event()  # sinalizado quando o servidor já aceita conexões
+
+    def log(self, mensagem, nivel=INFO, categoria=None):
+        self.logs.log(mensagem, nivel, categoria)
+
+    async def enviar(self, conexao, mensagem, codec=CODEC_JSON):
+        quadro = codec.codificar(mensagem)
+        self.metricas.incrementar("bytes_saida", valor=len(quadro))
+        if self.captura:
+            self.captura.registrar(self.capturadas.get(conexao, 0), SAIDA,
+                                   quadro[:-1] if codec is CODEC_JSON else quadro)
+        await conexao.enviar(quadro)
+
+    async def responder(self, conexao, resposta, codec):
+        """
+        Envia uma resposta no codec da conexão. O que o registro binário não
+        representa (ex: "dados" de LISTAR ou STATS) vai como ERRO com o
+        mesmo "id", em vez de derrubar a conexão.
+        """
+        try:
+            await self.enviar(conexao, resposta, codec)
+        except ValueError as e:
+            self.metricas.incrementar("respostas_sem_codificacao")
+            self.log(f"⚠️ Resposta sem representação {codec.codificacao}: {e}", AVISO)
+            await self.enviar(conexao, {"tipo": "ERRO", "dispositivo": resposta.get("dispositivo"),
+                                        "id": resposta.get("id")}, codec)
+
+    def medidores(self):
+        """
+        Valores instantâneos calculados na hora da consulta.
+        """
+        filas = [len(p) for p in self.pendentes.values()]
+        return {
+            "dispositivos_ativos": len(self.dispositivos),
+            "conexoes_dispositivos": self.conexoes_dispositivos,
+            "paineis_ativos": self.conexoes_ativas - self.conexoes_dispositivos,
+            "comandos_em_andamento": self.em_andamento,
+            "maior_fila_dispositivo": max(filas, default=0),
+            "agendamentos": len(self.agendador.agendamentos),
+            "sessoes_suspensas": self.sessoes.suspensas,
+        }
 
-    def log(self, mensagem):
-        hora = datetime.now().strftime("%H:%M:%S")
-        self.logs.append(f"[{hora}] {mensagem}")
-        print(f"[{hora}] {mensagem}")
+    def estatisticas(self):
+        """
+        Resposta de STATS: métricas acumuladas, medidores e a fila de
+        comandos pendentes de cada dispositivo que tem algum.
+        """
+        dados = self.metricas.instantaneo(self.medidores())
+        dados["filas"] = {nome: len(p) for nome, p in self.pendentes.items() if p}
+        return dados
 
     async def tratar_cliente(self, reader, writer):
         addr = writer.get_extra_info('peername')
-        nome_dispositivo = None
+        conexao = Conexao(writer)
+        nome_conexao = None    # nome do dispositivo ou do gateway
+        nomes_conexao = set()  # dispositivos registrados nesta conexão
+        sessao = None          # sessão retomável dos dispositivos desta conexão
+        codec = CODEC_JSON
+        balde = None  # limite de taxa de COMANDOs desta conexão (criado no primeiro)
+        self.conexoes_ativas += 1
+        if self.captura:
+            id_captura = self.capturadas[conexao] = self.captura.abrir()
         try:
             while True:
-                data = await reader.readline()
-                if not data:
+                quadro = await codec.ler_quadro(reader)
+                if quadro is None:
                     break
+                self.metricas.incrementar("bytes_entrada", valor=len(quadro))
+                if self.captura:
+                    self.captura.registrar(id_captura, ENTRADA, quadro.rstrip(b"\r\n") if codec is CODEC_JSON else quadro)
+                self.vivacidade.contato(conexao)
+                mensagem = codec.decodificar(quadro)
 
-                mensagem = json.loads(data.decode('utf-8').strip())
-                self.log(f"📩 {addr} -> {mensagem}")
+                if self.logs.habilitado(DEBUG):
+                    self.log(f"📩 {addr} -> {mensagem}", DEBUG, "mensagem")
 
                 tipo = mensagem.get("tipo")
 
                 if tipo == "REGISTRO":
-                    nome = mensagem["dispositivo"]
-                    self.dispositivos[nome] = (reader, writer)
-                    nome_dispositivo = nome
-                    self.log(f"✅ {nome} registrado.")
+                    nome_conexao = mensagem["dispositivo"]
+                    if mensagem.get("codificacao") == CODIFICACAO_BINARIA:
+                        codec = self.codec_binario
+                    # Um gateway registra várias lâmpadas em "dispositivos";
+                    # todas passam a ser roteadas por esta mesma conexão.
+                    # "dispositivos" pode ser uma lista (todos com os mesmos
+                    # "dados") ou {nome: dados} com atributos por dispositivo.
+                    if not nomes_conexao:
+                        self.conexoes_dispositivos += 1
+                    # Com o token de uma sessão ainda retida, o dispositivo só
+                    # volta a ser roteado por esta conexão: registro, grupos,
+                    # handles e estado continuam os de antes da queda.
+                    retomada = "sessao" in mensagem and self.sessoes.retomar(mensagem["sessao"], nome_conexao, conexao)
+                    if retomada:
+                        sessao = retomada
+                        gateway = sessao.gateway
+                        handles = {nome: self.reconectar(nome, conexao, codec) for nome in sessao.nomes}
+                        self.metricas.incrementar("sessoes_retomadas")
+                    else:
+                        nomes = mensagem.get("dispositivos")
+                        gateway = nomes is not None
+                        if not gateway:
+                            nomes = [nome_conexao]
+                        if not isinstance(nomes, dict):
+                            nomes = dict.fromkeys(nomes, mensagem.get("dados"))
+                        handles = {nome: self.registrar(nome, conexao, codec, dados) for nome, dados in nomes.items()}
+                        sessao = self.sessoes.criar(nome_conexao, list(handles), gateway, conexao)
+                    nomes_conexao.update(handles)
+                    # A confirmação sempre vai em JSON; depois dela a conexão
+                    # passa a usar a codificação escolhida pelo dispositivo.
+                    confirmacao = {
+                        "tipo": "RESPOSTA",
+                        "dispositivo": nome_conexao,
+                        "status": "OK",
+                        "codificacao": codec.codificacao,
+                        "sessao": sessao.token
+                    }
+                    if retomada:
+                        confirmacao["retomada"] = True
+                    # O dispositivo propõe o intervalo de PING e o servidor
+                    # devolve o valor aceito; sem o campo não há acompanhamento.
+                    if "intervalo_ping" in mensagem:
+                        intervalo = self.vivacidade.negociar(mensagem["intervalo_ping"])
+                        self.vivacidade.registrar(conexao, intervalo, nome_conexao)
+                        confirmacao["intervalo_ping"] = intervalo
+                    if gateway:
+                        confirmacao["handles"] = handles
+                    else:
+                        confirmacao["handle"] = handles[nome_conexao]
+                    if retomada:
+                        self.log(f"🔁 {nome_conexao} retomou a sessão ({codec.codificacao}).", categoria="sessao")
+                    elif gateway:
+                        self.log(f"✅ Gateway {nome_conexao} registrou {len(handles)} dispositivos ({codec.codificacao}).")
+                    else:
+                        self.log(f"✅ {nome_conexao} registrado ({codec.codificacao}, handle {handles[nome_conexao]}).")
+                    await self.enviar(conexao, confirmacao)
+                    if self.roteador:
+                        for nome in handles:
+                            await self.roteador.registrado(nome)
 
                 elif tipo == "COMANDO":
-                    dispositivo = mensagem["dispositivo"]
-                    if dispositivo in self.dispositivos:
-                        _, writer_disp = self.dispositivos[dispositivo]
-                        writer_disp.write((json.dumps(mensagem) + "\n").encode('utf-8'))
-                        await writer_disp.drain()
-
-                        resp_data = await reader.readline()
-                        if resp_data:
-                            writer.write(resp_data)
-                            await writer.drain()
-                        self.log(f"📤 Comando enviado para {dispositivo}")
-                    else:
-                        erro = {"tipo": "ERRO", "dados": f"Dispositivo '{dispositivo}' não encontrado."}
-                        writer.write((json.dumps(erro) + "\n").encode('utf-8'))
-                        await writer.drain()
+                    if balde is None:
+                        balde = BaldeTokens(self.taxa_painel, self.rajada_painel)
+                    espera = balde.consumir()
+                    if espera:
+                        self.metricas.incrementar("recusados", SOBRECARREGADO)
+                        resposta = recusa(SOBRECARREGADO, "Limite de comandos por segundo excedido.", espera)
+                        if "id" in mensagem:
+                            resposta["id"] = mensagem["id"]
+                        await self.responder(conexao, resposta, codec)
+                        continue
+                    # Cada comando roda em sua própria tarefa: o painel pode enviar
+                    # vários comandos sem esperar as respostas anteriores.
+                    tarefa = asyncio.create_task(self.encaminhar_comando(mensagem, conexao, codec))
+                    self.tarefas.add(tarefa)
+                    tarefa.add_done_callback(self.tarefas.discard)
+
+                elif tipo == "RESPOSTA":
+                    nome = mensagem.get("dispositivo")
+                    if nome not in nomes_conexao and len(nomes_conexao) == 1:
+                        # Dispositivo individual que não repete o próprio nome
+                        nome = next(iter(nomes_conexao))
+                    if nome in nomes_conexao:
+                        self.resolver_resposta(nome, mensagem)
 
                 elif tipo == "PING":
-                    self.log(f"💓 PING recebido de {mensagem['dispositivo']}")
+                    self.log(f"💓 PING recebido de {mensagem.get('dispositivo') or nome_conexao}", DEBUG, "ping")
+
+                elif tipo == "LISTAR":
+                    await self.responder(conexao, self.listar(mensagem), codec)
+
+                elif tipo == "ASSINAR":
+                    await self.assinar(conexao, mensagem, codec)
+
+                elif tipo == "DESASSINAR":
+                    self.publicador.remover(conexao)
+                    resposta = {"tipo": "RESPOSTA", "status": "OK"}
+                    if "id" in mensagem:
+                        resposta["id"] = mensagem["id"]
+                    await self.responder(conexao, resposta, codec)
+
+                elif tipo in ("AGENDAR", "AGENDAMENTOS", "CANCELAR_AGENDAMENTO"):
+                    await self.responder(conexao, self.tratar_agendamento(mensagem), codec)
+
+                elif tipo == "STATS":
+                    resposta = {"tipo": "RESPOSTA", "dados": self.estatisticas()}
+                    if "id" in mensagem:
+                        resposta["id"] = mensagem["id"]
+                    await self.responder(conexao, resposta, codec)
 
         except Exception as e:
-            self.log(f"❌ Erro em {addr}: {e}")
+            self.log(f"❌ Erro em {addr}: {e}", ERRO)
+        finally:
+            self.conexoes_ativas -= 1
+            self.vivacidade.remover(conexao)
+            self.publicador.remover(conexao)
+            if nomes_conexao:
+                self.conexoes_dispositivos -= 1
+            # Só remove os dispositivos que não se registraram de novo em outra conexão
+            removidos = [nome for nome in nomes_conexao if self.dispositivos.get(nome) is conexao]
+            if sessao is not None and self.sessoes.suspender(sessao, conexao):
+                # Fica fora do ar, mas registrado, até a sessão ser retomada ou expirar (ver vigiar)
+                for nome in removidos:
+                    self.desconectar(nome)
+                if removidos:
+                    self.log(f"⏸️ {nome_conexao} desconectado; sessão retida por {self.sessoes.retencao} s.", categoria="sessao")
+            else:
+                for nome in removidos:
+                    self.remover(nome)
+                if removidos:
+                    self.log(f"⚠️ {nome_conexao} removido" + (f" ({len(removidos)} dispositivos)." if len(removidos) > 1 else "."))
+                if self.roteador:
+                    for nome in removidos:
+                        await self.roteador.removido(nome)
+            if self.captura:
+                self.captura.registrar(self.capturadas.pop(conexao), FECHAMENTO)
+            await conexao.fechar()
+
+    def listar(self, mensagem):
+        """
+        Resposta de LISTAR: atributos dos dispositivos locais que casam com
+        "seletor" e "padrao" (todos, se omitidos), paginados por "cursor" e
+        "limite", ou só as entradas e saídas depois da versão "desde".
+        """
+        try:
+            resposta = {"tipo": "RESPOSTA", **self.registro.listar(
+                mensagem.get("seletor"), mensagem.get("padrao"), mensagem.get("cursor"),
+                mensagem.get("limite", LIMITE_LISTAR), mensagem.get("desde"))}
+        except ValueError as e:
+            resposta = {"tipo": "ERRO", "dados": str(e)}
+        if "id" in mensagem:
+            resposta["id"] = mensagem["id"]
+        return resposta
+
+    async def assinar(self, conexao, mensagem, codec=CODEC_JSON):
+        """
+        Registra o interesse da conexão nas mudanças de estado de um ou mais
+        dispositivos ("dispositivo": nome, lista, "all" ou padrão). Com
+        "desde", envia logo em seguida os EVENTOs perdidos depois dessa
+        sequência; se o histórico não alcança, envia o estado atual de
+        todos os dispositivos assinados e marca "reinicio".
+        """
+        try:
+            desde = mensagem.get("desde")
+            if desde is not None and (isinstance(desde, bool) or not isinstance(desde, int)):
+                raise ValueError("\"desde\" deve ser um número de sequência inteiro.")
+            assinatura = self.publicador.assinar(conexao, mensagem.get("dispositivo", "all"))
+        except ValueError as e:
+            resposta = {"tipo": "ERRO", "dados": str(e)}
+            if "id" in mensagem:
+                resposta["id"] = mensagem["id"]
+            await self.responder(conexao, resposta, codec)
+            return
+        resposta = {"tipo": "RESPOSTA", "status": "OK", "seq": self.publicador.seq}
+        if "id" in mensagem:
+            resposta["id"] = mensagem["id"]
+        eventos = []
+        if desde is not None:
+            eventos = self.publicador.perdidos(assinatura, desde)
+            if eventos is None:
+                resposta["reinicio"] = True
+                eventos = [
+                    {"tipo": "EVENTO", "seq": self.publicador.seq, "dispositivo": nome,
+                     "dados": entrada.estado, "versao": entrada.versao}
+                    for nome, entrada in self.estados.estados.items()
+                    if assinatura in self.publicador.interessados(nome)
+                ]
+        await self.responder(conexao, resposta, codec)
+        for evento in eventos:
+            await self.responder(conexao, evento, codec)
+
+    def tratar_agendamento(self, mensagem):
+        """
+        AGENDAR cria um comando adiado ("em": timestamp) ou recorrente
+        ("intervalo": segundos ou "cron": "min hora dia mês semana") para
+        qualquer alvo aceito por COMANDO. AGENDAMENTOS lista os ativos
+        (filtrando por "dispositivo", até "limite"), além dos últimos
+        concluídos em "concluidos", e CANCELAR_AGENDAMENTO remove um pelo
+        número retornado em "agendamento".
+        """
+        tipo = mensagem["tipo"]
+        try:
+            if tipo == "AGENDAR":
+                if "dispositivo" not in mensagem or "dados" not in mensagem:
+                    raise ValueError("AGENDAR precisa de \"dispositivo\" e \"dados\".")
+                if self.registro.eh_seletor(mensagem["dispositivo"]):
+                    self.registro.termos(mensagem["dispositivo"])
+                agendamento = self.agendador.agendar(mensagem["dispositivo"], mensagem["dados"], mensagem.get("em"),
+                                                     mensagem.get("intervalo"), mensagem.get("cron"))
+                self.log(f"⏰ Agendamento {agendamento.id}: {agendamento.dados} para {agendamento.alvo}", DEBUG, "agenda")
+                resposta = {"tipo": "RESPOSTA", "status": "OK", "agendamento": agendamento.id,
+                            "proxima": agendamento.proxima}
+            elif tipo == "AGENDAMENTOS":
+                alvo = mensagem.get("dispositivo")
+                limite = mensagem.get("limite", LIMITE_AGENDAMENTOS)
+                if isinstance(limite, bool) or not isinstance(limite, int) or limite < 0:
+                    raise ValueError("\"limite\" deve ser um inteiro não negativo.")
+                agendamentos = [a for a in self.agendador.agendamentos.values() if alvo is None or a.alvo == alvo]
+                concluidos = [a for a in self.agendador.concluidos if alvo is None or a.alvo == alvo]
+                resposta = {"tipo": "RESPOSTA", "total": len(agendamentos),
+                            "dados": {a.id: a.descrever() for a in agendamentos[:limite]},
+                            "concluidos": {a.id: a.descrever() for a in concluidos[-limite:] if limite}}
+            elif self.agendador.cancelar(mensagem.get("agendamento")):
+                resposta = {"tipo": "RESPOSTA", "status": "OK"}
+            else:
+                resposta = {"tipo": "ERRO", "dados": f"Agendamento '{mensagem.get('agendamento')}' não encontrado."}
+        except (TypeError, ValueError) as e:
+            resposta = {"tipo": "ERRO", "dados": str(e)}
+        if "id" in mensagem:
+            resposta["id"] = mensagem["id"]
+        return resposta
+
+    async def vigiar(self):
+        """
+        A cada tique da roda, derruba de uma vez as conexões que ficaram sem
+        contato além do prazo. A limpeza dos dispositivos fica com o
+        tratar_cliente de cada uma, que vê a conexão fechar. No mesmo tique
+        descadastra os dispositivos cujas sessões suspensas expiraram.
+        """
+        while True:
+            await asyncio.sleep(self.vivacidade.roda.resolucao)
+            await self.expirar_sessoes()
+            expirados = self.vivacidade.expirados()
+            if not expirados:
+                continue
+            for conexao, _ in expirados:
+                conexao.abortar()
+            self.metricas.incrementar("conexoes_expiradas", valor=len(expirados))
+            nomes = ", ".join(str(nome) for _, nome in expirados[:10])
+            self.log(f"💀 {len(expirados)} conexões sem PING encerradas: {nomes}"
+                     + ("..." if len(expirados) > 10 else ""), AVISO)
+
+    async def expirar_sessoes(self):
+        removidos = [nome for sessao in self.sessoes.expiradas() for nome in sessao.nomes
+                     if nome not in self.dispositivos and nome in self.handles]
+        for nome in removidos:
+            self.descadastrar(nome)
+        if removidos:
+            self.log(f"⌛ {len(removidos)} dispositivos removidos: sessão não retomada.", categoria="sessao")
+        if self.roteador:
+            for nome in removidos:
+                await self.roteador.removido(nome)
+
+    async def encaminhar_comando(self, mensagem, conexao, codec=CODEC_JSON):
+        """
+        Encaminha um COMANDO do painel ao dispositivo e devolve a RESPOSTA
+        ao painel com o mesmo "id" enviado por ele.
+        """
+        resposta = await self.despachar(mensagem.get("dispositivo"), mensagem.get("dados"),
+                                        mensagem.get("timeout", TIMEOUT_RESPOSTA), mensagem.get("forcar", False))
+        resposta = dict(resposta)
+        if "id" in mensagem:
+            resposta["id"] = mensagem["id"]
+        else:
+            resposta.pop("id", None)
+
+        try:
+            await self.responder(conexao, resposta, codec)
+        except ConnectionError:
+            self.log("⚠️ Painel desconectou antes de receber a resposta.", AVISO)
+
+    async def despachar(self, dispositivo, dados, timeout=TIMEOUT_RESPOSTA, forcar=False):
+        """
+        Executa um comando para um alvo qualquer (nome local ou de outro
+        processo, lista, padrão ou seletor) e retorna a RESPOSTA ou ERRO.
+        Usado pelos COMANDOs dos painéis e pelos agendamentos.
+        """
+        self.metricas.incrementar("comandos", dados if dados in COMANDOS_CONHECIDOS else "OUTRO")
+        if self.eh_multiplo(dispositivo):
+            try:
+                return await self.comandar_varios(dispositivo, dados, timeout, forcar)
+            except ValueError as e:
+                return {"tipo": "ERRO", "dados": str(e)}
+        if dispositivo in self.dispositivos:
+            resposta = await self.comandar_dispositivo(dispositivo, dados, timeout, forcar)
+            self.log(f"📤 Comando enviado para {dispositivo}", DEBUG, "mensagem")
+            return resposta
+        if self.roteador and self.roteador.localizar(dispositivo) is not None:
+            dono = self.roteador.localizar(dispositivo)
+            self.metricas.incrementar("comandos_encaminhados")
+            return await self.roteador.comandar(dono, dispositivo, dados, timeout, forcar)
+        return self.ausente(dispositivo)
+
+    def ausente(self, dispositivo):
+        """
+        ERRO para um alvo sem conexão: registrado com a sessão suspensa
+        ("desconectado") ou desconhecido ("não encontrado").
+        """
+        if dispositivo in self.handles:
+            self.metricas.incrementar("dispositivo_desconectado")
+            return {"tipo": "ERRO", "dados": f"Dispositivo '{dispositivo}' desconectado."}
+        self.metricas.incrementar("dispositivo_desconhecido")
+        return {"tipo": "ERRO", "dados": f"Dispositivo '{dispositivo}' não encontrado."}
+
+    async def comandar_dispositivo(self, dispositivo, dados, timeout=TIMEOUT_RESPOSTA, forcar=False):
+        """
+        Envia um comando ao dispositivo com um id de correlação próprio do
+        servidor e aguarda a RESPOSTA correspondente, sem bloquear outros
+        comandos para o mesmo dispositivo.
+
+        STATUS é respondido pelo cache de estados enquanto o último estado
+        confirmado estiver dentro da janela de frescor, a menos que forcar
+        seja verdadeiro. Pelo mesmo cache, LIGAR/DESLIGAR para um estado já
+        confirmado (sem nada em andamento) não vai ao dispositivo.
+
+        Um comando igual ao último enviado ao dispositivo e ainda sem
+        resposta não é reenviado: espera a mesma RESPOSTA (single-flight),
+        cada um com o seu timeout. Como nenhum outro comando passou entre
+        os dois, ela vale para ambos. Com forcar, o comando sempre vai ao
+        dispositivo.
+        """
+        pendentes = self.pendentes.get(dispositivo)
+        if pendentes is None:
+            return self.ausente(dispositivo)
+
+        if dados == "STATUS" and not forcar:
+            entrada = self.estados.obter(dispositivo)
+            if entrada is not None:
+                self.metricas.incrementar("status_do_cache")
+                return self.resposta_do_cache(dispositivo, entrada)
+        elif dados in ("LIGAR", "DESLIGAR"):
+            entrada = self.estados.obter(dispositivo)
+            if not forcar and not pendentes and entrada is not None and entrada.estado == ESTADO_APOS[dados]:
+                self.metricas.incrementar("comandos_colapsados", dados)
+                return self.resposta_do_cache(dispositivo, entrada)
+            self.estados.invalidar(dispositivo)
+
+        voo = self.em_voo.get(dispositivo)
+        if not forcar and voo is not None and voo.dados == dados and not voo.futuro.done():
+            self.metricas.incrementar("comandos_agrupados", dados)
+            voo.esperando += 1
+            try:
+                return await self.aguardar_resposta(dispositivo, voo.futuro, timeout)
+            finally:
+                self.pousar(dispositivo, voo)
+
+        if len(pendentes) >= self.limite_dispositivo:
+            self.metricas.incrementar("recusados", OCUPADO)
+            return recusa(OCUPADO, f"Fila do dispositivo '{dispositivo}' cheia.")
+        if self.em_andamento >= self.limite_em_andamento:
+            self.metricas.incrementar("recusados", SOBRECARREGADO)
+            return recusa(SOBRECARREGADO, "Servidor sobrecarregado.")
+
+        id_comando = next(self.ids) % 0xFFFFFFFF + 1  # cabe nos 32 bits do registro binário
+        futuro = asyncio.get_running_loop().create_future()
+        pendentes[id_comando] = futuro
+        self.em_andamento += 1
+        inicio = time.perf_counter()
+        try:
+            conexao = self.dispositivos[dispositivo]
+            comando = {"tipo": "COMANDO", "dispositivo": dispositivo, "dados": dados, "id": id_comando}
+            await self.enviar(conexao, comando, self.codecs[dispositivo])
+        except ConnectionError:
+            self.em_andamento -= 1
+            pendentes.pop(id_comando, None)
+            self.metricas.incrementar("desconectado_durante_comando")
+            return {"tipo": "ERRO", "dados": f"Sem resposta do dispositivo '{dispositivo}'."}
+        except ValueError as e:
+            # Ex: comando sem código no registro binário; nada foi enviado
+            self.em_andamento -= 1
+            pendentes.pop(id_comando, None)
+            return {"tipo": "ERRO", "dados": f"Comando não pode ser enviado a '{dispositivo}': {e}"}
+        voo = Voo(dados, futuro, pendentes, id_comando)
+        if dados in COMANDOS_CONHECIDOS:
+            self.em_voo[dispositivo] = voo
+        try:
+            resposta = await self.aguardar_resposta(dispositivo, futuro, timeout)
+            if resposta.get("tipo") == "RESPOSTA":
+                self.metricas.observar("latencia_dispositivo", time.perf_counter() - inicio)
+            return resposta
         finally:
-            if nome_dispositivo and nome_dispositivo in self.dispositivos:
-                del self.dispositivos[nome_dispositivo]
-                self.log(f"⚠️ {nome_dispositivo} removido.")
-            writer.close()
-            await writer.wait_closed()
+            self.pousar(dispositivo, voo)
+
+    def pousar(self, dispositivo, voo):
+        """
+        Quem esperava pelo comando terminou; o último libera o id e a vaga.
+        """
+        voo.esperando -= 1
+        if voo.esperando:
+            return
+        self.em_andamento -= 1
+        voo.pendentes.pop(voo.id_comando, None)
+        if self.em_voo.get(dispositivo) is voo:
+            del self.em_voo[dispositivo]
+
+    async def aguardar_resposta(self, dispositivo, futuro, timeout):
+        # shield: o timeout de quem espera não cancela o future dos outros
+        try:
+            return await asyncio.wait_for(asyncio.shield(futuro), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.metricas.incrementar("timeouts")
+        except ConnectionError:
+            self.metricas.incrementar("desconectado_durante_comando")
+        return {"tipo": "ERRO", "dados": f"Sem resposta do dispositivo '{dispositivo}'."}
+
+    def resposta_do_cache(self, dispositivo, entrada):
+        return {
+            "tipo": "RESPOSTA",
+            "dispositivo": dispositivo,
+            "dados": entrada.estado,
+            "versao": entrada.versao,
+            "confirmado_em": entrada.confirmado_em,
+            "cache": True
+        }
+
+    def registrar(self, nome, conexao, codec, dados=None):
+        """
+        Associa o dispositivo à conexão (e codificação) por onde os comandos
+        para ele serão enviados e indexa seus atributos. Retorna o handle
+        do dispositivo.
+        """
+        self.cancelar_pendentes(nome)
+        self.registro.adicionar(nome, dados)
+        self.dispositivos[nome] = conexao
+        self.codecs[nome] = codec
+        self.pendentes[nome] = {}
+        return self.atribuir_handle(nome)
+
+    def reconectar(self, nome, conexao, codec):
+        """
+        Retomada de sessão: o dispositivo volta a ser roteado pela nova
+        conexão mantendo registro e handle. Retorna o handle.
+        """
+        self.cancelar_pendentes(nome)
+        self.dispositivos[nome] = conexao
+        self.codecs[nome] = codec
+        self.pendentes[nome] = {}
+        return self.handles[nome]
+
+    def remover(self, nome):
+        self.desconectar(nome)
+        self.descadastrar(nome)
+
+    def desconectar(self, nome):
+        del self.dispositivos[nome]
+        del self.codecs[nome]
+        self.cancelar_pendentes(nome)
+
+    def descadastrar(self, nome):
+        self.registro.remover(nome)
+        self.estados.remover(nome)
+        self.liberar_handle(nome)
+
+    def atribuir_handle(self, nome):
+        handle = self.handles.get(nome)
+        if handle is None:
+            handle = next(self.proximo_handle)
+            self.handles[nome] = handle
+            self.nomes_por_handle[handle] = nome
+        return handle
+
+    def liberar_handle(self, nome):
+        handle = self.handles.pop(nome, None)
+        self.nomes_por_handle.pop(handle, None)
+
+    def eh_multiplo(self, alvo):
+        """
+        Um COMANDO é múltiplo quando "dispositivo" é uma lista, "all",
+        um padrão com curingas (ex: "LAMPADA_*") ou um seletor de atributos
+        (ex: "tipo=LAMPADA AND grupo=sala").
+        """
+        if isinstance(alvo, list):
+            return True
+        return isinstance(alvo, str) and (alvo == "all" or any(c in alvo for c in "*?[="))
+
+    def resolver_alvos(self, alvo, somente_local=False):
+        if isinstance(alvo, list):
+            return list(dict.fromkeys(alvo))
+        if self.registro.eh_seletor(alvo):
+            # Só dispositivos locais: os atributos não são replicados entre workers.
+            # Como em "all" e nos padrões, ficam de fora os de sessão suspensa.
+            return [nome for nome in self.registro.selecionar(alvo) if nome in self.dispositivos]
+        nomes = list(self.dispositivos)
+        if self.roteador and not somente_local:
+            nomes = list(dict.fromkeys(nomes + list(self.roteador.nomes())))
+        if alvo == "all":
+            return nomes
+        return fnmatch.filter(nomes, alvo)
+
+    async def comandar_varios(self, alvo, dados, timeout=TIMEOUT_RESPOSTA, forcar=False, somente_local=False):
+        """
+        Despacha o mesmo comando para todos os alvos ao mesmo tempo e
+        agrega as respostas em uma única RESPOSTA com o status de cada um.
+        Alvos de outros processos/nós vão em um único comando por dono.
+        """
+        alvos = self.resolver_alvos(alvo, somente_local)
+        locais, remotos = alvos, {}
+        if self.roteador and not somente_local:
+            locais, remotos = self.roteador.particionar(alvo, alvos)
+
+        respostas_remotas = asyncio.gather(*(
+            self.roteador.comandar(dono, nomes, dados, timeout, forcar) for dono, nomes in remotos.items()
+        ))
+        respostas = await asyncio.gather(*(
+            self.comandar_dispositivo(nome, dados, timeout, forcar) for nome in locais
+        ))
+
+        resultados = {}
+        for nome, resposta in zip(locais, respostas):
+            status = "sucesso" if resposta.get("tipo") == "RESPOSTA" else "erro"
+            resultados[nome] = {"status": status, "dados": resposta.get("dados")}
+            if "codigo" in resposta:
+                resultados[nome].update(codigo=resposta["codigo"], tentar_em=resposta["tentar_em"])
+        for (dono, nomes), resposta in zip(remotos.items(), await respostas_remotas):
+            if resposta.get("tipo") == "RESPOSTA":
+                resultados.update(resposta["dados"])
+            elif isinstance(nomes, list):
+                for nome in nomes:
+                    resultados[nome] = {"status": "erro", "dados": resposta.get("dados")}
+            else:
+                # Alvo resolvido no outro nó ("all", padrão): os nomes de lá não são conhecidos aqui
+                resultados[f"@{dono}"] = {"status": "erro", "dados": resposta.get("dados")}
+        falhas = sum(1 for r in resultados.values() if r["status"] == "erro")
+        self.log(f"📤 Comando {dados} enviado para {len(alvos)} dispositivos ({falhas} falhas)")
+
+        return {
+            "tipo": "RESPOSTA",
+            "dispositivo": alvo,
+            "dados": resultados,
+            "total": len(resultados),
+            "falhas": falhas
+        }
+
+    def resolver_resposta(self, dispositivo, mensagem):
+        # Toda RESPOSTA reflete o estado atual do dispositivo, mesmo as atrasadas
+        entrada = self.estados.atualizar(dispositivo, mensagem.get("dados"))
+        if entrada is not None:
+            self.publicador.publicar(dispositivo, entrada)
+            if self.diario:
+                self.diario.registrar(dispositivo, entrada.estado, entrada.versao, entrada.confirmado_em)
+
+        pendentes = self.pendentes.get(dispositivo)
+        if not pendentes:
+            self.log(f"⚠️ RESPOSTA inesperada de {dispositivo} descartada.", AVISO)
+            return
+
+        id_comando = mensagem.get("id")
+        if id_comando is None:
+            # Dispositivo sem suporte a "id": responde na ordem de chegada
+            id_comando = next(iter(pendentes))
+
+        futuro = pendentes.pop(id_comando, None)
+        if futuro is None:
+            self.log(f"⚠️ RESPOSTA atrasada de {dispositivo} (id {id_comando}) descartada.", AVISO)
+        elif not futuro.done():
+            futuro.set_result(mensagem)
+
+    def cancelar_pendentes(self, dispositivo):
+        self.em_voo.pop(dispositivo, None)
+        for futuro in self.pendentes.pop(dispositivo, {}).values():
+            if not futuro.done():
+                futuro.set_exception(ConnectionResetError(dispositivo))
 
     async def iniciar(self):
+        # Cria um socket TCP explícito
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen()
+        sock.setblocking(False)  # Modo não-bloqueante para asyncio
+
+        # Cria o servidor asyncio usando o socket existente
         server = await asyncio.start_server(
-            self.tratar_cliente, '0.0.0.0', 5000
+            self.tratar_cliente,
+            sock=sock,  # Passa o socket já criado
+            limit=LIMITE_LINHA
         )
-        async with server:
-            self.log("🖥️ Servidor assíncrono iniciado na porta 5000")
-            await server.serve_forever()
+        if self.diario:
+            self.log(f"💾 {len(self.estados.estados)} estados restaurados de {self.diario.caminho} "
+                     f"em {self.diario.tempo_carga * 1000:.1f} ms")
+        if self.roteador:
+            await self.roteador.iniciar(self)
+        self.vigia = asyncio.create_task(self.vigiar())  # expiração de conexões sem PING e de sessões
+        self.agenda = asyncio.create_task(self.agendador.rodar())  # disparo dos agendamentos vencidos
+        if self.porta_metricas is not None:
+            await servir_http(lambda: self.metricas.texto(self.medidores()), self.host, self.porta_metricas)
+            self.log(f"📊 Métricas em http://{self.host}:{self.porta_metricas}/")
+
+        try:
+            async with server:
+                self.log(f"🖥️ Servidor assíncrono iniciado na porta {self.port}")
+                # Quem sobe lâmpadas e painéis espera por isto em vez de um sleep fixo
+                self.pronto.set()
+                notificar_pronto()
+                await server.serve_forever()
+        finally:
+            if self.fechar_logs:
+                self.logs.fechar()
 
 if __name__ == "__main__":
-    servidor = ServidorAsync()
+    servidor = ServidorAsync('0.0.0.0', 5000)
     asyncio.run(servidor.iniciar())
@@ -0,0 +1,96 @@
+import collections
+import secrets
+import time
+
+RETENCAO_SESSAO = 120  # segundos que um dispositivo desconectado mantém registro, handle e estado
+
+class SessaoDispositivo:
+    __slots__ = ("token", "nome", "nomes", "gateway", "conexao", "expira_em")
+
+    def __init__(self, token, nome, nomes, gateway, conexao):
+        self.token = token
+        self.nome = nome                # nome da conexão (dispositivo ou gateway)
+        self.nomes = nomes              # dispositivos registrados por ela
+        self.gateway = gateway
+        self.conexao = conexao          # conexão atual (None = suspensa)
+        self.expira_em = None           # time.monotonic() em que a suspensão expira
+
+class SessoesDispositivos:
+    """
+    Sessões retomáveis dos dispositivos. O REGISTRO recebe um token; se a
+    conexão cai, a sessão fica suspensa por `retencao` segundos e um novo
+    REGISTRO com o mesmo token retoma o registro como estava (atributos,
+    grupos, handles), sem reindexar nada. Como a retenção é fixa, as
+    suspensas expiram na ordem em que entraram: uma fila basta, e a
+    expiração é verificada quando o servidor chama expiradas().
+    """
+    def __init__(self, retencao=RETENCAO_SESSAO):
+        self.retencao = retencao
+        self.sessoes = {}   # {token: SessaoDispositivo}
+        self.por_nome = {}  # {nome de dispositivo: token}
+        self.fila = collections.deque()  # [(expira_em, token)] suspensões em ordem de expiração
+        self.suspensas = 0
+
+    def criar(self, nome, nomes, gateway, conexao):
+        # Um registro completo substitui a sessão anterior dos mesmos dispositivos
+        for dispositivo in nomes:
+            anterior = self.por_nome.get(dispositivo)
+            if anterior is not None:
+                self.descartar(anterior)
+        sessao = SessaoDispositivo(secrets.token_urlsafe(16), nome, nomes, gateway, conexao)
+        self.sessoes[sessao.token] = sessao
+        for dispositivo in nomes:
+            self.por_nome[dispositivo] = sessao.token
+        return sessao
+
+    def retomar(self, token, nome, conexao):
+        """
+        Retorna a sessão do token para a nova conexão, ou None se ela não
+        existe (expirou, ou o servidor reiniciou) ou é de outro dispositivo.
+        """
+        sessao = self.sessoes.get(token)
+        if sessao is None or sessao.nome != nome:
+            return None
+        if sessao.conexao is None:
+            self.suspensas -= 1
+        sessao.conexao = conexao
+        sessao.expira_em = None
+        return sessao
+
+    def suspender(self, sessao, conexao):
+        """
+        A conexão da sessão caiu. Retorna False se a sessão já foi retomada
+        em outra conexão (ou descartada) e não há nada a suspender.
+        """
+        if sessao.conexao is not conexao or self.sessoes.get(sessao.token) is not sessao:
+            return False
+        sessao.conexao = None
+        sessao.expira_em = time.monotonic() + self.retencao
+        self.fila.append((sessao.expira_em, sessao.token))
+        self.suspensas += 1
+        return True
+
+    def expiradas(self, agora=None):
+        """
+        Remove e retorna as sessões cuja suspensão venceu.
+        """
+        agora = time.monotonic() if agora is None else agora
+        vencidas = []
+        while self.fila and self.fila[0][0] <= agora:
+            expira_em, token = self.fila.popleft()
+            sessao = self.sessoes.get(token)
+            # Retomadas (ou suspensas de novo depois) ficam para a entrada mais nova
+            if sessao is not None and sessao.conexao is None and sessao.expira_em == expira_em:
+                self.descartar(token)
+                vencidas.append(sessao)
+        return vencidas
+
+    def descartar(self, token):
+        sessao = self.sessoes.pop(token, None)
+        if sessao is None:
+            return
+        if sessao.conexao is None:
+            self.suspensas -= 1
+        for dispositivo in sessao.nomes:
+            if self.por_nome.get(dispositivo) == token:
+                del self.por_nome[dispositivo]
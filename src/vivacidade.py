@@ -0,0 +1,108 @@
+import math
+import time
+
+RESOLUCAO = 1.0            # segundos por posição da roda
+TAMANHO_RODA = 1024        # posições; cobre prazos de até ~17 min sem dar mais de uma volta
+INTERVALO_PING_MIN = 1     # limites do intervalo de PING negociado no REGISTRO
+INTERVALO_PING_MAX = 300
+INTERVALO_PING_PADRAO = 10  # aceito quando o intervalo pedido não é um número
+TOLERANCIA_PING = 3        # PINGs perdidos seguidos até a conexão ser considerada morta
+
+class RodaTemporizadores:
+    """
+    Roda de temporizadores (hashed timing wheel): `tamanho` posições de
+    `resolucao` segundos. Agendar e cancelar são O(1) e cada tique visita
+    só a posição atual, então o custo acompanha os vencimentos e não o
+    número de temporizadores.
+    """
+    def __init__(self, resolucao=RESOLUCAO, tamanho=TAMANHO_RODA):
+        self.resolucao = resolucao
+        self.posicoes = [set() for _ in range(tamanho)]
+        self.vencimentos = {}  # {chave: tique em que vence}
+        self.tique = int(time.monotonic() / resolucao)
+
+    def agendar(self, chave, atraso):
+        self.cancelar(chave)
+        tique = self.tique + max(1, math.ceil(atraso / self.resolucao))
+        self.vencimentos[chave] = tique
+        self.posicoes[tique % len(self.posicoes)].add(chave)
+
+    def cancelar(self, chave):
+        tique = self.vencimentos.pop(chave, None)
+        if tique is not None:
+            self.posicoes[tique % len(self.posicoes)].discard(chave)
+
+    def avancar(self, agora=None):
+        """
+        Avança a roda até `agora` (time.monotonic()) e retorna as chaves vencidas.
+        """
+        agora = time.monotonic() if agora is None else agora
+        alvo = int(agora / self.resolucao)
+        # Depois de uma pausa longa basta uma volta completa
+        self.tique = max(self.tique, alvo - len(self.posicoes))
+        vencidas = []
+        while self.tique < alvo:
+            self.tique += 1
+            posicao = self.posicoes[self.tique % len(self.posicoes)]
+            for chave in [c for c in posicao if self.vencimentos[c] <= self.tique]:
+                posicao.discard(chave)
+                del self.vencimentos[chave]
+                vencidas.append(chave)
+        return vencidas
+
+class Vivacidade:
+    """
+    Último contato de cada conexão que negociou PING. Receber algo só grava
+    o horário; a roda é consultada no prazo e, se houve contato nesse meio
+    tempo, a chave é reagendada para o novo prazo. Assim cada conexão custa
+    no máximo um reagendamento por prazo, independentemente do tráfego.
+    """
+    def __init__(self, tolerancia=TOLERANCIA_PING, roda=None):
+        self.tolerancia = tolerancia
+        self.roda = roda or RodaTemporizadores()
+        self.ultimo_contato = {}  # {chave: time.monotonic()}
+        self.prazos = {}          # {chave: segundos sem contato até expirar}
+        self.dados = {}           # {chave: dado devolvido na expiração (ex: nome)}
+
+    @staticmethod
+    def negociar(intervalo):
+        """
+        Ajusta o intervalo de PING pedido pelo dispositivo aos limites do
+        servidor. Um valor que não é número usa o padrão.
+        """
+        if isinstance(intervalo, bool) or not isinstance(intervalo, (int, float)) or not math.isfinite(intervalo):
+            return INTERVALO_PING_PADRAO
+        return min(max(intervalo, INTERVALO_PING_MIN), INTERVALO_PING_MAX)
+
+    def registrar(self, chave, intervalo, dados=None):
+        prazo = intervalo * self.tolerancia
+        self.ultimo_contato[chave] = time.monotonic()
+        self.prazos[chave] = prazo
+        self.dados[chave] = dados
+        self.roda.agendar(chave, prazo)
+
+    def contato(self, chave):
+        if chave in self.ultimo_contato:
+            self.ultimo_contato[chave] = time.monotonic()
+
+    def remover(self, chave):
+        if self.ultimo_contato.pop(chave, None) is not None:
+            del self.prazos[chave]
+            del self.dados[chave]
+            self.roda.cancelar(chave)
+
+    def expirados(self, agora=None):
+        """
+        Retorna [(chave, dados)] das conexões sem contato dentro do prazo,
+        já removidas do acompanhamento.
+        """
+        agora = time.monotonic() if agora is None else agora
+        expirados = []
+        for chave in self.roda.avancar(agora):
+            restante = self.ultimo_contato[chave] + self.prazos[chave] - agora
+            if restante > 0:
+                self.roda.agendar(chave, restante)
+            else:
+                expirados.append((chave, self.dados[chave]))
+                self.remover(chave)
+        return expirados
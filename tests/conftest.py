@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os módulos de src/ se importam pelo nome (ex: "from protocolo import ..."),
+# como quando são executados de dentro de src/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
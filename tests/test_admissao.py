@@ -0,0 +1,100 @@
+import asyncio
+import socket
+
+import pytest
+
+import admissao
+from admissao import OCUPADO, SOBRECARREGADO, BaldeTokens
+from logs import RegistroLogs
+from protocolo import CODEC_JSON
+from servidor_async import ServidorAsync
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(admissao.time, "monotonic", lambda: agora[0])
+    return agora
+
+def test_balde_consome_a_rajada_e_repoe_pela_taxa(relogio):
+    balde = BaldeTokens(taxa=10, capacidade=2)
+    assert balde.consumir() == balde.consumir() == 0.0
+    assert balde.consumir() == pytest.approx(0.1)
+    relogio[0] += 0.05
+    assert balde.consumir() == pytest.approx(0.05)
+    relogio[0] += 10  # nunca acumula mais que a capacidade
+    assert [balde.consumir() for _ in range(3)][-1] > 0
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.comandos = []
+
+    async def enviar(self, quadro):
+        self.comandos.append(CODEC_JSON.decodificar(quadro))
+
+def criar_servidor(*nomes, **limites):
+    servidor = ServidorAsync(logs=RegistroLogs(console=False), **limites)
+    conexao = ConexaoFalsa()
+    for nome in nomes:
+        servidor.registrar(nome, conexao, CODEC_JSON, {"tipo": "LAMPADA"})
+    return servidor, conexao
+
+def test_fila_do_dispositivo_cheia_responde_ocupado():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1", limite_dispositivo=2)
+        aguardando = [asyncio.create_task(servidor.comandar_dispositivo("L1", "STATUS", 5, forcar=True))
+                      for _ in range(2)]
+        await asyncio.sleep(0)
+        recusado = await servidor.comandar_dispositivo("L1", "STATUS", 5, forcar=True)
+        for tarefa in aguardando:
+            tarefa.cancel()
+        return servidor, conexao, recusado
+
+    servidor, conexao, recusado = asyncio.run(cenario())
+    assert recusado["tipo"] == "ERRO" and recusado["codigo"] == OCUPADO and recusado["tentar_em"] > 0
+    assert len(conexao.comandos) == 2  # o recusado não foi ao dispositivo
+    assert servidor.metricas.contadores[("recusados", OCUPADO)] == 1
+
+def test_limite_global_responde_sobrecarregado():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1", "L2", limite_em_andamento=1)
+        aguardando = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR", 5))
+        await asyncio.sleep(0)
+        recusado = await servidor.comandar_dispositivo("L2", "LIGAR", 5)
+        aguardando.cancel()
+        return recusado
+
+    recusado = asyncio.run(cenario())
+    assert recusado["codigo"] == SOBRECARREGADO
+
+def test_comando_multiplo_leva_o_codigo_de_cada_recusa():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1", "L2", limite_em_andamento=1)
+        return await servidor.despachar(["L1", "L2"], "LIGAR", timeout=0.01)
+
+    resposta = asyncio.run(cenario())
+    recusados = [r for r in resposta["dados"].values() if r.get("codigo") == SOBRECARREGADO]
+    assert len(recusados) == 1 and recusados[0]["tentar_em"] > 0
+    assert resposta["falhas"] == 2  # o outro não respondeu a tempo
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_painel_acima_da_taxa_recebe_sobrecarregado_com_o_id():
+    async def cenario():
+        servidor = ServidorAsync(port=porta_livre(), logs=RegistroLogs(console=False), taxa_painel=1, rajada_painel=1)
+        tarefa = asyncio.create_task(servidor.iniciar())
+        await asyncio.wait_for(servidor.pronto.wait(), 5)
+        reader, writer = await asyncio.open_connection(servidor.host, servidor.port)
+        writer.write(b"".join(CODEC_JSON.codificar({"tipo": "COMANDO", "dispositivo": "X", "dados": "STATUS", "id": i})
+                              for i in (1, 2)))
+        respostas = sorted([await CODEC_JSON.ler(reader), await CODEC_JSON.ler(reader)], key=lambda r: r["id"])
+        writer.close()
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        return respostas
+
+    aceito, recusado = asyncio.run(cenario())
+    assert "codigo" not in aceito and "não encontrado" in aceito["dados"]
+    assert recusado["id"] == 2 and recusado["codigo"] == SOBRECARREGADO and recusado["tentar_em"] > 0
@@ -0,0 +1,259 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from agendador import Agendador, Cron
+from servidor_async import ServidorAsync
+
+def instante(*campos):
+    return datetime.datetime(*campos).timestamp()
+
+# --- Cron ---
+
+def test_cron_campos():
+    cron = Cron("*/15 8-10 1,15 * 1-5")
+    assert cron.minutos == {0, 15, 30, 45}
+    assert cron.horas == {8, 9, 10}
+    assert cron.dias == {1, 15}
+    assert cron.meses == set(range(1, 13))
+    assert cron.semana == {1, 2, 3, 4, 5}
+
+def test_cron_domingo_7():
+    assert Cron("0 0 * * 7").semana == {0}
+
+@pytest.mark.parametrize("expressao", ["", "* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *",
+                                       "a * * * *", "* * 0 * *", "*/0 * * * *",
+                                       "*/-5 * * * *", 5, None])
+def test_cron_invalido(expressao):
+    with pytest.raises(ValueError):
+        Cron(expressao)
+
+def test_cron_proxima_estritamente_depois():
+    cron = Cron("30 18 * * *")
+    assert cron.proxima(instante(2026, 3, 2, 18, 0)) == instante(2026, 3, 2, 18, 30)
+    assert cron.proxima(instante(2026, 3, 2, 18, 30)) == instante(2026, 3, 3, 18, 30)
+
+def test_cron_dia_da_semana():
+    # 2026-03-07 é sábado: a próxima ocorrência de segunda a sexta é a segunda 09
+    assert Cron("0 8 * * 1-5").proxima(instante(2026, 3, 7, 12, 0)) == instante(2026, 3, 9, 8, 0)
+
+def test_cron_dia_ou_semana():
+    # Dia do mês e dia da semana restritos: basta um casar (dia 10 ou domingo)
+    cron = Cron("0 0 10 * 0")
+    assert cron.proxima(instante(2026, 3, 2, 0, 0)) == instante(2026, 3, 8, 0, 0)
+    assert cron.proxima(instante(2026, 3, 8, 0, 0)) == instante(2026, 3, 10, 0, 0)
+
+def test_cron_sem_ocorrencia():
+    with pytest.raises(ValueError):
+        Cron("0 0 31 2 *").proxima(time.time())
+
+# --- Agendador ---
+
+def resposta_agregada(alvo, dados):
+    if isinstance(alvo, list):
+        return {"tipo": "RESPOSTA", "dados": {nome: {"status": "sucesso", "dados": "LIGADA"} for nome in alvo}}
+    return {"tipo": "RESPOSTA", "dados": "LIGADA"}
+
+def criar_agendador(logs=None):
+    executados = []
+
+    async def executar(alvo, dados):
+        executados.append((alvo, dados))
+        return resposta_agregada(alvo, dados)
+
+    def log(mensagem, nivel=None):
+        if logs is not None:
+            logs.append(mensagem)
+
+    agendador = Agendador(executar, lambda alvo: isinstance(alvo, list) or alvo == "all", log)
+    return agendador, executados
+
+@pytest.mark.parametrize("campos", [{"em": "amanha"}, {"em": True}, {"em": [1]}, {"em": float("nan")},
+                                    {"intervalo": "5"}, {"intervalo": None, "em": {}}, {"cron": 5}])
+def test_agendar_recusa_tipos_invalidos(campos):
+    agendador, _ = criar_agendador()
+    with pytest.raises(ValueError):
+        agendador.agendar("L1", "LIGAR", **campos)
+    assert agendador.agendamentos == {}
+    assert agendador.heap == []
+
+@pytest.mark.parametrize("alvo, dados", [("L1", {"x": 1}), ("L1", ["LIGAR"]), ("L1", None),
+                                         ({"x": 1}, "LIGAR"), (["L1", 2], "LIGAR")])
+def test_agendar_recusa_alvo_e_dados_invalidos(alvo, dados):
+    agendador, _ = criar_agendador()
+    with pytest.raises(ValueError):
+        agendador.agendar(alvo, dados, em=time.time())
+    assert agendador.agendamentos == {}
+
+def test_agendar_cron_nao_dispara_antes_de_em():
+    agendador, _ = criar_agendador()
+    for em in (instante(2026, 3, 2, 18, 0, 30), instante(2026, 3, 2, 18, 0) + 0.5):
+        assert agendador.agendar("L1", "LIGAR", em=em, cron="* * * * *").proxima == instante(2026, 3, 2, 18, 1)
+    em = instante(2026, 3, 2, 18, 0)
+    assert agendador.agendar("L1", "LIGAR", em=em, cron="* * * * *").proxima == em
+
+def test_agendar_sem_quando():
+    agendador, _ = criar_agendador()
+    with pytest.raises(ValueError):
+        agendador.agendar("L1", "LIGAR")
+
+def test_intervalo_minimo():
+    agendador, _ = criar_agendador()
+    with pytest.raises(ValueError):
+        agendador.agendar("L1", "LIGAR", intervalo=0.1)
+
+def test_disparo_unico_vai_para_concluidos():
+    async def cenario():
+        agendador, executados = criar_agendador()
+        agendamento = agendador.agendar("L1", "LIGAR", em=time.time() - 1)
+        agendador.disparar(time.time())
+        await asyncio.gather(*agendador.tarefas)
+        return agendador, executados, agendamento
+
+    agendador, executados, agendamento = asyncio.run(cenario())
+    assert executados == [(["L1"], "LIGAR")]
+    assert agendamento.id not in agendador.agendamentos
+    assert list(agendador.concluidos) == [agendamento]
+    assert agendamento.execucoes == 1
+    assert agendamento.ultimo_resultado == {"status": "sucesso", "dados": "LIGADA"}
+
+def test_disparo_agrupa_mesmo_comando():
+    async def cenario():
+        agendador, executados = criar_agendador()
+        a = agendador.agendar("L1", "LIGAR", em=time.time() - 1)
+        b = agendador.agendar("L2", "LIGAR", em=time.time() - 1)
+        c = agendador.agendar("all", "DESLIGAR", em=time.time() - 1)
+        agendador.disparar(time.time())
+        await asyncio.gather(*agendador.tarefas)
+        return executados, a, b, c
+
+    executados, a, b, c = asyncio.run(cenario())
+    assert sorted(map(repr, executados)) == sorted(map(repr, [("all", "DESLIGAR"), (["L1", "L2"], "LIGAR")]))
+    assert a.ultimo_resultado == {"status": "sucesso", "dados": "LIGADA"}
+    assert b.ultimo_resultado == {"status": "sucesso", "dados": "LIGADA"}
+
+def test_recorrente_nao_acumula_execucoes_perdidas():
+    agendador, _ = criar_agendador()
+
+    async def cenario():
+        agora = time.time()
+        agendamento = agendador.agendar("L1", "STATUS", em=agora - 10.5, intervalo=2)
+        agendador.disparar(agora)
+        await asyncio.gather(*agendador.tarefas)
+        return agora, agendamento
+
+    agora, agendamento = asyncio.run(cenario())
+    assert agendamento.execucoes == 1
+    assert agora < agendamento.proxima <= agora + 2
+    assert agendamento.id in agendador.agendamentos
+
+def test_recorrente_muito_atrasado_avanca_em_um_passo():
+    agendador, _ = criar_agendador()
+
+    async def cenario():
+        agora = time.time()
+        agendamento = agendador.agendar("L1", "STATUS", em=0, intervalo=1)
+        inicio = time.perf_counter()
+        agendador.disparar(agora)
+        duracao = time.perf_counter() - inicio
+        await asyncio.gather(*agendador.tarefas)
+        return agora, agendamento, duracao
+
+    agora, agendamento, duracao = asyncio.run(cenario())
+    assert duracao < 0.05
+    assert agora < agendamento.proxima <= agora + 1
+    assert agendamento.proxima == int(agendamento.proxima)  # continua na grade de `em` + k * intervalo
+
+def test_falha_em_um_agendamento_nao_derruba_os_outros():
+    logs = []
+
+    async def cenario():
+        agendador, executados = criar_agendador(logs=logs)
+        eh_multiplo = agendador.eh_multiplo
+
+        def falhar_em_l1(alvo):
+            if alvo == "L1":
+                raise RuntimeError("alvo quebrado")
+            return eh_multiplo(alvo)
+
+        agendador.eh_multiplo = falhar_em_l1
+        ruim = agendador.agendar("L1", "LIGAR", em=time.time() - 1)
+        bom = agendador.agendar("L2", "LIGAR", em=time.time() - 1)
+        agendador.disparar(time.time())
+        await asyncio.gather(*agendador.tarefas)
+        return executados, ruim, bom
+
+    executados, ruim, bom = asyncio.run(cenario())
+    assert executados == [(["L2"], "LIGAR")]
+    assert bom.ultimo_resultado == {"status": "sucesso", "dados": "LIGADA"}
+    assert ruim.ultimo_resultado == {"status": "erro", "dados": "alvo quebrado"}
+    assert any("alvo quebrado" in mensagem for mensagem in logs)
+
+def test_cancelar():
+    agendador, _ = criar_agendador()
+    agendamento = agendador.agendar("L1", "LIGAR", em=time.time() + 60)
+    assert agendador.cancelar(agendamento.id)
+    assert not agendador.cancelar(agendamento.id)
+    agendador.disparar(time.time() + 120)
+    assert not agendador.concluidos
+
+def test_rodar_sobrevive_a_falha_no_disparo():
+    logs = []
+
+    async def cenario():
+        agendador, executados = criar_agendador(logs=logs)
+        original = agendador.disparar
+        falhas = [True]
+
+        def disparar(agora):
+            if falhas:
+                falhas.pop()
+                raise RuntimeError("falha")
+            original(agora)
+
+        agendador.disparar = disparar
+        tarefa = asyncio.create_task(agendador.rodar())
+        agendador.agendar("L1", "LIGAR", em=time.time())
+        await asyncio.sleep(0.05)
+        agendador.agendar("L2", "LIGAR", em=time.time())
+        await asyncio.sleep(0.1)
+        tarefa.cancel()
+        return executados
+
+    executados = asyncio.run(cenario())
+    assert logs and "falha" in logs[0]
+    assert (["L2"], "LIGAR") in executados
+
+# --- AGENDAR pelo servidor ---
+
+@pytest.mark.parametrize("campos", [{"dados": "LIGAR", "em": "amanha"}, {"dados": {"x": 1}, "em": 0}])
+def test_servidor_agendar_tipo_invalido(campos):
+    servidor = ServidorAsync()
+    resposta = servidor.tratar_agendamento({"tipo": "AGENDAR", "dispositivo": "L1", **campos})
+    assert resposta["tipo"] == "ERRO"
+    assert servidor.agendador.agendamentos == {}
+
+@pytest.mark.parametrize("limite", ["x", -1, 1.5, True])
+def test_servidor_agendamentos_limite_invalido(limite):
+    servidor = ServidorAsync()
+    resposta = servidor.tratar_agendamento({"tipo": "AGENDAMENTOS", "limite": limite, "id": 3})
+    assert resposta == {"tipo": "ERRO", "dados": "\"limite\" deve ser um inteiro não negativo.", "id": 3}
+
+def test_servidor_agendamentos_lista_concluidos():
+    async def cenario():
+        servidor = ServidorAsync()
+        servidor.agendador.executar = lambda alvo, dados: asyncio.sleep(0, resposta_agregada(alvo, dados))
+        agendamento = servidor.agendador.agendar("L1", "LIGAR", em=time.time() - 1)
+        servidor.agendador.disparar(time.time())
+        await asyncio.gather(*servidor.agendador.tarefas)
+        return servidor, agendamento
+
+    servidor, agendamento = asyncio.run(cenario())
+    resposta = servidor.tratar_agendamento({"tipo": "AGENDAMENTOS"})
+    assert resposta["total"] == 0
+    assert list(resposta["concluidos"]) == [agendamento.id]
+    assert resposta["concluidos"][agendamento.id]["execucoes"] == 1
+    assert resposta["concluidos"][agendamento.id]["ultimo_resultado"]["status"] == "sucesso"
+    assert servidor.tratar_agendamento({"tipo": "AGENDAMENTOS", "limite": 0})["concluidos"] == {}
@@ -0,0 +1,41 @@
+import types
+
+import benchmark
+from admissao import OCUPADO, SOBRECARREGADO
+
+def test_servidores_compilam():
+    for codigo in benchmark.SERVIDORES.values():
+        compile(codigo.format(raiz=benchmark.RAIZ, src=benchmark.SRC, admissao=benchmark.ADMISSAO_LIVRE),
+                "<servidor>", "exec")
+    assert "limite_dispositivo" in benchmark.SERVIDORES["async"].format(
+        raiz="", src="", admissao=benchmark.ADMISSAO_LIVRE)
+
+def test_recusas_separadas_dos_erros():
+    resultado = {"erros": 0, "recusas": 0}
+    for codigo in (OCUPADO, SOBRECARREGADO, None):
+        benchmark.contar_erro({"tipo": "ERRO", "codigo": codigo, "dados": "x"}, resultado)
+    assert resultado == {"erros": 1, "recusas": 2}
+
+def resource_falso(atual, maximo, infinito=-1):
+    pedidos = []
+    return types.SimpleNamespace(
+        RLIMIT_NOFILE=7, RLIM_INFINITY=infinito,
+        getrlimit=lambda _: (atual, maximo),
+        setrlimit=lambda _, limites: pedidos.append(limites),
+    ), pedidos
+
+def test_liberar_descritores(monkeypatch):
+    falso, pedidos = resource_falso(1024, 4096)
+    monkeypatch.setattr(benchmark, "resource", falso)
+    benchmark.liberar_descritores()
+    assert pedidos == [(4096, 4096)]
+
+def test_liberar_descritores_maximo_ilimitado(monkeypatch):
+    falso, pedidos = resource_falso(1024, -1)
+    monkeypatch.setattr(benchmark, "resource", falso)
+    benchmark.liberar_descritores()
+    assert pedidos == [(benchmark.DESCRITORES, -1)]
+
+def test_liberar_descritores_sem_resource(monkeypatch):
+    monkeypatch.setattr(benchmark, "resource", None)
+    benchmark.liberar_descritores()  # ex: Windows, nada a fazer
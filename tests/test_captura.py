@@ -0,0 +1,93 @@
+import asyncio
+import socket
+
+import pytest
+
+from captura import ABERTURA, ENTRADA, FECHAMENTO, SAIDA, Captura, ler_captura
+from lampada_async import LampadaAsync
+from lancador import subir_lampadas, subir_servidor
+from logs import RegistroLogs
+from protocolo import CODEC_JSON
+from reproducao import ConexaoCapturada, carregar, latencias_originais, reproduzir, resumo_servidor
+from servidor_async import ServidorAsync
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_captura_ida_e_volta_e_resto_incompleto(tmp_path):
+    caminho = str(tmp_path / "trafego.capt")
+    captura = Captura(caminho)
+    conexao = captura.abrir()
+    captura.registrar(conexao, ENTRADA, b'{"tipo": "STATS"}')
+    captura.registrar(conexao, SAIDA, b'{"tipo": "RESPOSTA"}')
+    captura.registrar(conexao, FECHAMENTO)
+    captura.fechar()
+    with open(caminho, 'ab') as f:
+        f.write(b"\x00" * 5)  # servidor derrubado no meio de uma escrita
+
+    registros = list(ler_captura(caminho))
+    assert [(c, e, q) for _, c, e, q in registros] == [
+        (1, ABERTURA, b""), (1, ENTRADA, b'{"tipo": "STATS"}'), (1, SAIDA, b'{"tipo": "RESPOSTA"}'), (1, FECHAMENTO, b"")]
+    assert [i for i, *_ in registros] == sorted(i for i, *_ in registros)
+
+def test_arquivo_que_nao_e_captura(tmp_path):
+    caminho = tmp_path / "outro.bin"
+    caminho.write_bytes(b"nao e captura")
+    with pytest.raises(ValueError):
+        list(ler_captura(str(caminho)))
+
+def test_latencias_casam_por_id_e_pela_ordem():
+    painel = ConexaoCapturada(1, 0.0)
+    painel.entradas = [(1.0, {"tipo": "COMANDO", "id": 7}), (2.0, {"tipo": "STATS"}),
+                       (3.0, {"tipo": "COMANDO", "id": 8}), (3.5, {"tipo": "PING"})]
+    painel.saidas = [(3.25, {"tipo": "RESPOSTA", "id": 8}), (3.5, {"tipo": "EVENTO", "seq": 1}),
+                     (4.0, {"tipo": "RESPOSTA", "id": 7}), (4.5, {"tipo": "RESPOSTA"})]
+    assert latencias_originais(painel) == [(3.0, 0.25), (1.0, 3.0), (2.0, 2.5)]
+
+async def sessao_original(host, port):
+    """
+    Uma lâmpada e um painel que espera cada resposta antes da próxima.
+    """
+    registradas, tarefas = await subir_lampadas([LampadaAsync("L1", host, port, verbosa=False)], timeout=5)
+    reader, writer = await asyncio.open_connection(host, port)
+    for mensagem in ({"tipo": "COMANDO", "dispositivo": "L1", "dados": "LIGAR", "id": 1},
+                     {"tipo": "COMANDO", "dispositivo": "L1", "dados": "STATUS", "id": 2},
+                     {"tipo": "COMANDO", "dispositivo": "X", "dados": "STATUS", "id": 3},
+                     {"tipo": "LISTAR", "id": 4}):
+        writer.write(CODEC_JSON.codificar(mensagem))
+        await CODEC_JSON.ler(reader)
+    writer.close()
+    return tarefas
+
+def respostas_dos_paineis(conexoes):
+    return {mensagem["id"]: (mensagem["tipo"], mensagem.get("dados"))
+            for conexao in conexoes if not conexao.registro for _, mensagem in conexao.saidas}
+
+def test_reproducao_repete_as_respostas_da_captura(tmp_path):
+    original, repetida = str(tmp_path / "original.capt"), str(tmp_path / "repetida.capt")
+
+    async def capturar(caminho, cenario):
+        servidor = ServidorAsync(port=porta_livre(), logs=RegistroLogs(console=False), arquivo_captura=caminho)
+        tarefa = await subir_servidor(servidor, timeout=5)
+        tarefas = await cenario(servidor.host, servidor.port)
+        await asyncio.sleep(0.05)  # as últimas saídas chegam à captura
+        for t in tarefas + [tarefa]:
+            t.cancel()
+        await asyncio.gather(*tarefas, tarefa, return_exceptions=True)
+        servidor.captura.fechar()
+
+    async def repetir(host, port):
+        dispositivos, paineis, resultado = await reproduzir(carregar(original), host, port, 0)
+        assert (len(dispositivos), len(paineis), resultado["sem_resposta"]) == (1, 1, 0)
+        return []
+
+    asyncio.run(capturar(original, sessao_original))
+    asyncio.run(capturar(repetida, repetir))
+
+    antes, depois = carregar(original), carregar(repetida)
+    assert respostas_dos_paineis(depois) == respostas_dos_paineis(antes)
+    assert respostas_dos_paineis(antes)[1] == ("RESPOSTA", "LIGADA")
+    assert respostas_dos_paineis(antes)[3][0] == "ERRO"
+    assert resumo_servidor(depois)["requisicoes"] == resumo_servidor(antes)["requisicoes"] == 4
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from conexao import Conexao
+
+class WriterFalso:
+    """
+    Guarda cada write; drain só termina quando `livre` estiver sinalizado
+    (um par lento segura a escrita).
+    """
+    def __init__(self, erro=None):
+        self.escritas = []
+        self.livre = asyncio.Event()
+        self.livre.set()
+        self.erro = erro
+        self.fechado = False
+
+    def write(self, dados):
+        self.escritas.append(dados)
+
+    async def drain(self):
+        if self.erro:
+            raise self.erro
+        await self.livre.wait()
+
+    def is_closing(self):
+        return self.fechado
+
+    def close(self):
+        self.fechado = True
+
+    async def wait_closed(self):
+        pass
+
+async def rodar_loop(voltas=5):
+    for _ in range(voltas):
+        await asyncio.sleep(0)
+
+def test_quadros_enviados_juntos_saem_em_uma_escrita():
+    async def cenario():
+        writer = WriterFalso()
+        conexao = Conexao(writer)
+        for quadro in (b"a\n", b"b\n", b"c\n"):
+            await conexao.enviar(quadro)
+        await rodar_loop()
+        await conexao.fechar()
+        return writer
+
+    writer = asyncio.run(cenario())
+    assert writer.escritas == [b"a\nb\nc\n"]
+
+def test_acima_do_limite_alto_quem_envia_espera_a_escrita():
+    async def cenario():
+        writer = WriterFalso()
+        writer.livre.clear()  # o par não está lendo
+        conexao = Conexao(writer, limite_alto=10)
+        await conexao.enviar(b"x" * 5)   # abaixo do limite: não bloqueia
+        await rodar_loop()               # a escritora fica presa no drain
+        envio = asyncio.create_task(conexao.enviar(b"y" * 20))
+        await rodar_loop()
+        bloqueado = not envio.done()
+        writer.livre.set()
+        await asyncio.wait_for(envio, 1)
+        await rodar_loop()
+        await conexao.fechar()
+        return writer, bloqueado, conexao.pendente
+
+    writer, bloqueado, pendente = asyncio.run(cenario())
+    assert bloqueado
+    assert writer.escritas == [b"x" * 5, b"y" * 20]
+    assert pendente == 0
+
+def test_fechar_escreve_o_que_estava_na_fila():
+    async def cenario():
+        writer = WriterFalso()
+        conexao = Conexao(writer)
+        await conexao.enviar(b"fim\n")
+        await conexao.fechar()
+        return writer
+
+    writer = asyncio.run(cenario())
+    assert b"".join(writer.escritas) == b"fim\n" and writer.fechado
+
+def test_erro_na_escrita_fecha_e_libera_quem_espera():
+    async def cenario():
+        conexao = Conexao(WriterFalso(erro=ConnectionResetError()), limite_alto=10)
+        with pytest.raises(ConnectionResetError):
+            await asyncio.wait_for(conexao.enviar(b"z" * 20), 1)
+        with pytest.raises(ConnectionResetError):
+            await conexao.enviar(b"depois\n")
+        await conexao.fechar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from estado import CacheEstados
+from eventos import Publicador
+from registro import RegistroDispositivos
+
+class Conexao:
+    def __init__(self, nome):
+        self.nome = nome
+
+def criar_publicador():
+    registro = RegistroDispositivos()
+    registro.adicionar("L1", {"tipo": "LAMPADA", "grupos": ["sala"]})
+    registro.adicionar("L2", {"tipo": "LAMPADA", "grupos": ["quarto"]})
+    registro.adicionar("T1", {"tipo": "TOMADA", "grupos": ["sala"]})
+    enviados = []
+
+    async def enviar(conexao, mensagem):
+        enviados.append((conexao.nome, mensagem))
+
+    return Publicador(enviar, registro, janela=0), enviados
+
+@pytest.mark.parametrize("alvo", [5, None, {"a": 1}, ["L1", 2], [["L1"]]])
+def test_assinar_alvo_invalido(alvo):
+    publicador, _ = criar_publicador()
+    with pytest.raises(ValueError):
+        publicador.assinar(Conexao("p"), alvo)
+    assert publicador.assinaturas == {}
+
+def test_assinar_seletor_invalido():
+    publicador, _ = criar_publicador()
+    with pytest.raises(ValueError):
+        publicador.assinar(Conexao("p"), "cor=azul")
+
+def test_interessados_por_tipo_de_alvo():
+    publicador, _ = criar_publicador()
+    todos = publicador.assinar(Conexao("todos"), "all")
+    nome = publicador.assinar(Conexao("nome"), "L1")
+    lista = publicador.assinar(Conexao("lista"), ["L2", "T1"])
+    padrao = publicador.assinar(Conexao("padrao"), "L*")
+    seletor = publicador.assinar(Conexao("seletor"), "grupo=sala")
+    assert publicador.interessados("L1") == {todos, nome, padrao, seletor}
+    assert publicador.interessados("L2") == {todos, lista, padrao}
+    assert publicador.interessados("T1") == {todos, lista, seletor}
+
+def test_reassinar_e_remover_limpam_indices():
+    publicador, _ = criar_publicador()
+    conexao = Conexao("p")
+    publicador.assinar(conexao, ["L1", "L2"])
+    publicador.assinar(conexao, "grupo=sala")
+    assert publicador.interessados("L2") == set()
+    publicador.remover(conexao)
+    assert publicador.interessados("L1") == set()
+    assert not publicador.por_nome and not publicador.seletores and not publicador.padroes
+
+def test_padroes_e_seletores_indexados():
+    publicador, _ = criar_publicador()
+    sem_prefixo = publicador.assinar(Conexao("a"), "*1")
+    com_prefixo = publicador.assinar(Conexao("b"), "L?")
+    ou = publicador.assinar(Conexao("c"), "grupo=quarto OR tipo=TOMADA")
+    e = publicador.assinar(Conexao("d"), "tipo=LAMPADA AND grupo=sala")
+    repetido = publicador.assinar(Conexao("e"), ["L2", "L2"])
+    assert publicador.prefixos == {"": {"*1"}, "L": {"L?"}}
+    assert publicador.interessados("L1") == {sem_prefixo, com_prefixo, e}
+    assert publicador.interessados("L2") == {com_prefixo, ou, repetido}
+    assert publicador.interessados("T1") == {sem_prefixo, ou}
+    assert publicador.interessados("X9") == set()
+
+def test_remover_limpa_indices_secundarios():
+    publicador, _ = criar_publicador()
+    primeira, segunda = Conexao("p"), Conexao("q")
+    publicador.assinar(primeira, "grupo=sala OR tipo=TOMADA")
+    publicador.assinar(segunda, "grupo=sala OR tipo=TOMADA")
+    publicador.assinar(primeira, "L*")
+    assert publicador.interessados("T1") == {publicador.assinaturas[segunda]}
+    publicador.remover(segunda)
+    assert publicador.seletores == publicador.clausulas == publicador.por_termo == {}
+    publicador.remover(primeira)
+    assert publicador.padroes == publicador.prefixos == {}
+    assert publicador.assinaturas == {}
+
+def test_publicar_coalesce_e_perdidos():
+    cache = CacheEstados()
+
+    async def cenario():
+        publicador, enviados = criar_publicador()
+        assinatura = publicador.assinar(Conexao("p"), "L1")
+        publicador.publicar("L1", cache.atualizar("L1", "LIGADA"))
+        publicador.publicar("L2", cache.atualizar("L2", "LIGADA"))
+        publicador.publicar("L1", cache.atualizar("L1", "DESLIGADA"))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(*publicador.tarefas)
+        return publicador, enviados, assinatura
+
+    publicador, enviados, assinatura = asyncio.run(cenario())
+    assert [(nome, m["dados"], m["seq"]) for nome, m in enviados] == [("p", "DESLIGADA", 3)]
+    assert [e["seq"] for e in publicador.perdidos(assinatura, 0)] == [3]
+    assert publicador.perdidos(assinatura, 10) is None
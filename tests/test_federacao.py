@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import socket
+import time
+
+from federacao import AnelConsistente, RoteadorFederacao, hash_anel
+from logs import RegistroLogs
+from protocolo import CODEC_JSON
+from servidor_async import ServidorAsync
+
+NOS = [f"127.0.0.1:{porta}" for porta in range(6000, 6004)]
+CHAVES = [f"LAMPADA_{i}" for i in range(10000)]
+
+def criar_anel(nos=NOS):
+    anel = AnelConsistente()
+    for no in nos:
+        anel.adicionar(no)
+    return anel
+
+def donos(anel):
+    return {chave: anel.dono(chave) for chave in CHAVES}
+
+def test_anel_vazio_e_um_no():
+    anel = AnelConsistente()
+    assert anel.dono("LAMPADA_1") is None
+    anel.adicionar(NOS[0])
+    assert set(donos(anel).values()) == {NOS[0]}
+
+def test_adicionar_e_remover_repetidos():
+    anel = criar_anel()
+    assert not anel.adicionar(NOS[0])
+    assert len(anel.pontos) == len(NOS) * anel.vnos
+    assert anel.remover(NOS[0]) and not anel.remover(NOS[0])
+    assert len(anel.pontos) == (len(NOS) - 1) * anel.vnos
+
+def test_hash_estavel_entre_processos():
+    # blake2b, não hash(): todos os nós calculam o mesmo dono
+    assert hash_anel("LAMPADA_1") == hash_anel("LAMPADA_1")
+    assert criar_anel(reversed(NOS)).pontos == criar_anel().pontos
+
+def test_distribuicao_das_chaves():
+    contagem = collections.Counter(donos(criar_anel()).values())
+    media = len(CHAVES) / len(NOS)
+    assert set(contagem) == set(NOS)
+    assert all(0.7 * media < n < 1.3 * media for n in contagem.values())
+
+def test_entrada_de_no_so_move_chaves_para_ele():
+    antes = donos(criar_anel())
+    novo = "127.0.0.1:6004"
+    depois = donos(criar_anel(NOS + [novo]))
+    movidas = [chave for chave in CHAVES if antes[chave] != depois[chave]]
+    assert all(depois[chave] == novo for chave in movidas)
+    assert 0.1 * len(CHAVES) < len(movidas) < 0.3 * len(CHAVES)  # em torno de 1/5
+
+def test_saida_de_no_so_move_chaves_dele():
+    anel = criar_anel()
+    antes = donos(anel)
+    anel.remover(NOS[1])
+    depois = donos(anel)
+    assert all(depois[chave] == antes[chave] for chave in CHAVES if antes[chave] != NOS[1])
+    assert NOS[1] not in depois.values()
+
+# --- Dois nós ---
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida a tempo"
+        await asyncio.sleep(0.01)
+
+async def subir_no(sementes=()):
+    endereco = ("127.0.0.1", porta_livre())
+    servidor = ServidorAsync("127.0.0.1", porta_livre(), logs=RegistroLogs(console=False),
+                             roteador=RoteadorFederacao(endereco, sementes))
+    tarefa = asyncio.create_task(servidor.iniciar())
+    await asyncio.wait_for(servidor.pronto.wait(), 5)
+    return servidor, tarefa
+
+async def lampada(servidor, nome, responde=True):
+    reader, writer = await asyncio.open_connection(servidor.host, servidor.port)
+    writer.write(CODEC_JSON.codificar({"tipo": "REGISTRO", "dispositivo": nome}))
+    await CODEC_JSON.ler(reader)
+
+    async def atender():
+        while (comando := await CODEC_JSON.ler(reader)) is not None:
+            if responde:
+                writer.write(CODEC_JSON.codificar({"tipo": "RESPOSTA", "dispositivo": nome,
+                                                   "dados": "LIGADA", "id": comando["id"]}))
+    return asyncio.create_task(atender()), writer
+
+async def dois_nos(cenario):
+    a, tarefa_a = await subir_no()
+    b, tarefa_b = await subir_no([a.roteador.no])
+    tarefas = [tarefa_a, tarefa_b]
+    try:
+        await esperar(lambda: a.roteador.no in b.roteador.canais and b.roteador.no in a.roteador.canais)
+        return await cenario(a, b, tarefas)
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+def test_comando_encaminhado_ao_no_dono():
+    async def cenario(a, b, tarefas):
+        tarefa, _ = await lampada(b, "L1")
+        tarefas.append(tarefa)
+        await esperar(lambda: a.roteador.localizar("L1") is not None)
+        return await a.despachar("L1", "LIGAR", timeout=2)
+
+    resposta = asyncio.run(dois_nos(cenario))
+    assert resposta["tipo"] == "RESPOSTA" and resposta["dados"] == "LIGADA"
+
+def test_par_que_cai_responde_erro_na_hora():
+    async def cenario(a, b, tarefas):
+        tarefa, _ = await lampada(b, "L1", responde=False)
+        tarefas.append(tarefa)
+        await esperar(lambda: a.roteador.localizar("L1") is not None)
+        comando = asyncio.create_task(a.despachar("L1", "LIGAR", timeout=5))
+        await esperar(lambda: a.roteador.pendentes)
+        inicio = time.monotonic()
+        for canal in list(a.roteador.canais[b.roteador.no]):
+            canal.abortar()  # o par caiu no meio do comando
+        resposta = await comando
+        return resposta, time.monotonic() - inicio, a.roteador.pendentes
+
+    resposta, duracao, pendentes = asyncio.run(dois_nos(cenario))
+    assert resposta["tipo"] == "ERRO" and "perdida" in resposta["dados"]
+    assert duracao < 1  # sem esperar timeout + 1
+    assert pendentes == {}
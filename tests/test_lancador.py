@@ -0,0 +1,60 @@
+import asyncio
+import socket
+
+import pytest
+
+import lampada_async
+from lampada_async import LampadaAsync
+from lancador import subir_lampadas, subir_servidor
+from logs import RegistroLogs
+from servidor_async import ServidorAsync
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_lampada_que_nao_subiu_continua_tentando(monkeypatch, capsys):
+    monkeypatch.setattr(lampada_async, "espera_reconexao", lambda tentativa: 0.02)
+    porta = porta_livre()
+
+    async def cenario():
+        lampada = LampadaAsync("L1", port=porta, verbosa=False)
+        registradas, tarefas = await subir_lampadas([lampada], timeout=1)
+        servidor = ServidorAsync(port=porta, logs=RegistroLogs(console=False))
+        tarefa_servidor = await subir_servidor(servidor)
+        for _ in range(100):
+            if "L1" in servidor.dispositivos:
+                break
+            await asyncio.sleep(0.02)
+        conectada = "L1" in servidor.dispositivos
+        for tarefa in tarefas + [tarefa_servidor]:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, tarefa_servidor, return_exceptions=True)
+        return registradas, tarefas, conectada
+
+    registradas, tarefas, conectada = asyncio.run(cenario())
+    assert registradas == [] and len(tarefas) == 1
+    assert "1 lâmpadas não se registraram: L1" in capsys.readouterr().out
+    assert conectada
+
+def test_subir_servidor_levanta_o_erro_de_inicializacao():
+    with socket.socket() as ocupada:
+        ocupada.bind(("127.0.0.1", 0))
+        ocupada.listen()
+        porta = ocupada.getsockname()[1]
+        servidor = ServidorAsync(port=porta, logs=RegistroLogs(console=False))
+        with pytest.raises(OSError):
+            asyncio.run(subir_servidor(servidor, timeout=5))
+
+def test_subir_servidor_retorna_quando_ja_aceita_conexoes():
+    async def cenario():
+        servidor = ServidorAsync(port=porta_livre(), logs=RegistroLogs(console=False))
+        tarefa = await subir_servidor(servidor, timeout=5)
+        _, writer = await asyncio.open_connection(servidor.host, servidor.port)  # sem espera fixa
+        writer.close()
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        return servidor.pronto.is_set()
+
+    assert asyncio.run(cenario())
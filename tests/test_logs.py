@@ -0,0 +1,56 @@
+import asyncio
+import atexit
+import threading
+
+from logs import AVISO, RegistroLogs
+from servidor_async import ServidorAsync
+
+def test_criar_nao_sobe_thread():
+    antes = threading.active_count()
+    registros = [RegistroLogs(console=True) for _ in range(20)]
+    assert threading.active_count() == antes
+    assert all(r.sink is None for r in registros)
+
+def test_sink_sobe_no_primeiro_log_e_para_ao_fechar(tmp_path, monkeypatch):
+    registrados = []
+    monkeypatch.setattr(atexit, "register", registrados.append)
+    monkeypatch.setattr(atexit, "unregister", registrados.remove)
+    arquivo = tmp_path / "servidor.log"
+    logs = RegistroLogs(console=False, arquivo=str(arquivo))
+    logs.log("um")
+    sink = logs.sink
+    assert sink.is_alive() and registrados == [logs.fechar]
+    logs.log("dois")
+    logs.fechar()
+    assert not sink.is_alive() and logs.sink is None and registrados == []
+    assert arquivo.read_text(encoding="utf-8").count("\n") == 2
+    # Depois de fechar, escreve na hora, sem outra thread
+    logs.log("três")
+    assert logs.sink is None
+    assert arquivo.read_text(encoding="utf-8").endswith("três\n")
+    logs.fechar()  # de novo: nada a fazer
+
+def test_sem_saida_nao_sobe_thread():
+    logs = RegistroLogs(console=False)
+    logs.log("só em memória")
+    assert logs.sink is None and logs.recentes()[-1].endswith("só em memória")
+
+def test_nivel_e_amostragem():
+    logs = RegistroLogs(console=False, nivel=AVISO, amostragem={"mensagem": 3})
+    logs.log("info descartada")
+    for i in range(6):
+        logs.log(f"m{i}", AVISO, "mensagem")
+    assert [linha.split("] ")[1] for linha in logs.recentes()] == ["m2", "m5"]
+
+def test_servidor_fecha_os_proprios_logs_ao_encerrar():
+    async def cenario():
+        servidor = ServidorAsync(port=0)
+        servidor.logs.console = False
+        tarefa = asyncio.create_task(servidor.iniciar())
+        await asyncio.wait_for(servidor.pronto.wait(), 5)
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+        return servidor
+
+    servidor = asyncio.run(cenario())
+    assert servidor.logs.fechado and servidor.logs.sink is None
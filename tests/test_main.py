@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def rodar(codigo):
+    # Processo separado: main.py guarda o estado do servidor em variáveis globais
+    return subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ,
+                          capture_output=True, text=True, timeout=30, check=True).stdout.split()
+
+def test_importar_nao_sobe_thread_de_logs():
+    assert rodar("import threading, main; print(main.LOGS, threading.active_count())") == ["None", "1"]
+
+def test_logs_criado_no_primeiro_log():
+    saida = rodar(
+        "import main; main.LOG_CONSOLE = False; main.log('oi'); "
+        "print(main.LOGS.console, main.registro_logs() is main.LOGS, len(main.LOGS.entradas))"
+    )
+    assert saida == ["False", "True", "1"]
+
+# Sobe o servidor no modo indicado, registra duas lâmpadas e manda, de uma
+# vez, três mensagens de um painel; depois, 20 painéis ao mesmo tempo.
+SERVIDOR_E_PAINEIS = """
+import json, socket, threading, main
+main.LOG_CONSOLE = False
+with socket.socket() as livre:
+    livre.bind(("127.0.0.1", 0))
+    main.PORT = livre.getsockname()[1]
+threading.Thread(target=main.iniciar_servidor, args=({modo!r},), daemon=True).start()
+assert main.PRONTO.wait(10)
+
+def conectar():
+    conn = socket.create_connection(("127.0.0.1", main.PORT))
+    return conn, conn.makefile("rb")
+
+def enviar(conn, *mensagens):
+    conn.sendall(b"".join(json.dumps(m).encode() + b"\\n" for m in mensagens))
+
+lampadas = []
+for nome in ("L1", "L2"):
+    conn, leitor = conectar()
+    enviar(conn, {{"tipo": "REGISTRO", "dispositivo": nome}})
+    json.loads(leitor.readline())
+    lampadas.append(conn)
+
+painel, leitor = conectar()
+enviar(painel, {{"tipo": "COMANDO", "dispositivo": "L1", "dados": "LIGAR", "id": 1}},
+       {{"tipo": "COMANDO", "dispositivo": ["L1", "L2"], "dados": "STATUS", "id": 2}},
+       {{"tipo": "STATS", "id": 3}})
+um, dois, tres = (json.loads(leitor.readline()) for _ in range(3))
+print(um["id"], um["dados"], dois["id"], dois["dados"]["L1"]["dados"], dois["dados"]["L2"]["dados"],
+      tres["id"], tres["dados"]["medidores"]["dispositivos_ativos"])
+
+def painel_paralelo(i, respostas):
+    conn, leitor = conectar()
+    enviar(conn, {{"tipo": "COMANDO", "dispositivo": "L2", "dados": "STATUS", "id": i}})
+    respostas[i] = json.loads(leitor.readline())["id"] == i
+    conn.close()
+
+respostas = {{}}
+threads = [threading.Thread(target=painel_paralelo, args=(i, respostas)) for i in range(20)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join(10)
+print(sum(respostas.values()))
+"""
+
+def test_modos_do_servidor_atendem_mensagens_enfileiradas_e_paineis_simultaneos():
+    for modo in ("threads", "selectors", "pool"):
+        saida = rodar(SERVIDOR_E_PAINEIS.format(modo=modo))
+        assert saida == ["1", "LIGADA", "2", "LIGADA", "DESLIGADA", "3", "2", "20"], modo
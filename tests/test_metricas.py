@@ -0,0 +1,87 @@
+import asyncio
+
+from logs import RegistroLogs
+from metricas import Histograma, Metricas, servir_http
+from protocolo import CODEC_JSON
+from servidor_async import ServidorAsync
+
+def test_percentis_pelo_limite_do_bucket():
+    histograma = Histograma(limites=(0.01, 0.1, 1.0))
+    for valor in [0.005] * 90 + [0.05] * 9 + [5.0]:
+        histograma.observar(valor)
+    assert (histograma.percentil(50), histograma.percentil(95), histograma.percentil(100)) == (0.01, 0.1, float("inf"))
+    assert histograma.contagens == [90, 9, 0, 1] and histograma.total == 100
+    assert Histograma().percentil(99) is None
+
+def test_instantaneo_agrupa_rotulos():
+    metricas = Metricas()
+    metricas.incrementar("comandos", "LIGAR")
+    metricas.incrementar("comandos", "LIGAR")
+    metricas.incrementar("comandos", "STATUS")
+    metricas.incrementar("bytes_entrada", valor=120)
+    metricas.observar("latencia", 0.002)
+    dados = metricas.instantaneo({"conexoes": 3})
+    assert dados["contadores"] == {"comandos": {"LIGAR": 2, "STATUS": 1}, "bytes_entrada": 120}
+    assert dados["histogramas"]["latencia"]["total"] == 1
+    assert dados["medidores"] == {"conexoes": 3}
+
+def test_texto_com_buckets_acumulados():
+    metricas = Metricas()
+    metricas.incrementar("recusados", "OCUPADO")
+    metricas.histogramas["latencia"] = Histograma(limites=(0.1, 1.0))
+    metricas.observar("latencia", 0.05)
+    metricas.observar("latencia", 0.5)
+    linhas = metricas.texto({"conexoes": 2}).splitlines()
+    assert 'controle_recusados_total{rotulo="OCUPADO"} 1' in linhas
+    assert linhas[-5:] == [
+        'controle_latencia_segundos_bucket{le="1.0"} 2',
+        'controle_latencia_segundos_bucket{le="+Inf"} 2',
+        "controle_latencia_segundos_sum 0.55",
+        "controle_latencia_segundos_count 2",
+        "controle_conexoes 2",
+    ]
+
+def test_endpoint_http_responde_o_texto():
+    async def cenario():
+        servidor = await servir_http(lambda: "controle_conexoes 1\n", port=0)
+        porta = servidor.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        resposta = await reader.read()
+        writer.close()
+        servidor.close()
+        await servidor.wait_closed()
+        return resposta
+
+    resposta = asyncio.run(cenario())
+    assert resposta.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert resposta.endswith(b"\r\n\r\ncontrole_conexoes 1\n")
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.comandos = []
+
+    async def enviar(self, quadro):
+        self.comandos.append(CODEC_JSON.decodificar(quadro))
+
+def test_stats_reflete_comandos_e_filas():
+    async def cenario():
+        servidor = ServidorAsync(logs=RegistroLogs(console=False))
+        conexao = ConexaoFalsa()
+        servidor.registrar("L1", conexao, CODEC_JSON, {"tipo": "LAMPADA"})
+        respondido = asyncio.create_task(servidor.despachar("L1", "LIGAR"))
+        await asyncio.sleep(0)
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA", "id": conexao.comandos[0]["id"]})
+        await respondido
+        aguardando = asyncio.create_task(servidor.despachar("L1", "DESLIGAR"))
+        await asyncio.sleep(0)
+        dados = servidor.estatisticas()
+        aguardando.cancel()
+        return dados
+
+    dados = asyncio.run(cenario())
+    assert dados["contadores"]["comandos"] == {"LIGAR": 1, "DESLIGAR": 1}
+    assert dados["histogramas"]["latencia_dispositivo"]["total"] == 1
+    assert dados["medidores"]["dispositivos_ativos"] == 1
+    assert dados["medidores"]["comandos_em_andamento"] == 1
+    assert dados["filas"] == {"L1": 1}
@@ -0,0 +1,91 @@
+import asyncio
+import socket
+import time
+
+from logs import RegistroLogs
+from multicore import RoteadorWorkers
+from protocolo import CODEC_JSON
+from servidor_async import ServidorAsync
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida a tempo"
+        await asyncio.sleep(0.01)
+
+async def lampada(servidor, nome):
+    reader, writer = await asyncio.open_connection(servidor.host, servidor.port)
+    writer.write(CODEC_JSON.codificar({"tipo": "REGISTRO", "dispositivo": nome}))
+    await CODEC_JSON.ler(reader)
+
+    async def atender():
+        while (comando := await CODEC_JSON.ler(reader)) is not None:
+            writer.write(CODEC_JSON.codificar({"tipo": "RESPOSTA", "dispositivo": nome,
+                                               "dados": "LIGADA", "id": comando["id"]}))
+    return asyncio.create_task(atender()), writer
+
+def dois_workers(tmp_path, cenario, **opcoes):
+    """
+    Dois workers no mesmo loop, cada um na sua porta (sem SO_REUSEPORT),
+    ligados pelos sockets Unix como em rodar_workers.
+    """
+    async def rodar():
+        prefixo = str(tmp_path / "ctl")
+        workers = [ServidorAsync("127.0.0.1", porta_livre(), logs=RegistroLogs(console=False),
+                                 roteador=RoteadorWorkers(i, 2, prefixo), **opcoes) for i in range(2)]
+        tarefas = [asyncio.create_task(w.iniciar()) for w in workers]
+        try:
+            for worker in workers:
+                await asyncio.wait_for(worker.pronto.wait(), 5)
+            await esperar(lambda: all(w.roteador.canais for w in workers))
+            return await cenario(*workers, tarefas)
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+
+    return asyncio.run(rodar())
+
+def test_comando_roteado_ao_worker_dono(tmp_path):
+    async def cenario(w0, w1, tarefas):
+        tarefa, _ = await lampada(w1, "L1")
+        tarefas.append(tarefa)
+        await esperar(lambda: w0.roteador.localizar("L1") == 1)
+        return await w0.despachar("L1", "LIGAR", timeout=2)
+
+    resposta = dois_workers(tmp_path, cenario)
+    assert resposta["tipo"] == "RESPOSTA" and resposta["dados"] == "LIGADA"
+
+def test_comando_multiplo_junta_locais_e_remotos(tmp_path):
+    async def cenario(w0, w1, tarefas):
+        for servidor, nome in ((w0, "L0"), (w1, "L1")):
+            tarefa, _ = await lampada(servidor, nome)
+            tarefas.append(tarefa)
+        await esperar(lambda: w0.roteador.localizar("L1") == 1)
+        return await w0.despachar(["L0", "L1"], "LIGAR", timeout=2)
+
+    resposta = dois_workers(tmp_path, cenario)
+    assert resposta["falhas"] == 0
+    assert resposta["dados"] == {"L0": {"status": "sucesso", "dados": "LIGADA"},
+                                 "L1": {"status": "sucesso", "dados": "LIGADA"}}
+
+def test_saida_do_dispositivo_chega_aos_outros_workers(tmp_path):
+    async def cenario(w0, w1, tarefas):
+        tarefa, writer = await lampada(w1, "L1")
+        tarefas.append(tarefa)
+        await esperar(lambda: w0.roteador.localizar("L1") == 1)
+        writer.close()
+        await esperar(lambda: "L1" not in w1.dispositivos)
+        suspenso = await w0.despachar("L1", "LIGAR", timeout=1)  # sessão retida no dono
+        await w1.expirar_sessoes()
+        await esperar(lambda: w0.roteador.localizar("L1") is None)
+        return suspenso, await w0.despachar("L1", "LIGAR", timeout=1)
+
+    suspenso, removido = dois_workers(tmp_path, cenario, retencao_sessao=0)
+    assert suspenso["tipo"] == "ERRO" and "desconectado" in suspenso["dados"]
+    assert removido["tipo"] == "ERRO" and "não encontrado" in removido["dados"]
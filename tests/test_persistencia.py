@@ -0,0 +1,66 @@
+import os
+
+from logs import RegistroLogs
+from persistencia import REGISTRO_ESTADO, Diario
+from protocolo import CODEC_JSON
+from servidor_async import ServidorAsync
+
+def reabrir(caminho, **opcoes):
+    diario = Diario(caminho, **opcoes)
+    estados = diario.estados()
+    diario.fechar()
+    return estados
+
+def test_ultimo_estado_de_cada_nome_sobrevive_ao_reinicio(tmp_path):
+    caminho = str(tmp_path / "estados.log")
+    diario = Diario(caminho)
+    diario.registrar("L1", "LIGADA", confirmado_em=1.0)
+    diario.registrar("L1", "DESLIGADA", confirmado_em=2.0)  # versão anterior + 1
+    diario.registrar("SALA_Ç", "LIGADA", versao=7, confirmado_em=3.0)
+    diario.registrar("L2", "PISCANDO")                      # não é um estado: ignorado
+    diario.fechar()
+    diario.registrar("L3", "LIGADA")                        # depois de fechado: ignorado
+    assert reabrir(caminho) == {"L1": ("DESLIGADA", 2, 2.0), "SALA_Ç": ("LIGADA", 7, 3.0)}
+
+def test_registro_incompleto_no_fim_e_descartado(tmp_path):
+    caminho = str(tmp_path / "estados.log")
+    diario = Diario(caminho)
+    diario.registrar("L1", "LIGADA", confirmado_em=1.0)
+    diario.fechar()
+    with open(caminho, 'ab') as f:
+        f.write(REGISTRO_ESTADO.pack(1, 2, 2.0, 10) + b"L2")  # queda no meio da escrita
+
+    diario = Diario(caminho)
+    assert os.path.getsize(caminho) == diario.tamanho == REGISTRO_ESTADO.size + len("L1")
+    diario.registrar("L3", "DESLIGADA", confirmado_em=3.0)
+    diario.fechar()
+    assert reabrir(caminho) == {"L1": ("LIGADA", 1, 1.0), "L3": ("DESLIGADA", 1, 3.0)}
+
+def test_diario_grande_vira_snapshot(tmp_path):
+    caminho = str(tmp_path / "estados.log")
+    diario = Diario(caminho, limite=200)
+    for i in range(50):
+        diario.registrar(f"L{i % 5}", ("LIGADA", "DESLIGADA")[i % 2], confirmado_em=float(i))
+    diario.descarregar()
+    assert os.path.getsize(caminho) == 0
+    assert os.path.getsize(caminho + ".snap") > 0
+    diario.registrar("L0", "LIGADA", confirmado_em=99.0)
+    diario.fechar()
+
+    estados = reabrir(caminho)
+    assert estados["L0"] == ("LIGADA", 11, 99.0)
+    assert estados["L4"] == ("DESLIGADA", 10, 49.0)
+    assert len(estados) == 5
+
+def test_servidor_restaura_o_cache_pelo_diario(tmp_path):
+    caminho = str(tmp_path / "estados.log")
+    servidor = ServidorAsync(logs=RegistroLogs(console=False), arquivo_estados=caminho)
+    servidor.registrar("L1", None, CODEC_JSON, {"tipo": "LAMPADA"})
+    servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA"})
+    versao = servidor.estados.estados["L1"].versao
+    servidor.diario.fechar()
+
+    reiniciado = ServidorAsync(logs=RegistroLogs(console=False), arquivo_estados=caminho)
+    reiniciado.diario.fechar()
+    entrada = reiniciado.estados.estados["L1"]
+    assert (entrada.estado, entrada.versao) == ("LIGADA", versao)
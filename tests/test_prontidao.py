@@ -0,0 +1,46 @@
+import asyncio
+import socket
+
+from lampada_async import LampadaAsync
+from lancador import subir_lampadas, subir_servidor
+from logs import RegistroLogs
+from prontidao import notificar_pronto, sondar
+from servidor_async import ServidorAsync
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_notificar_pronto_envia_ready_ao_supervisor(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "notify")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as supervisor:
+        supervisor.bind(caminho)
+        supervisor.settimeout(1)
+        monkeypatch.setenv("NOTIFY_SOCKET", caminho)
+        notificar_pronto()
+        assert supervisor.recv(64) == b"READY=1"
+
+def test_notificar_pronto_sem_supervisor_nao_faz_nada(monkeypatch):
+    monkeypatch.delenv("NOTIFY_SOCKET", raising=False)
+    notificar_pronto()
+    monkeypatch.setenv("NOTIFY_SOCKET", "/caminho/que/nao/existe")
+    notificar_pronto()  # supervisor fora do ar: não derruba o servidor
+
+def test_sonda_sem_servidor_desiste_no_prazo():
+    assert not sondar(port=porta_livre(), timeout=0.3)
+
+def test_sonda_espera_os_dispositivos():
+    async def cenario():
+        servidor = ServidorAsync(port=porta_livre(), logs=RegistroLogs(console=False))
+        tarefa = await subir_servidor(servidor, timeout=5)
+        sem_lampada = await asyncio.to_thread(sondar, servidor.host, servidor.port, 1, 0.3)
+        lampada = LampadaAsync("L1", port=servidor.port, verbosa=False)
+        registradas, tarefas = await subir_lampadas([lampada], timeout=5)
+        com_lampada = await asyncio.to_thread(sondar, servidor.host, servidor.port, 1, 5)
+        for t in tarefas + [tarefa]:
+            t.cancel()
+        await asyncio.gather(*tarefas, tarefa, return_exceptions=True)
+        return sem_lampada, registradas == [lampada], com_lampada
+
+    assert asyncio.run(cenario()) == (False, True, True)
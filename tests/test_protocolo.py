@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from protocolo import (CODEC_JSON, ENQUADRAMENTO_LINHA, ENQUADRAMENTO_PREFIXO, REGISTRO,
+                       CodecBinario, LeitorQuadros, enquadrar)
+
+def ler_de(dados, codec):
+    async def ler():
+        reader = asyncio.StreamReader()
+        reader.feed_data(dados)
+        reader.feed_eof()
+        mensagens = []
+        while (mensagem := await codec.ler(reader)) is not None:
+            mensagens.append(mensagem)
+        return mensagens
+    return asyncio.run(ler())
+
+# --- CodecJSON ---
+
+def test_json_ida_e_volta():
+    mensagem = {"tipo": "COMANDO", "dispositivo": "LÂMPADA_1", "dados": "LIGAR", "id": 7}
+    quadro = CODEC_JSON.codificar(mensagem)
+    assert quadro.endswith(b"\n") and quadro.count(b"\n") == 1
+    assert CODEC_JSON.decodificar(quadro) == mensagem
+
+def test_json_le_varios_quadros():
+    dados = CODEC_JSON.codificar({"id": 1}) + CODEC_JSON.codificar({"id": 2})
+    assert ler_de(dados, CODEC_JSON) == [{"id": 1}, {"id": 2}]
+
+def test_json_invalido():
+    with pytest.raises(ValueError):
+        CODEC_JSON.decodificar(b"{nao e json\n")
+
+# --- CodecBinario ---
+
+def criar_binario():
+    return CodecBinario({1: "L1", 2: "L2"}, {"L1": 1, "L2": 2})
+
+def test_binario_ida_e_volta():
+    codec = criar_binario()
+    mensagem = {"tipo": "RESPOSTA", "dispositivo": "L2", "dados": "LIGADA", "id": 42}
+    quadro = codec.codificar(mensagem)
+    assert len(quadro) == REGISTRO.size == 12
+    assert codec.decodificar(quadro) == mensagem
+
+def test_binario_valores_desconhecidos_viram_padrao():
+    codec = criar_binario()
+    quadro = codec.codificar({"tipo": "PING", "dispositivo": "OUTRA"})
+    assert codec.decodificar(quadro) == {"tipo": "PING", "dispositivo": None, "dados": "COMANDO DESCONHECIDO", "id": 0}
+
+@pytest.mark.parametrize("mensagem", [
+    {"tipo": "COMANDO", "dispositivo": "L1", "dados": "DESLIGAR", "id": 0xFFFFFFFF},
+    {"tipo": "EVENTO", "dispositivo": "L2", "dados": "LIGADA", "seq": 9},
+    {"tipo": "ERRO", "dispositivo": "L1", "dados": "OCUPADO", "id": 3},
+])
+def test_binario_ida_e_volta_outros_tipos(mensagem):
+    codec = criar_binario()
+    assert codec.decodificar(codec.codificar(mensagem)) == mensagem
+
+def test_binario_erro_leva_o_codigo_de_admissao_ou_o_generico():
+    codec = criar_binario()
+    ocupado = {"tipo": "ERRO", "codigo": "SOBRECARREGADO", "dados": "Servidor sobrecarregado.", "id": 5}
+    assert codec.decodificar(codec.codificar(ocupado))["dados"] == "SOBRECARREGADO"
+    generico = {"tipo": "ERRO", "dispositivo": "L1", "dados": "Tempo esgotado.", "id": 6}
+    assert codec.decodificar(codec.codificar(generico))["dados"] == "ERRO"
+
+@pytest.mark.parametrize("mensagem", [
+    {"tipo": "LISTAR", "id": 1},
+    {"tipo": "COMANDO", "dispositivo": "L1", "dados": "PISCAR", "id": 1},
+    {"tipo": "RESPOSTA", "dados": {"L1": {"status": "ok"}}, "id": 1},
+    {"tipo": "RESPOSTA", "dispositivo": "L1", "dados": "LIGADA", "id": "painel-1"},
+    {"tipo": "RESPOSTA", "dispositivo": "L1", "dados": "LIGADA", "id": 2 ** 32},
+])
+def test_binario_sem_representacao_levanta_erro(mensagem):
+    with pytest.raises(ValueError):
+        criar_binario().codificar(mensagem)
+
+@pytest.mark.parametrize("quadro", [REGISTRO.pack(0, 1, 0, 1, 1), REGISTRO.pack(99, 1, 0, 1, 1),
+                                    REGISTRO.pack(1, 200, 0, 1, 1), b"\x01\x01"])
+def test_binario_registro_invalido(quadro):
+    with pytest.raises(ValueError):
+        criar_binario().decodificar(quadro)
+
+def test_binario_le_registros_e_ignora_resto_incompleto():
+    codec = criar_binario()
+    dados = codec.codificar({"tipo": "COMANDO", "dispositivo": "L1", "dados": "STATUS", "id": 1}) * 2 + b"\x01\x02"
+    assert [m["id"] for m in ler_de(dados, codec)] == [1, 1]
+
+# --- LeitorQuadros ---
+
+class SocketFalso:
+    """
+    Entrega os pedaços na ordem, um por recv_into; depois, conexão fechada.
+    """
+    def __init__(self, pedacos):
+        self.pedacos = list(pedacos)
+
+    def recv_into(self, buffer):
+        if not self.pedacos:
+            return 0
+        pedaco = self.pedacos.pop(0)
+        n = min(len(pedaco), len(buffer))
+        buffer[:n] = pedaco[:n]
+        if n < len(pedaco):
+            self.pedacos.insert(0, pedaco[n:])
+        return n
+
+def fatiar(dados, tamanho):
+    return [dados[i:i + tamanho] for i in range(0, len(dados), tamanho)]
+
+ENQUADRAMENTOS = [ENQUADRAMENTO_LINHA, ENQUADRAMENTO_PREFIXO]
+QUADROS = [b'{"tipo": "PING"}', b"x" * 300, b'{"tipo": "STATUS", "id": 7}']
+
+@pytest.mark.parametrize("enquadramento", ENQUADRAMENTOS)
+@pytest.mark.parametrize("pedaco", [1, 5, 64, 4096])
+def test_leitor_remonta_quadros_partidos_e_enfileirados(enquadramento, pedaco):
+    dados = b"".join(enquadrar(q, enquadramento) for q in QUADROS)
+    leitor = LeitorQuadros(enquadramento, tamanho=16)
+    sock = SocketFalso(fatiar(dados, pedaco))
+    recebidos = []
+    while (quadros := leitor.receber(sock)) is not None:
+        recebidos += quadros
+    assert recebidos == QUADROS
+
+@pytest.mark.parametrize("enquadramento", ENQUADRAMENTOS)
+def test_leitor_proximo_um_de_cada_vez(enquadramento):
+    dados = b"".join(enquadrar(q, enquadramento) for q in QUADROS)
+    leitor = LeitorQuadros(enquadramento, tamanho=16)
+    sock = SocketFalso([dados])  # todos os quadros em uma única leitura
+    assert [leitor.proximo(sock) for _ in QUADROS] == QUADROS
+    assert sock.pedacos == []    # leu tudo de uma vez, o resto saiu do buffer
+    assert leitor.proximo(sock) is None
+
+def test_leitor_linha_ignora_linhas_vazias():
+    leitor = LeitorQuadros(tamanho=16)
+    assert leitor.receber(SocketFalso([b"\n\na\n\nb\n"])) == [b"a", b"b"]
+
+def test_leitor_devolve_buffer_grande():
+    leitor = LeitorQuadros(tamanho=16)
+    sock = SocketFalso(fatiar(b"y" * 200 + b"\n", 16))
+    recebidos = []
+    while not recebidos:
+        recebidos = leitor.receber(sock)
+    assert recebidos == [b"y" * 200]
+    assert len(leitor.buffer) > 4 * 16
+    leitor.preparar()  # nada pendente: volta ao tamanho inicial
+    assert len(leitor.buffer) == 16
+
+@pytest.mark.parametrize("enquadramento, dados", [
+    (ENQUADRAMENTO_LINHA, b"z" * 100),
+    (ENQUADRAMENTO_PREFIXO, enquadrar(b"z" * 100, ENQUADRAMENTO_PREFIXO)[:10]),
+])
+def test_leitor_quadro_acima_do_limite(enquadramento, dados):
+    leitor = LeitorQuadros(enquadramento, tamanho=16, limite=50)
+    sock = SocketFalso(fatiar(dados, 16))
+    with pytest.raises(ValueError):
+        while leitor.receber(sock) is not None:
+            pass
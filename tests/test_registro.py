@@ -0,0 +1,139 @@
+import pytest
+
+from registro import ENTROU, SAIU, RegistroDispositivos
+
+def criar_registro():
+    registro = RegistroDispositivos()
+    registro.adicionar("L1", {"tipo": "LAMPADA", "tags": ["rgb"], "grupos": ["sala"]})
+    registro.adicionar("L2", {"tipo": "LAMPADA", "grupos": ["quarto", "quarto"]})
+    registro.adicionar("L3", {"tipo": "LAMPADA", "tags": ["rgb"], "grupos": ["quarto"]})
+    registro.adicionar("T1", {"tipo": "TOMADA", "grupos": ["sala"]})
+    return registro
+
+# --- Seletores ---
+
+@pytest.mark.parametrize("seletor, nomes", [
+    ("tipo=LAMPADA", ["L1", "L2", "L3"]),
+    ("grupo=sala", ["L1", "T1"]),
+    ("tipo=LAMPADA AND grupo=quarto", ["L2", "L3"]),
+    ("tipo=LAMPADA AND grupo=quarto AND tag=rgb", ["L3"]),
+    ("tag=rgb OR tipo=TOMADA", ["L1", "L3", "T1"]),
+    ("tipo=TOMADA AND grupo=quarto OR tag=rgb AND grupo=sala", ["L1"]),
+    (" TIPO = LAMPADA  AND  grupo=sala ", ["L1"]),
+    ("tipo=ventilador", []),
+])
+def test_selecionar(seletor, nomes):
+    assert criar_registro().selecionar(seletor) == nomes
+
+@pytest.mark.parametrize("seletor", ["cor=azul", "tipo=", "tipo=LAMPADA AND sala", "=LAMPADA"])
+def test_seletor_invalido(seletor):
+    with pytest.raises(ValueError):
+        criar_registro().selecionar(seletor)
+
+def test_casa_chaves_igual_a_selecionar():
+    registro = criar_registro()
+    for seletor in ("tag=rgb OR tipo=TOMADA", "tipo=LAMPADA AND grupo=quarto"):
+        clausulas = registro.termos(seletor)
+        casam = [nome for nome in registro.ordenados
+                 if registro.casa_chaves(registro.chaves_de(nome), clausulas)]
+        assert casam == registro.selecionar(seletor)
+    assert registro.chaves_de("X9") == set()
+
+def test_reregistrar_e_remover_atualizam_indices():
+    registro = criar_registro()
+    registro.adicionar("L1", {"tipo": "LAMPADA", "grupos": ["quarto"]})
+    assert registro.selecionar("grupo=sala") == ["T1"]
+    assert registro.selecionar("tag=rgb") == ["L3"]
+    registro.remover("T1")
+    registro.remover("T1")  # já removido: nada muda
+    assert registro.selecionar("grupo=sala") == []
+    assert ("grupo", "sala") not in registro.indices
+    assert registro.ordenados == ["L1", "L2", "L3"]
+    assert registro.atributos["L2"]["grupos"] == ["quarto"]
+
+# --- LISTAR paginado ---
+
+def paginas(registro, **filtros):
+    cursor, vistas = None, []
+    while True:
+        pagina = registro.listar(cursor=cursor, **filtros)
+        vistas.append(list(pagina["dados"]))
+        cursor = pagina["cursor"]
+        if cursor is None:
+            return vistas
+
+def test_listar_por_cursor():
+    registro = RegistroDispositivos()
+    for i in range(7):
+        registro.adicionar(f"D{i}")
+    assert paginas(registro, limite=3) == [["D0", "D1", "D2"], ["D3", "D4", "D5"], ["D6"]]
+    assert paginas(registro, limite=7) == [[f"D{i}" for i in range(7)]]
+    # Cursor que não é um nome registrado: continua pela ordem
+    assert list(registro.listar(cursor="D3a", limite=2)["dados"]) == ["D4", "D5"]
+
+def test_listar_com_filtros():
+    registro = criar_registro()
+    assert paginas(registro, limite=1, seletor="tipo=LAMPADA", padrao="L[23]") == [["L2"], ["L3"]]
+    pagina = registro.listar(seletor="grupo=sala")
+    assert pagina["dados"]["T1"] == {"tipo": "TOMADA", "tags": [], "grupos": ["sala"]}
+    assert pagina["quantidade"] == 2 and pagina["versao"] == 4
+
+def test_listar_cursor_estavel_com_entradas_e_saidas():
+    registro = RegistroDispositivos()
+    for nome in ("A", "C", "E"):
+        registro.adicionar(nome)
+    pagina = registro.listar(limite=2)
+    assert pagina["cursor"] == "C"
+    registro.adicionar("B")  # antes do cursor: não aparece de novo
+    registro.remover("E")
+    registro.adicionar("D")
+    assert list(registro.listar(cursor=pagina["cursor"], limite=2)["dados"]) == ["D"]
+
+@pytest.mark.parametrize("filtros", [
+    {"limite": 0}, {"limite": "10"}, {"limite": True}, {"padrao": 5}, {"desde": "3"}, {"desde": True},
+    {"seletor": "cor=azul"},
+])
+def test_listar_parametros_invalidos(filtros):
+    with pytest.raises(ValueError):
+        criar_registro().listar(**filtros)
+
+def test_listar_desde_versao():
+    registro = criar_registro()
+    versao = registro.versao
+    registro.remover("L2")
+    registro.adicionar("L4", {"tipo": "LAMPADA", "grupos": ["sala"]})
+    registro.adicionar("T2", {"tipo": "TOMADA"})
+    pagina = registro.listar(desde=versao, limite=2)
+    assert [(m["dispositivo"], m["evento"]) for m in pagina["mudancas"]] == [("L2", SAIU), ("L4", ENTROU)]
+    assert pagina["mais"] and pagina["versao"] == versao + 2
+    pagina = registro.listar(desde=pagina["versao"], limite=2)
+    assert [m["dispositivo"] for m in pagina["mudancas"]] == ["T2"]
+    assert not pagina["mais"] and pagina["versao"] == registro.versao
+    # Filtros valem também para as mudanças (a saída usa os atributos que o dispositivo tinha)
+    pagina = registro.listar(desde=versao, seletor="grupo=quarto")
+    assert [m["dispositivo"] for m in pagina["mudancas"]] == ["L2"]
+    assert registro.listar(desde=registro.versao) == {"mudancas": [], "quantidade": 0, "versao": registro.versao, "mais": False}
+
+def test_listar_desde_fora_do_historico():
+    registro = RegistroDispositivos(historico=3)
+    for i in range(5):
+        registro.adicionar(f"D{i}")
+    assert registro.listar(desde=1) == {"reinicio": True, "versao": 5}
+    assert registro.listar(desde=9) == {"reinicio": True, "versao": 5}
+    assert [m["dispositivo"] for m in registro.listar(desde=2)["mudancas"]] == ["D2", "D3", "D4"]
+
+def test_listar_desde_com_historico_circular():
+    registro = RegistroDispositivos(historico=4)
+    for i in range(11):  # o buffer dá a volta duas vezes
+        registro.adicionar(f"D{i}")
+    pagina = registro.listar(desde=7, limite=2)
+    assert [(m["versao"], m["dispositivo"]) for m in pagina["mudancas"]] == [(8, "D7"), (9, "D8")]
+    pagina = registro.listar(desde=pagina["versao"])
+    assert [(m["versao"], m["dispositivo"]) for m in pagina["mudancas"]] == [(10, "D9"), (11, "D10")]
+    assert registro.listar(desde=6) == {"reinicio": True, "versao": 11}
+
+def test_listar_desde_sem_historico():
+    registro = RegistroDispositivos(historico=0)
+    registro.adicionar("D0")
+    assert registro.listar(desde=0) == {"reinicio": True, "versao": 1}
+    assert registro.listar(desde=1)["mudancas"] == []
@@ -0,0 +1,237 @@
+import asyncio
+
+from logs import RegistroLogs
+from protocolo import CODEC_JSON, REGISTRO
+from servidor_async import ServidorAsync
+
+class ConexaoFalsa:
+    """
+    Guarda os COMANDOs que o servidor envia ao dispositivo.
+    """
+    def __init__(self):
+        self.comandos = []
+
+    async def enviar(self, quadro):
+        self.comandos.append(CODEC_JSON.decodificar(quadro))
+
+def criar_servidor(*nomes):
+    servidor = ServidorAsync(logs=RegistroLogs(console=False))
+    conexao = ConexaoFalsa()
+    for nome in nomes:
+        servidor.registrar(nome, conexao, CODEC_JSON, {"tipo": "LAMPADA"})
+    return servidor, conexao
+
+def responder(servidor, conexao, dados):
+    comando = conexao.comandos[-1]
+    servidor.resolver_resposta(comando["dispositivo"], {"tipo": "RESPOSTA", "dados": dados, "id": comando["id"]})
+
+# --- correlação por id ---
+
+def test_respostas_fora_de_ordem_casam_pelo_id():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        ligar = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR"))
+        desligar = asyncio.create_task(servidor.comandar_dispositivo("L1", "DESLIGAR"))
+        await asyncio.sleep(0)
+        primeiro, segundo = conexao.comandos
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "DESLIGADA", "id": segundo["id"]})
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA", "id": primeiro["id"]})
+        return servidor, conexao, await ligar, await desligar
+
+    servidor, conexao, ligar, desligar = asyncio.run(cenario())
+    assert [c["dados"] for c in conexao.comandos] == ["LIGAR", "DESLIGAR"]
+    assert conexao.comandos[0]["id"] != conexao.comandos[1]["id"]
+    assert (ligar["dados"], desligar["dados"]) == ("LIGADA", "DESLIGADA")
+    assert servidor.em_andamento == 0 and servidor.pendentes["L1"] == {}
+
+def test_resposta_sem_id_vale_para_o_mais_antigo():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        ligar = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR"))
+        desligar = asyncio.create_task(servidor.comandar_dispositivo("L1", "DESLIGAR"))
+        await asyncio.sleep(0)
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA"})
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "DESLIGADA"})
+        return await ligar, await desligar
+
+    ligar, desligar = asyncio.run(cenario())
+    assert (ligar["dados"], desligar["dados"]) == ("LIGADA", "DESLIGADA")
+
+def test_resposta_atrasada_e_descartada():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        resposta = await servidor.comandar_dispositivo("L1", "LIGAR", timeout=0.01)
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA", "id": conexao.comandos[0]["id"]})
+        return servidor, resposta
+
+    servidor, resposta = asyncio.run(cenario())
+    assert resposta["tipo"] == "ERRO"
+    assert servidor.em_andamento == 0 and servidor.pendentes["L1"] == {}
+    assert servidor.estados.obter("L1").estado == "LIGADA"  # o estado vale mesmo atrasado
+
+# --- comando múltiplo ---
+
+def test_comando_multiplo_agrega_sucessos_e_falhas():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1", "L2")
+        tarefa = asyncio.create_task(servidor.despachar(["L1", "L2", "X", "L1"], "LIGAR", timeout=0.05))
+        while len(conexao.comandos) < 2:
+            await asyncio.sleep(0)
+        comando = next(c for c in conexao.comandos if c["dispositivo"] == "L1")
+        servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA", "id": comando["id"]})
+        return conexao, await tarefa
+
+    conexao, resposta = asyncio.run(cenario())
+    assert sorted(c["dispositivo"] for c in conexao.comandos) == ["L1", "L2"]  # nome repetido vai uma vez
+    assert resposta["tipo"] == "RESPOSTA" and resposta["dispositivo"] == ["L1", "L2", "X", "L1"]
+    assert resposta["dados"]["L1"] == {"status": "sucesso", "dados": "LIGADA"}
+    assert resposta["dados"]["L2"]["status"] == resposta["dados"]["X"]["status"] == "erro"
+    assert (resposta["total"], resposta["falhas"]) == (3, 2)
+
+def test_comando_por_padrao_e_por_seletor():
+    async def cenario():
+        servidor, conexao = criar_servidor("SALA_1", "SALA_2", "COZINHA")
+        servidor.registrar("SENSOR", conexao, CODEC_JSON, {"tipo": "SENSOR"})
+        por_padrao = asyncio.create_task(servidor.despachar("SALA_*", "STATUS", timeout=0.01))
+        por_seletor = asyncio.create_task(servidor.despachar("tipo=SENSOR", "STATUS", timeout=0.01))
+        return await por_padrao, await por_seletor
+
+    por_padrao, por_seletor = asyncio.run(cenario())
+    assert sorted(por_padrao["dados"]) == ["SALA_1", "SALA_2"]
+    assert list(por_seletor["dados"]) == ["SENSOR"]
+
+# --- single-flight ---
+
+def test_status_igual_em_voo_vai_uma_vez():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        tarefas = [asyncio.create_task(servidor.comandar_dispositivo("L1", "STATUS")) for _ in range(5)]
+        await asyncio.sleep(0)
+        responder(servidor, conexao, "LIGADA")
+        return servidor, conexao, await asyncio.gather(*tarefas)
+
+    servidor, conexao, respostas = asyncio.run(cenario())
+    assert len(conexao.comandos) == 1
+    assert [r["dados"] for r in respostas] == ["LIGADA"] * 5
+    assert servidor.em_andamento == 0 and servidor.em_voo == {} and servidor.pendentes["L1"] == {}
+
+def test_forcar_nao_se_junta_ao_status_em_voo():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        primeiro = asyncio.create_task(servidor.comandar_dispositivo("L1", "STATUS"))
+        await asyncio.sleep(0)
+        forcado = asyncio.create_task(servidor.comandar_dispositivo("L1", "STATUS", forcar=True))
+        await asyncio.sleep(0)
+        for comando in list(conexao.comandos):
+            servidor.resolver_resposta("L1", {"tipo": "RESPOSTA", "dados": "LIGADA", "id": comando["id"]})
+        await asyncio.gather(primeiro, forcado)
+        return conexao
+
+    assert len(asyncio.run(cenario()).comandos) == 2
+
+def test_quem_se_juntou_recebe_resposta_depois_do_timeout_do_original():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        original = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR", timeout=0.05))
+        await asyncio.sleep(0)
+        paciente = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR", timeout=1))
+        assert (await original)["tipo"] == "ERRO"
+        responder(servidor, conexao, "LIGADA")
+        return servidor, conexao, await paciente
+
+    servidor, conexao, resposta = asyncio.run(cenario())
+    assert resposta["dados"] == "LIGADA"
+    assert len(conexao.comandos) == 1
+    assert servidor.em_andamento == 0 and servidor.em_voo == {}
+
+def test_ligar_colapsado_pelo_cache():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        tarefa = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR"))
+        await asyncio.sleep(0)
+        responder(servidor, conexao, "LIGADA")
+        await tarefa
+        return conexao, await servidor.comandar_dispositivo("L1", "LIGAR")
+
+    conexao, resposta = asyncio.run(cenario())
+    assert resposta["cache"] is True
+    assert len(conexao.comandos) == 1
+
+def test_dispositivo_desconhecido():
+    servidor, _ = criar_servidor()
+    resposta = asyncio.run(servidor.comandar_dispositivo("X", "STATUS"))
+    assert resposta["tipo"] == "ERRO"
+
+# --- codificação binária ---
+
+class ConexaoBinaria:
+    def __init__(self):
+        self.quadros = []
+
+    async def enviar(self, quadro):
+        self.quadros.append(quadro)
+
+def test_comando_sem_codigo_binario_nao_vai_ao_dispositivo():
+    servidor = ServidorAsync(logs=RegistroLogs(console=False))
+    conexao = ConexaoBinaria()
+    servidor.registrar("L1", conexao, servidor.codec_binario, {"tipo": "LAMPADA"})
+    resposta = asyncio.run(servidor.comandar_dispositivo("L1", "PISCAR"))
+    assert resposta["tipo"] == "ERRO" and "L1" in resposta["dados"]
+    assert conexao.quadros == []
+    assert servidor.em_andamento == 0 and servidor.pendentes["L1"] == {}
+
+def test_resposta_sem_codigo_binario_vira_erro_com_o_mesmo_id():
+    servidor = ServidorAsync(logs=RegistroLogs(console=False))
+    conexao = ConexaoBinaria()
+    asyncio.run(servidor.responder(conexao, {"tipo": "RESPOSTA", "dados": {"L1": "LIGADA"}, "id": 7},
+                                   servidor.codec_binario))
+    assert [servidor.codec_binario.decodificar(q) for q in conexao.quadros] == [
+        {"tipo": "ERRO", "dispositivo": None, "dados": "ERRO", "id": 7}]
+    assert len(conexao.quadros[0]) == REGISTRO.size
+
+def test_remover_esquece_o_estado_em_cache():
+    async def cenario():
+        servidor, conexao = criar_servidor("L1")
+        tarefa = asyncio.create_task(servidor.comandar_dispositivo("L1", "LIGAR"))
+        await asyncio.sleep(0)
+        responder(servidor, conexao, "LIGADA")
+        await tarefa
+        servidor.remover("L1")
+        removido = dict(servidor.estados.estados)
+        # De volta: o primeiro STATUS vai ao dispositivo, não ao estado de antes
+        servidor.registrar("L1", conexao, CODEC_JSON, {"tipo": "LAMPADA"})
+        status = asyncio.create_task(servidor.comandar_dispositivo("L1", "STATUS"))
+        await asyncio.sleep(0)
+        responder(servidor, conexao, "DESLIGADA")
+        return removido, conexao, await status
+
+    removido, conexao, status = asyncio.run(cenario())
+    assert removido == {}
+    assert [c["dados"] for c in conexao.comandos] == ["LIGAR", "STATUS"]
+    assert status["dados"] == "DESLIGADA" and "cache" not in status
+
+def test_sessao_expirada_esquece_o_estado_em_cache():
+    servidor, _ = criar_servidor("L1")
+    servidor.estados.atualizar("L1", "LIGADA")
+    servidor.desconectar("L1")  # sessão suspensa: o estado fica para a retomada
+    assert "L1" in servidor.estados.estados
+    servidor.descadastrar("L1")  # o que expirar_sessoes faz quando a retenção acaba
+    assert servidor.estados.estados == {}
+
+# --- sessões ---
+
+def test_suspenso_fica_fora_dos_seletores_e_aparece_desconectado():
+    async def cenario():
+        servidor, _ = criar_servidor("L1", "L2")
+        servidor.desconectar("L1")  # o que tratar_cliente faz ao suspender a sessão
+        por_seletor = await servidor.despachar("tipo=LAMPADA", "STATUS", timeout=0.01)
+        por_lista = await servidor.despachar(["L1"], "STATUS", timeout=0.01)
+        direto = await servidor.despachar("L1", "STATUS")
+        desconhecido = await servidor.despachar("L9", "STATUS")
+        return por_seletor, por_lista, direto, desconhecido
+
+    por_seletor, por_lista, direto, desconhecido = asyncio.run(cenario())
+    assert list(por_seletor["dados"]) == ["L2"]
+    assert por_lista["dados"]["L1"] == {"status": "erro", "dados": "Dispositivo 'L1' desconectado."}
+    assert direto["dados"] == "Dispositivo 'L1' desconectado."
+    assert desconhecido["dados"] == "Dispositivo 'L9' não encontrado."
@@ -0,0 +1,70 @@
+import pytest
+
+from sessoes import SessoesDispositivos
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr("sessoes.time.monotonic", lambda: agora[0])
+    return agora
+
+def test_retomar_com_token_e_nome():
+    sessoes = SessoesDispositivos(retencao=10)
+    sessao = sessoes.criar("L1", ["L1"], False, "c1")
+    assert sessoes.retomar("outro", "L1", "c2") is None
+    assert sessoes.retomar(sessao.token, "L2", "c2") is None
+    assert sessoes.retomar(sessao.token, "L1", "c2") is sessao
+    assert sessao.conexao == "c2"
+
+def test_suspensa_expira_depois_da_retencao(relogio):
+    sessoes = SessoesDispositivos(retencao=10)
+    sessao = sessoes.criar("L1", ["L1"], False, "c1")
+    assert sessoes.suspender(sessao, "c1")
+    assert sessoes.suspensas == 1
+    relogio[0] += 9.9
+    assert sessoes.expiradas() == []
+    relogio[0] += 0.1
+    assert sessoes.expiradas() == [sessao]
+    assert sessoes.suspensas == 0
+    assert sessoes.retomar(sessao.token, "L1", "c2") is None
+    assert sessoes.por_nome == {}
+
+def test_retomada_nao_expira(relogio):
+    sessoes = SessoesDispositivos(retencao=10)
+    sessao = sessoes.criar("L1", ["L1"], False, "c1")
+    sessoes.suspender(sessao, "c1")
+    relogio[0] += 5
+    sessoes.retomar(sessao.token, "L1", "c2")
+    relogio[0] += 10
+    assert sessoes.expiradas() == []
+    assert sessoes.suspensas == 0
+
+def test_suspensa_de_novo_vale_o_prazo_mais_novo(relogio):
+    sessoes = SessoesDispositivos(retencao=10)
+    sessao = sessoes.criar("L1", ["L1"], False, "c1")
+    sessoes.suspender(sessao, "c1")
+    relogio[0] += 5
+    sessoes.retomar(sessao.token, "L1", "c2")
+    sessoes.suspender(sessao, "c2")
+    relogio[0] += 6
+    assert sessoes.expiradas() == []  # a primeira suspensão já não vale
+    relogio[0] += 4
+    assert sessoes.expiradas() == [sessao]
+
+def test_suspender_conexao_antiga_nao_faz_nada():
+    sessoes = SessoesDispositivos(retencao=10)
+    sessao = sessoes.criar("L1", ["L1"], False, "c1")
+    sessoes.retomar(sessao.token, "L1", "c2")
+    assert not sessoes.suspender(sessao, "c1")
+    assert sessoes.suspensas == 0
+
+def test_registro_completo_substitui_sessao_anterior(relogio):
+    sessoes = SessoesDispositivos(retencao=10)
+    gateway = sessoes.criar("GW", ["L1", "L2"], True, "c1")
+    sessoes.suspender(gateway, "c1")
+    nova = sessoes.criar("L1", ["L1"], False, "c2")
+    assert sessoes.suspensas == 0
+    assert sessoes.retomar(gateway.token, "GW", "c3") is None
+    assert sessoes.por_nome == {"L1": nova.token}
+    relogio[0] += 20
+    assert sessoes.expiradas() == []
@@ -0,0 +1,70 @@
+import pytest
+
+from vivacidade import (INTERVALO_PING_MAX, INTERVALO_PING_MIN, INTERVALO_PING_PADRAO, RodaTemporizadores,
+                        Vivacidade)
+
+# --- RodaTemporizadores ---
+
+def criar_roda(tamanho=8):
+    roda = RodaTemporizadores(resolucao=1.0, tamanho=tamanho)
+    roda.tique = 100
+    return roda
+
+def test_roda_vence_no_tique():
+    roda = criar_roda()
+    roda.agendar("a", 2)
+    roda.agendar("b", 3.5)
+    assert roda.avancar(101.5) == []
+    assert roda.avancar(102.0) == ["a"]
+    assert roda.avancar(104.0) == ["b"]
+    assert roda.vencimentos == {}
+
+def test_roda_atraso_minimo_de_um_tique():
+    roda = criar_roda()
+    roda.agendar("a", 0)
+    assert roda.avancar(100.9) == []
+    assert roda.avancar(101.0) == ["a"]
+
+def test_roda_cancelar_e_reagendar():
+    roda = criar_roda()
+    roda.agendar("a", 2)
+    roda.agendar("b", 2)
+    roda.cancelar("b")
+    roda.agendar("a", 5)  # substitui o prazo anterior
+    assert roda.avancar(103.0) == []
+    assert roda.avancar(105.0) == ["a"]
+
+def test_roda_prazo_maior_que_uma_volta():
+    roda = criar_roda(tamanho=8)
+    roda.agendar("a", 20)
+    # A posição é visitada nas voltas anteriores, mas só vence no tique certo
+    assert roda.avancar(119.0) == []
+    assert roda.avancar(120.0) == ["a"]
+
+def test_roda_pausa_longa():
+    roda = criar_roda(tamanho=8)
+    roda.agendar("a", 3)
+    assert roda.avancar(1000.0) == ["a"]
+    assert roda.tique == 1000
+
+# --- Vivacidade ---
+
+@pytest.mark.parametrize("pedido, aceito", [(10, 10), (0, INTERVALO_PING_MIN), (10 ** 6, INTERVALO_PING_MAX),
+                                            (2.5, 2.5), ("5", INTERVALO_PING_PADRAO), (None, INTERVALO_PING_PADRAO),
+                                            ([5], INTERVALO_PING_PADRAO), (True, INTERVALO_PING_PADRAO),
+                                            (float("nan"), INTERVALO_PING_PADRAO)])
+def test_negociar(pedido, aceito):
+    assert Vivacidade.negociar(pedido) == aceito
+
+def test_expira_sem_contato_e_reagenda_com_contato(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr("vivacidade.time.monotonic", lambda: agora[0])
+    vivacidade = Vivacidade(tolerancia=3, roda=RodaTemporizadores(resolucao=1.0, tamanho=64))
+    vivacidade.registrar("a", 1, "A")
+    vivacidade.registrar("b", 1, "B")
+    agora[0] = 1002.0
+    vivacidade.contato("b")
+    assert vivacidade.expirados(1003.0) == [("a", "A")]
+    assert vivacidade.expirados(1004.0) == []
+    assert vivacidade.expirados(1005.0) == [("b", "B")]
+    assert vivacidade.ultimo_contato == {}